@@ -1,11 +1,13 @@
 # main.py
 import json
 from src.data_processing import process_poem as process_data
-from src.nlp_analysis import process_poem as process_nlp
-from src.music_mapping import process_poem as process_music_mapping
-from src.recitation_generation import process_poem as process_recitation
-from src.melody_generation import process_poem as process_melody
-from src.music_synthesis import process_poem as process_synthesis
+from src.recitation_generation import ask_adjust_lyrics
+from src.pipeline import run_pipeline, stage_cache_max_bytes, STAGE_ERRORS
+from src.stage_scheduler import StageCache
+from src.model_residency import configure_model_budget, print_residency_report
+from src.thread_budget import configure_thread_budget
+from src.music_synthesis import configure_output_dir
+from src.poem_index import similar_poems
 
 def load_config():
     """Load configuration from config.json."""
@@ -21,8 +23,15 @@ def load_poetry_data(file_path):
         print(f"[Error] Failed to load {file_path}: {e}")
         return []
 
-def search_poem(poetry_data):
-    """Search for a poem in the dataset."""
+def search_poem(poetry_data, nlp_config=None):
+    """
+    Search for a poem in the dataset.
+
+    Substring matches on title, author and keywords are offered first. Only
+    when there are none, and the similar-poem index has been built (python
+    -m src.poem_index build), are the poems closest in meaning to the query
+    listed instead, keeping those scoring at least poem_index_min_similarity.
+    """
     if not poetry_data:
         print("[Error] No poems available")
         return None
@@ -34,29 +43,48 @@ def search_poem(poetry_data):
         author = poem.get("author", "").lower()
         keywords = [kw.lower() for kw in poem.get("keywords", [])] if "keywords" in poem else []
         if query in title or query in author or any(query in kw for kw in keywords):
-            matches.append((i, poem))
+            matches.append((i, poem, None))
+
+    if not matches and nlp_config and query:
+        try:
+            similar = similar_poems(nlp_config, poetry_data, query=query)
+        except Exception as e:
+            print(f"[Warning] Similar-poem search failed: {e}")
+            similar = []
+        min_similarity = nlp_config.get("poem_index_min_similarity", 0.3)
+        matches = [(index, poem, score) for index, poem, score in similar if score >= min_similarity]
 
     if not matches:
         print(f"[Error] No poems found matching '{query}'")
         return None
-    elif len(matches) == 1:
+    semantic = matches[0][2] is not None
+    if len(matches) == 1 and not semantic:
         return matches[0][1]
+
+    if semantic:
+        print(f"No poems match '{query}'. Poems similar in meaning:")
     else:
         print("Multiple matches found:")
-        for i, (index, poem) in enumerate(matches):
-            print(f"{i+1}. [{index}] {poem['title']} by {poem['author']}")
-        try:
-            match_choice = int(input(f"Select match (1 to {len(matches)}): ")) - 1
-            if 0 <= match_choice < len(matches):
-                return matches[match_choice][1]
-            print("[Error] Invalid selection")
-            return None
-        except ValueError:
-            print("[Error] Selection must be a number")
-            return None
+    for i, (index, poem, score) in enumerate(matches):
+        similarity = f" (similarity {score:.2f})" if semantic else ""
+        print(f"{i+1}. [{index}] {poem['title']} by {poem['author']}{similarity}")
+    try:
+        match_choice = int(input(f"Select match (1 to {len(matches)}): ")) - 1
+        if 0 <= match_choice < len(matches):
+            return matches[match_choice][1]
+        print("[Error] Invalid selection")
+        return None
+    except ValueError:
+        print("[Error] Selection must be a number")
+        return None
 
 def main():
     config = load_config()
+    pipeline_config = config.get("pipeline", {})
+    stage_cache = StageCache(pipeline_config.get("stage_cache_dir"), max_bytes=stage_cache_max_bytes(pipeline_config))
+    configure_model_budget(config.get("pipeline"))
+    configure_thread_budget(config)
+    configure_output_dir(config)
 
     # Display system intro
     print("=== Poetry to Music System ===")
@@ -90,7 +118,7 @@ def main():
         poem = None
         if choice == "1":
             poetry_data = load_poetry_data(config["nlp_analysis"]["input_file"])
-            poem = search_poem(poetry_data)
+            poem = search_poem(poetry_data, config["nlp_analysis"])
         elif choice == "2":
             poem = process_data(config, "manual")
         elif choice == "3":
@@ -113,37 +141,13 @@ def main():
         else:  # If poem is a string or other format
             print(poem)
 
-        # Step 1: NLP Analysis
-        analyzed_poem = process_nlp(config["nlp_analysis"], poem)
-        if not analyzed_poem:
-            print("[Error] NLP analysis failed")
-            return
-
-        # Step 2: Music Mapping
-        mapped_poem = process_music_mapping(config.get("music_mapping", {}), analyzed_poem)
-        if not mapped_poem:
-            print("[Error] Music mapping failed")
-            return
-
-        # Step 3: Recitation Generation
-        recitation_config = config.get("recitation_generation", {})
-        updated_poem, recitation_audio = process_recitation(recitation_config, mapped_poem)
-        if not updated_poem or not recitation_audio:
-            print("[Error] Recitation generation failed")
-            return
-
-        # Step 4: Melody Generation
-        melody_config = config.get("melody_generation", {})
-        final_poem, pm_a, pm_b = process_melody(melody_config, updated_poem, recitation_audio)
-        if not final_poem or not pm_a or not pm_b:
-            print("[Error] Melody generation failed")
-            return
-
-        # Step 5: Music Synthesis
-        synthesis_config = config.get("music_synthesis", {})
-        final_audio_a, final_audio_b = process_synthesis(synthesis_config, final_poem, recitation_audio, pm_a, pm_b)
-        if not final_audio_a or not final_audio_b:
-            print("[Error] Music synthesis failed")
+        # Steps 1-5 run as a stage graph: NLP sub-tasks and recitation run concurrently,
+        # then music mapping, melody generation (Plan A/B) and music synthesis.
+        adjust_lyrics = ask_adjust_lyrics()
+        report = run_pipeline(config, poem, adjust_lyrics, cache=stage_cache)
+        print_residency_report()
+        if report["failed"]:
+            print(f"[Error] {STAGE_ERRORS.get(report['failed'], 'Pipeline stage failed')}")
             return
 
         print("[Success] Pipeline completed successfully!")
@@ -0,0 +1,138 @@
+# src/audio_decoding.py
+import io
+import os
+import subprocess
+import tempfile
+import numpy as np
+from pydub import AudioSegment
+from src.audio_format import DEFAULT_AUDIO_FORMAT, to_canonical
+
+# Optional in-process MP3 decoders, tried in this order
+try:
+    import miniaudio
+except ImportError:
+    miniaudio = None
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+# Clips per ffmpeg process when lines are decoded in groups (block rendering without an in-process decoder)
+FFMPEG_BATCH_CLIPS = 16
+
+def in_process_backend():
+    """Name of the in-process MP3 decoder in use, or None if only ffmpeg is available."""
+    if miniaudio is not None:
+        return "miniaudio"
+    if soundfile is not None and "MP3" in soundfile.available_formats():
+        return "soundfile"
+    return None
+
+def decode_mp3(data):
+    """
+    Decode MP3 bytes in-process.
+
+    Returns:
+        tuple: (int16 samples as a frames x channels array, frame rate), or None
+            if no in-process decoder is installed.
+    """
+    backend = in_process_backend()
+    if backend == "miniaudio":
+        decoded = miniaudio.decode(data, output_format=miniaudio.SampleFormat.SIGNED16)
+        samples = np.frombuffer(decoded.samples, dtype=np.int16).reshape(-1, decoded.nchannels)
+        return samples, decoded.sample_rate
+    if backend == "soundfile":
+        samples, frame_rate = soundfile.read(io.BytesIO(data), dtype="int16", always_2d=True)
+        return samples, frame_rate
+    return None
+
+def decode_mp3_batch_ffmpeg(clips, audio_format=None):
+    """
+    Decode many MP3 clips with a single ffmpeg process.
+
+    Each clip is one input and one raw PCM output of the same ffmpeg command,
+    which also converts to the canonical format.
+
+    Returns:
+        list: int16 (frames x channels) arrays in clip order.
+    """
+    audio_format = audio_format or DEFAULT_AUDIO_FORMAT
+    if audio_format["sample_width"] != 2:
+        raise ValueError("Batched ffmpeg decoding writes 16-bit samples")
+    with tempfile.TemporaryDirectory() as tmp:
+        command = [AudioSegment.converter, "-y", "-loglevel", "error"]
+        for i, clip in enumerate(clips):
+            path = os.path.join(tmp, f"{i}.mp3")
+            with open(path, "wb") as f:
+                f.write(clip)
+            command += ["-i", path]
+        for i in range(len(clips)):
+            command += ["-map", f"{i}:a", "-f", "s16le", "-ar", str(audio_format["frame_rate"]),
+                        "-ac", str(audio_format["channels"]), os.path.join(tmp, f"{i}.raw")]
+        subprocess.run(command, check=True, stdin=subprocess.DEVNULL, capture_output=True)
+        results = []
+        for i in range(len(clips)):
+            raw = np.fromfile(os.path.join(tmp, f"{i}.raw"), dtype=np.int16)
+            results.append(raw.reshape(-1, audio_format["channels"]))
+    return results
+
+def samples_to_segment(samples, frame_rate):
+    """Wrap an int16 (frames x channels) array as an AudioSegment without copying through a file."""
+    return AudioSegment(data=np.ascontiguousarray(samples).tobytes(), frame_rate=frame_rate,
+                        channels=samples.shape[1], sample_width=2)
+
+def decode_clips(clips, audio_format=None):
+    """
+    Decode TTS MP3 clips to canonical AudioSegments, clip by clip.
+
+    Clips are decoded in-process when miniaudio or soundfile is installed.
+    Clips that are left are decoded together in one ffmpeg process and, if
+    that fails, each with pydub's own ffmpeg subprocess. A clip that no
+    decoder can read is reported and returned as None; the other clips are
+    still decoded.
+
+    Args:
+        clips (list): MP3 byte strings.
+        audio_format (dict, optional): Canonical audio format.
+
+    Returns:
+        tuple: (list of AudioSegments, or None for clips that failed, in clip order;
+            names of the decoders used).
+    """
+    audio_format = audio_format or DEFAULT_AUDIO_FORMAT
+    segments = [None] * len(clips)
+    decoders = []
+
+    backend = in_process_backend()
+    if backend:
+        for i, clip in enumerate(clips):
+            try:
+                samples, frame_rate = decode_mp3(clip)
+                segments[i] = to_canonical(samples_to_segment(samples, frame_rate), audio_format)
+            except Exception as e:
+                print(f"[Warning] {backend} failed to decode clip {i+1}, trying ffmpeg: {e}")
+        if any(segment is not None for segment in segments):
+            decoders.append(backend)
+
+    pending = [i for i, segment in enumerate(segments) if segment is None]
+    if len(pending) > 1:
+        try:
+            decoded = decode_mp3_batch_ffmpeg([clips[i] for i in pending], audio_format)
+            for i, samples in zip(pending, decoded):
+                segments[i] = to_canonical(samples_to_segment(samples, audio_format["frame_rate"]), audio_format)
+            decoders.append("ffmpeg (batched)")
+            pending = []
+        except Exception as e:
+            print(f"[Warning] Batched ffmpeg decoding failed, decoding clips one by one: {e}")
+
+    decoded_one_by_one = False
+    for i in pending:
+        try:
+            segments[i] = to_canonical(AudioSegment.from_file(io.BytesIO(clips[i]), format="mp3"), audio_format)
+            decoded_one_by_one = True
+        except Exception as e:
+            print(f"[Warning] Failed to decode clip {i+1}: {e}")
+    if decoded_one_by_one:
+        decoders.append("ffmpeg")
+    return segments, " + ".join(decoders) or None
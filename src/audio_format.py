@@ -0,0 +1,79 @@
+# src/audio_format.py
+from math import gcd
+import numpy as np
+from scipy.signal import resample_poly
+from pydub import AudioSegment
+
+# FluidSynth's native output, so rendered melodies normally need no conversion
+DEFAULT_AUDIO_FORMAT = {"frame_rate": 44100, "channels": 2, "sample_width": 2}
+
+# Sample width in bytes -> numpy type of pydub's signed raw data
+_SAMPLE_TYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+def get_audio_format(config):
+    """
+    Return the canonical audio format from the top-level "audio_format" config section.
+
+    Returns:
+        dict: "frame_rate", "channels" and "sample_width" (bytes per sample: 1, 2 or 4).
+    """
+    audio_format = dict(DEFAULT_AUDIO_FORMAT, **(config or {}).get("audio_format", {}))
+    if audio_format["sample_width"] not in _SAMPLE_TYPES:
+        raise ValueError(f"Unsupported sample width: {audio_format['sample_width']}")
+    return audio_format
+
+def format_of(segment):
+    """Return an AudioSegment's format as an audio_format dict."""
+    return {"frame_rate": segment.frame_rate, "channels": segment.channels, "sample_width": segment.sample_width}
+
+def to_canonical(segment, audio_format=None):
+    """
+    Convert an AudioSegment to the canonical format in one step.
+
+    Rate changes use a polyphase (anti-aliased) resampler over all channels
+    at once; channel changes average to mono and then duplicate. A segment
+    already in the canonical format is returned unchanged.
+
+    Args:
+        segment (AudioSegment): Input audio in any format.
+        audio_format (dict, optional): Target format; defaults to DEFAULT_AUDIO_FORMAT.
+
+    Returns:
+        AudioSegment: Audio in the canonical format.
+    """
+    audio_format = audio_format or DEFAULT_AUDIO_FORMAT
+    if format_of(segment) == audio_format:
+        return segment
+    frame_rate, channels, sample_width = audio_format["frame_rate"], audio_format["channels"], audio_format["sample_width"]
+
+    source_type = _SAMPLE_TYPES[segment.sample_width]
+    samples = np.frombuffer(segment.raw_data, dtype=source_type).reshape(-1, segment.channels)
+    samples = samples.astype(np.float64) / -np.iinfo(source_type).min
+
+    if segment.frame_rate != frame_rate and len(samples):
+        divisor = gcd(segment.frame_rate, frame_rate)
+        samples = resample_poly(samples, frame_rate // divisor, segment.frame_rate // divisor, axis=0)
+    if samples.shape[1] != channels:
+        samples = np.repeat(samples.mean(axis=1, keepdims=True), channels, axis=1)
+
+    target_type = _SAMPLE_TYPES[sample_width]
+    limits = np.iinfo(target_type)
+    data = np.clip(np.round(samples * -limits.min), limits.min, limits.max).astype(target_type)
+    return AudioSegment(data=data.tobytes(), frame_rate=frame_rate, channels=channels, sample_width=sample_width)
+
+def silence(duration_ms, audio_format=None):
+    """Return silence of the given length directly in the canonical format."""
+    audio_format = audio_format or DEFAULT_AUDIO_FORMAT
+    frames = int(round(duration_ms * audio_format["frame_rate"] / 1000.0))
+    return AudioSegment(
+        data=bytes(frames * audio_format["channels"] * audio_format["sample_width"]),
+        frame_rate=audio_format["frame_rate"],
+        channels=audio_format["channels"],
+        sample_width=audio_format["sample_width"]
+    )
+
+def require_same_format(*segments):
+    """Raise ValueError unless all segments share one format (nothing is converted implicitly)."""
+    formats = [format_of(s) for s in segments]
+    if any(f != formats[0] for f in formats[1:]):
+        raise ValueError(f"Audio formats differ: {formats}; convert inputs with to_canonical first")
@@ -0,0 +1,159 @@
+# src/bulk_ingest.py
+import os
+import json
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from src.data_processing import parse_poem_file, parse_poem_data, poem_content_hash
+
+POEM_EXTENSIONS = (".json", ".txt")
+
+def scan_poem_files(paths):
+    """
+    Collect poem files from a list of files and directories (recursively).
+
+    Returns:
+        list: Sorted file paths with a .json or .txt extension.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in names if n.endswith(POEM_EXTENSIONS))
+        elif path.endswith(POEM_EXTENSIONS):
+            files.append(path)
+    return sorted(files)
+
+def _reason_category(reason):
+    """Collapse per-file error messages into a countable reject reason."""
+    return "Unreadable file" if reason.startswith("Failed to process file") else reason
+
+def parse_file_for_ingest(file_path):
+    """
+    Parse one file in a worker process.
+
+    A .json file may hold a single poem or a list of poems (like the corpus itself).
+
+    Returns:
+        tuple: (file path, list of poems, list of reject reasons).
+    """
+    if file_path.endswith(".json"):
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            return file_path, [], [f"Failed to process file {file_path}: {e}"]
+        records = data if isinstance(data, list) else [data]
+        poems, rejects = [], []
+        for record in records:
+            # One bad record is rejected on its own instead of failing the whole run
+            try:
+                poem, reason = parse_poem_data(record)
+            except Exception:
+                poem, reason = None, "Invalid record"
+            if poem:
+                poems.append(poem)
+            else:
+                rejects.append(reason)
+        return file_path, poems, rejects
+
+    poem, reason = parse_poem_file(file_path)
+    return file_path, [poem] if poem else [], [reason] if reason else []
+
+def load_corpus(corpus_path):
+    """Load the corpus list, or an empty list if the file does not exist yet."""
+    if not os.path.exists(corpus_path):
+        return []
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_json_atomic(path, data, indent=None):
+    """Write JSON to a temporary file and atomically replace the target."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+def ingest(paths, corpus_path, workers=None, chunksize=16):
+    """
+    Parse and clean poem files across a process pool and append new poems to the corpus.
+
+    Poems are deduplicated by content hash against the existing corpus and
+    against each other, and appended in the standard
+    {title, author, lines, linecount} shape.
+
+    Args:
+        paths (list): Files and/or directories to scan.
+        corpus_path (str): Corpus JSON file to append to.
+        workers (int, optional): Process pool size (defaults to the CPU count).
+        chunksize (int): Files handed to a worker at a time.
+
+    Returns:
+        dict: Ingestion statistics.
+    """
+    start = time.perf_counter()
+    files = scan_poem_files(paths)
+    corpus = load_corpus(corpus_path)
+    seen = {poem_content_hash(p) for p in corpus}
+
+    added, duplicates, parsed = 0, 0, 0
+    rejects = Counter()
+    reject_samples = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for file_path, poems, reasons in executor.map(parse_file_for_ingest, files, chunksize=chunksize):
+            parsed += len(poems)
+            for reason in reasons:
+                rejects[_reason_category(reason)] += 1
+                if len(reject_samples) < 10:
+                    reject_samples.append(f"{file_path}: {reason}")
+            for poem in poems:
+                digest = poem_content_hash(poem)
+                if digest in seen:
+                    duplicates += 1
+                    continue
+                seen.add(digest)
+                corpus.append(poem)
+                added += 1
+
+    if added:
+        write_json_atomic(corpus_path, corpus, indent=2)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "files": len(files),
+        "poems_parsed": parsed,
+        "poems_added": added,
+        "duplicates": duplicates,
+        "rejects": dict(rejects),
+        "reject_samples": reject_samples,
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(len(files) / elapsed, 1) if elapsed > 0 else 0.0,
+        "corpus_size": len(corpus)
+    }
+
+    print("\n=== Bulk Ingestion Results ===")
+    print(f"Files Scanned: {stats['files']} ({stats['files_per_second']} files/sec)")
+    print(f"Poems Parsed: {parsed}")
+    print(f"Poems Added: {added}")
+    print(f"Duplicates Skipped: {duplicates}")
+    for reason, count in rejects.most_common():
+        print(f"Rejected ({reason}): {count}")
+    for sample in reject_samples:
+        print(f"  {sample}")
+    print(f"Corpus Size: {stats['corpus_size']} ({corpus_path})")
+    print("==============================\n")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-ingest poem files into the corpus.")
+    parser.add_argument("paths", nargs="+", help="Poem files or directories to scan")
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("--corpus", help="Corpus file (defaults to nlp_analysis.input_file)")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    ingest(args.paths, args.corpus or config["nlp_analysis"]["input_file"], workers=args.workers)
@@ -0,0 +1,282 @@
+# src/corpus_run.py
+import os
+import json
+import argparse
+import threading
+from datetime import datetime
+from collections import Counter
+from src.data_processing import poem_content_hash
+from src.bulk_ingest import load_corpus, write_json_atomic
+from src.poem_record import PoemRecord, thaw, write_records
+from src.pipeline import run_pipeline, stage_cache_max_bytes, STAGE_ERRORS
+from src.stage_scheduler import StageCache
+from src.model_residency import configure_model_budget
+from src.thread_budget import configure_thread_budget
+from src.music_synthesis import configure_output_dir
+
+# Stage outputs that are files on disk
+ARTIFACT_OUTPUTS = ("recitation_wav", "final_path_a", "final_path_b")
+
+# Characters of the poem ID used in artifact names
+ARTIFACT_TAG_LENGTH = 16
+
+def _json_default(value):
+    """Serialize numpy scalars (model scores) in journal records."""
+    return value.item() if hasattr(value, "item") else str(value)
+
+class RunJournal:
+    """
+    Append-only JSONL record of a corpus run.
+
+    Each record is one line written with a single O_APPEND write and fsynced,
+    so a crash leaves at most a torn last line; replay skips it and the next
+    append starts on a fresh line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+            if torn:
+                self._write(b"\n")
+
+    def _write(self, data):
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def append(self, event, poem_id, **fields):
+        """Append one record: event is "start", "stage" or "poem"."""
+        record = dict(event=event, poem_id=poem_id, time=datetime.now().isoformat(timespec="seconds"), **fields)
+        self._write((json.dumps(record, ensure_ascii=False, default=_json_default) + "\n").encode("utf-8"))
+
+    def replay(self):
+        """
+        Rebuild the state of every poem from the journal.
+
+        A poem whose last attempt has a "start" record but no "poem" record
+        was interrupted and is reported as "incomplete".
+
+        Returns:
+            dict: {poem_id: {"title", "index", "status", "stages", "artifacts",
+                "failed_stage", "error", "poem"}}, where "poem" is the analysed
+                and mapped poem (a PoemRecord) of the last completed attempt.
+        """
+        poems = {}
+        if not os.path.exists(self.path):
+            return poems
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn write from a crash
+                state = poems.setdefault(record["poem_id"], {
+                    "title": record.get("title"), "index": None, "status": "pending", "stages": {},
+                    "artifacts": {}, "failed_stage": None, "error": None, "poem": None
+                })
+                if record["event"] == "start":
+                    state.update(status="incomplete", failed_stage=None, error=None, index=record.get("index"))
+                elif record["event"] == "stage":
+                    state["stages"][record["stage"]] = {"seconds": record["seconds"], "cached": record["cached"]}
+                    state["artifacts"].update(record.get("artifacts", {}))
+                elif record["event"] == "poem":
+                    state.update(status=record["status"], failed_stage=record.get("failed_stage"),
+                                 error=record.get("error"))
+                    if record.get("poem"):
+                        state["poem"] = PoemRecord.from_dict(record["poem"])
+        return poems
+
+# Stages whose cached outputs are dropped once a poem completes (the recitation audio)
+PRUNED_STAGES = ("recitation",)
+
+class _PoemCache:
+    """
+    View of a StageCache for one poem that records the keys it used.
+
+    With refresh_stage, it misses for that stage, so the stage is
+    recomputed and its new outputs stored.
+    """
+
+    def __init__(self, cache, refresh_stage=None):
+        self.cache = cache
+        self.prefix = f"{refresh_stage}-" if refresh_stage else None
+        self.keys = set()
+
+    def get(self, key):
+        self.keys.add(key)
+        return None if self.prefix and key.startswith(self.prefix) else self.cache.get(key)
+
+    def put(self, key, outputs):
+        self.keys.add(key)
+        self.cache.put(key, outputs)
+
+    def prune(self, stages):
+        """Drop the entries of the given stages used by this poem."""
+        for key in self.keys:
+            if key.split("-", 1)[0] in stages:
+                self.cache.discard(key)
+
+def is_complete(state):
+    """Whether a poem's last attempt finished every stage and its artifacts still exist."""
+    if not state or state["status"] != "done":
+        return False
+    return all(os.path.exists(path) for path in state["artifacts"].values())
+
+def write_manifests(run_dir, states):
+    """
+    Write the NLP, music-params and render manifests of a run from its journal state.
+
+    Poems are listed in corpus order. nlp.json holds the analysed poems (as
+    nlp_analysis writes them), music_params.json the mapped parameters and
+    renders.json the status and artifact paths of every poem.
+    """
+    ordered = sorted(states.items(), key=lambda item: (item[1]["index"] is None, item[1]["index"], item[0]))
+    nlp, music_params, renders = [], [], {}
+    for poem_id, state in ordered:
+        poem = state["poem"]
+        if poem:
+            nlp.append(dict(poem.to_dict(exclude=("music_params",)), poem_id=poem_id))
+            music_params.append({"poem_id": poem_id, "title": poem.get("title"), "author": poem.get("author"),
+                                 "music_params": thaw(poem.get("music_params"))})
+        renders[poem_id] = {"title": state["title"], "index": state["index"], "status": state["status"],
+                            "failed_stage": state["failed_stage"], "artifacts": state["artifacts"]}
+    write_records(os.path.join(run_dir, "nlp.json"), nlp)
+    write_json_atomic(os.path.join(run_dir, "music_params.json"), music_params, indent=2)
+    write_json_atomic(os.path.join(run_dir, "renders.json"), renders, indent=2)
+
+def run_corpus(config, poems, run_dir, adjust_lyrics=False, rerun_stage=None, only=None, indices=None):
+    """
+    Run the pipeline over a corpus, resuming from the journal in run_dir.
+
+    Poems are identified by their content hash, and their artifacts are named
+    by title and poem ID (not a timestamp), so names never collide and a
+    retried poem replaces its own files. Poems whose last attempt
+    completed (with all artifacts present) are skipped; failed and
+    interrupted poems are run again. Stage outputs are cached in run_dir, so
+    a retried poem reuses the NLP, mapping and recitation stages that
+    already finished instead of running the models again. Once a poem
+    completes, its cached recitation audio is dropped (PRUNED_STAGES), so
+    the cache keeps audio only for poems that may be retried. A poem whose
+    content repeats an earlier corpus entry (same poem ID) is run once; the
+    repeats are skipped and counted as duplicates.
+
+    Args:
+        config (dict): Full configuration dictionary.
+        poems (list): Corpus poems.
+        run_dir (str): Directory holding the journal, stage cache and summary of this run.
+        adjust_lyrics (bool): Whether to adjust the lyrics before recitation.
+        rerun_stage (str, optional): Stage to recompute (ignoring its cached outputs), even for completed poems.
+        only (set, optional): Poem IDs or titles to restrict the run to.
+        indices (list, optional): Corpus position of each poem (defaults to its position in poems).
+
+    Returns:
+        dict: Counts of skipped, duplicate, completed and failed poems and failures by stage.
+    """
+    if rerun_stage and rerun_stage not in STAGE_ERRORS:
+        raise ValueError(f"Unknown stage '{rerun_stage}'; choose from {sorted(STAGE_ERRORS)}")
+    journal = RunJournal(os.path.join(run_dir, "journal.jsonl"))
+    state = journal.replay()
+    # Poems run one at a time: only the current poem's stage outputs (recitation audio included) stay in memory
+    cache = StageCache(os.path.join(run_dir, "stage_cache"), max_entries=len(STAGE_ERRORS),
+                       max_bytes=stage_cache_max_bytes(config.get("pipeline", {})))
+
+    counts = Counter()
+    failures = Counter()
+    seen = set()
+    for position, poem in enumerate(poems):
+        poem_id = poem_content_hash(poem)
+        title = poem.get("title", "untitled")
+        if only and poem_id not in only and title not in only:
+            continue
+        # Repeats share the poem ID and so the artifact names; running them again would overwrite the first
+        if poem_id in seen:
+            counts["duplicates"] += 1
+            print(f"[Warning] Skipping '{title}': same content as an earlier poem ({poem_id[:ARTIFACT_TAG_LENGTH]})")
+            continue
+        seen.add(poem_id)
+        if not rerun_stage and is_complete(state.get(poem_id)):
+            counts["skipped"] += 1
+            continue
+
+        index = indices[position] if indices else position
+        journal.append("start", poem_id, title=title, index=index, rerun_stage=rerun_stage)
+
+        def on_stage_done(name, outputs, timing, poem_id=poem_id):
+            artifacts = {k: os.path.abspath(outputs[k]) for k in ARTIFACT_OUTPUTS if outputs.get(k)}
+            journal.append("stage", poem_id, stage=name, seconds=round(timing["duration"], 3),
+                           cached=timing["skipped"], artifacts=artifacts)
+
+        poem_cache = _PoemCache(cache, rerun_stage)
+        try:
+            report = run_pipeline(config, poem, adjust_lyrics, cache=poem_cache, on_stage_done=on_stage_done,
+                                  run_tag=poem_id[:ARTIFACT_TAG_LENGTH])
+            failed_stage, error, final_poem = report["failed"], report["error"], report["poem"]
+        except Exception as e:
+            failed_stage, error, final_poem = "pipeline", e, None
+        journal.append("poem", poem_id, title=title, status="failed" if failed_stage else "done",
+                       failed_stage=failed_stage, error=str(error) if error else None,
+                       poem=None if failed_stage else final_poem.to_dict())
+        if failed_stage:
+            counts["failed"] += 1
+            failures[failed_stage] += 1
+        else:
+            counts["completed"] += 1
+            poem_cache.prune(PRUNED_STAGES)
+
+    states = journal.replay()
+    write_manifests(run_dir, states)
+    summary = {
+        "run_dir": run_dir,
+        "skipped": counts["skipped"],
+        "duplicates": counts["duplicates"],
+        "completed": counts["completed"],
+        "failed": counts["failed"],
+        "failures_by_stage": dict(failures),
+        "poems": {poem_id: {k: v for k, v in state.items() if k != "poem"} for poem_id, state in states.items()}
+    }
+    write_json_atomic(os.path.join(run_dir, "summary.json"), summary, indent=2)
+    print_run_summary(summary)
+    return summary
+
+def print_run_summary(summary):
+    """Print the outcome of a corpus run."""
+    states = Counter(p["status"] for p in summary["poems"].values())
+    print("\n=== Corpus Run Results ===")
+    print(f"Run Directory: {summary['run_dir']}")
+    print(f"Skipped (already complete): {summary['skipped']}")
+    print(f"Skipped (duplicate content): {summary['duplicates']}")
+    print(f"Completed: {summary['completed']}")
+    print(f"Failed: {summary['failed']}")
+    for stage, count in summary["failures_by_stage"].items():
+        print(f"  {stage}: {count}")
+    print(f"Journal: {dict(states)}")
+    print("==========================\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pipeline over the corpus, resuming an earlier run.")
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("--run-id", default="corpus", help="Name of the run to start or resume")
+    parser.add_argument("--limit", type=int, help="Only the first N poems of the corpus")
+    parser.add_argument("--adjust-lyrics", action="store_true")
+    parser.add_argument("--rerun-stage", choices=sorted(STAGE_ERRORS), help="Recompute this stage")
+    parser.add_argument("--poems", nargs="+", help="Poem IDs or titles to restrict the run to")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    configure_model_budget(config.get("pipeline"))
+    configure_thread_budget(config)
+    configure_output_dir(config)
+    corpus = load_corpus(config["nlp_analysis"]["input_file"])[:args.limit]
+    run_dir = os.path.join(config.get("pipeline", {}).get("runs_dir", "output/runs"), args.run_id)
+    run_corpus(config, corpus, run_dir, adjust_lyrics=args.adjust_lyrics,
+               rerun_stage=args.rerun_stage, only=set(args.poems) if args.poems else None)
@@ -1,12 +1,38 @@
 # src/data_processing.py
 import json
 import re
+import hashlib
+
+# Whitespace runs become one space; anything but alphanumerics, spaces and basic punctuation is dropped
+_CLEAN_RE = re.compile(r"(\s+)|[^\w\s'.,!?]")
+
+def _clean_match(match):
+    return " " if match.group(1) else ""
 
 def clean_text(text):
-    """Clean text by removing extra spaces and special characters."""
-    text = re.sub(r'\s+', ' ', text.strip())  # Normalize spaces
-    text = re.sub(r'[^\w\s\'.,!?]', '', text)  # Keep alphanumeric, spaces, and basic punctuation
-    return text
+    """Clean text by removing extra spaces and special characters (one regex pass)."""
+    return _CLEAN_RE.sub(_clean_match, text.strip())
+
+def clean_lines(raw_lines):
+    """Clean each line once and drop lines that end up empty."""
+    return [line for line in map(clean_text, raw_lines) if line]
+
+def poem_content_hash(poem):
+    """Return a stable hash of a poem's title, author and lines, used as its ID."""
+    payload = json.dumps(
+        [poem.get("title", ""), poem.get("author", ""), poem.get("lines", [])],
+        ensure_ascii=False
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def build_poem(title, author, lines):
+    """Return a standardized poem dictionary."""
+    return {
+        "title": title,
+        "author": author,
+        "lines": lines,
+        "linecount": str(len(lines))
+    }
 
 def process_manual_input():
     """Process manually entered poem by user."""
@@ -32,55 +58,66 @@ def process_manual_input():
         print("[Error] No valid lines entered")
         return None
 
-    return {
-        "title": title,
-        "author": author,
-        "lines": lines,
-        "linecount": str(len(lines))
-    }
+    return build_poem(title, author, lines)
 
-def process_uploaded_file(file_path):
-    """Process an uploaded poem file (JSON or text)."""
+def parse_poem_data(data):
+    """
+    Standardize one poem dictionary loaded from JSON.
+
+    Returns:
+        tuple: (poem dictionary, None) or (None, reject reason).
+    """
+    if not isinstance(data, dict) or not all(key in data for key in ["title", "author", "lines"]):
+        return None, "Invalid JSON format"
+    if not isinstance(data["lines"], list):
+        return None, "Invalid JSON format"
+    if not isinstance(data["title"], str) or not isinstance(data["author"], str):
+        return None, "Invalid JSON format"
+    lines = clean_lines(line for line in data["lines"] if isinstance(line, str))
+    if not lines:
+        return None, "No valid lines found"
+    title = clean_text(data.get("title", "Untitled"))
+    author = clean_text(data.get("author", "Unknown"))
+    return build_poem(title, author, lines), None
+
+def parse_poem_file(file_path):
+    """
+    Parse a poem file (JSON or text) without printing.
+
+    Returns:
+        tuple: (poem dictionary, None) or (None, reject reason).
+    """
     try:
         # Check file extension
         if file_path.endswith('.json'):
             with open(file_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-            # Validate JSON format
-            if not isinstance(data, dict) or not all(key in data for key in ["title", "author", "lines"]):
-                print("[Error] Invalid JSON format")
-                return None
-            title = clean_text(data.get("title", "Untitled"))
-            author = clean_text(data.get("author", "Unknown"))
-            lines = [clean_text(line) for line in data.get("lines", []) if clean_text(line)]
+            return parse_poem_data(data)
         elif file_path.endswith('.txt'):
             with open(file_path, 'r', encoding='utf-8') as f:
                 lines_raw = f.readlines()
             # Assume first line is title, second is author, rest are poem lines
             if len(lines_raw) < 3:
-                print("[Error] Text file too short")
-                return None
+                return None, "Text file too short"
             title = clean_text(lines_raw[0].strip() or "Untitled")
             author = clean_text(lines_raw[1].strip() or "Unknown")
-            lines = [clean_text(line) for line in lines_raw[2:] if clean_text(line)]
+            lines = clean_lines(lines_raw[2:])
         else:
-            print("[Error] Unsupported file format")
-            return None
+            return None, "Unsupported file format"
 
         # Validation
         if not lines:
-            print("[Error] No valid lines found")
-            return None
-
-        return {
-            "title": title,
-            "author": author,
-            "lines": lines,
-            "linecount": str(len(lines))
-        }
+            return None, "No valid lines found"
+        return build_poem(title, author, lines), None
     except Exception as e:
-        print(f"[Error] Failed to process file {file_path}: {e}")
-        return None
+        return None, f"Failed to process file {file_path}: {e}"
+
+def process_uploaded_file(file_path):
+    """Process an uploaded poem file (JSON or text)."""
+    poem, reason = parse_poem_file(file_path)
+    if reason:
+        print(f"[Error] {reason}")
+    return poem
 
 def process_poem(config, poem_source, uploaded_file=None):
     """
@@ -0,0 +1,279 @@
+# src/framework_workers.py
+import os
+import json
+import atexit
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+# Stages served by each worker: "torch" runs the transformers/KeyBERT models,
+# "tensorflow" runs MusicVAE (Plan B) and renders its melody.
+WORKER_KINDS = ("torch", "tensorflow")
+
+# Configuration sections each worker reads; a worker is restarted when one of them changes
+WORKER_SECTIONS = {
+    "torch": ("nlp_analysis", "pipeline"),
+    "tensorflow": ("melody_generation", "music_synthesis", "audio_format", "pipeline")
+}
+
+# Seconds a call waits for its reply before the worker is restarted
+DEFAULT_TIMEOUT_SECONDS = 600
+
+# Shared-memory blocks of the reply a worker is sending; they stay open until
+# the parent has copied them (on Windows a block disappears with its last handle)
+_UNSENT_BLOCKS = []
+
+def share_audio(audio):
+    """
+    Copy an AudioSegment's samples into a new shared-memory block.
+
+    The creating worker owns the block: it keeps it open until the parent
+    acknowledges the reply, then closes and unlinks it (see
+    _release_unsent_blocks). The parent only attaches and copies.
+
+    Returns:
+        dict: Descriptor with the block name and the sample format.
+    """
+    data = audio.raw_data
+    block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    block.buf[:len(data)] = data
+    _UNSENT_BLOCKS.append(block)
+    return {
+        "shared_memory": block.name,
+        "size": len(data),
+        "frame_rate": audio.frame_rate,
+        "channels": audio.channels,
+        "sample_width": audio.sample_width
+    }
+
+def receive_audio(descriptor):
+    """Rebuild an AudioSegment from a shared-memory descriptor (the block stays with its creator)."""
+    from pydub import AudioSegment
+
+    block = shared_memory.SharedMemory(name=descriptor["shared_memory"])
+    try:
+        return AudioSegment(
+            data=bytes(block.buf[:descriptor["size"]]),
+            frame_rate=descriptor["frame_rate"],
+            channels=descriptor["channels"],
+            sample_width=descriptor["sample_width"]
+        )
+    finally:
+        block.close()
+
+def _receive_shared(result):
+    """Replace the shared-memory descriptors among a reply's values with their audio."""
+    if not isinstance(result, dict):
+        return result
+    return {key: receive_audio(value) if isinstance(value, dict) and "shared_memory" in value else value
+            for key, value in result.items()}
+
+def _release_unsent_blocks():
+    """Close and unlink the blocks of the last reply."""
+    while _UNSENT_BLOCKS:
+        block = _UNSENT_BLOCKS.pop()
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+def _emotion(config, text):
+    from src import nlp_analysis
+    nlp_config = config["nlp_analysis"]
+    return nlp_analysis.classify_emotion(text, nlp_config["emotion_model"], nlp_config["device"])
+
+def _keywords(config, text):
+    from src import nlp_analysis
+    nlp_config = config["nlp_analysis"]
+    theme_options = nlp_analysis.get_theme_options(nlp_config)
+    with nlp_analysis.keyword_model(theme_options["model_name"]) as kw_model:
+        return nlp_analysis.extract_keywords_and_theme(
+            text, kw_model, nlp_config["keyword_top_n"], nlp_config["theme_categories"], theme_options
+        )
+
+def _plan_b(config, poem, recitation_length, title=None, timestamp=None):
+    """Generate Plan B and, given a title and timestamp, render its melody to shared memory."""
+    from src import melody_generation, music_synthesis
+    from src.audio_format import get_audio_format
+    from src.thread_budget import make_fluidsynth
+
+    pm = melody_generation.generate_plan_b(config.get("melody_generation", {}), poem, recitation_length)
+    if title is None:
+        return {"pm": pm, "melody_audio": None}
+
+    synthesis_config = config.get("music_synthesis", {})
+    os.makedirs(music_synthesis.OUTPUT_DIR, exist_ok=True)
+    temp_midi_file = music_synthesis.artifact_path(title, timestamp, "temp", "planb", ext="mid")
+    melody_wav_file = music_synthesis.artifact_path(title, timestamp, "melody", "planb")
+    audio_format = get_audio_format(config)
+    melody_audio = music_synthesis.midi_to_wav(
+        pm, temp_midi_file, melody_wav_file,
+        synthesis_config.get("soundfont_path"), synthesis_config.get("ffmpeg_bin_path"),
+        fs=make_fluidsynth(os.path.abspath(synthesis_config.get("soundfont_path")), audio_format["frame_rate"], "plan_b"),
+        audio_format=audio_format
+    )
+    if os.path.exists(temp_midi_file):
+        os.remove(temp_midi_file)
+    return {"pm": pm, "melody_audio": share_audio(melody_audio)}
+
+HANDLERS = {
+    "torch": {"emotion": _emotion, "keywords": _keywords},
+    "tensorflow": {"plan_b": _plan_b}
+}
+
+def _worker_main(kind, config, conn):
+    """
+    Serve requests for one framework until the pipe is closed or None is received.
+
+    The framework's thread pools are sized from pipeline.thread_budget before
+    anything is imported, then per request with the overrides of the stage
+    of the same name (requests are served one at a time, so they never race).
+    """
+    from src.thread_budget import configure_thread_budget, apply_framework_threads
+    configure_thread_budget(config, framework=kind, stage_overrides=True)
+    apply_framework_threads(kind)
+    from src.model_residency import configure_model_budget
+    from src.music_synthesis import configure_output_dir
+    configure_model_budget(config.get("pipeline"))
+    configure_output_dir(config)
+
+    handlers = HANDLERS[kind]
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        op, kwargs = request
+        try:
+            apply_framework_threads(kind, op)
+            reply = ("ok", handlers[op](config, **kwargs), bool(_UNSENT_BLOCKS))
+        except Exception as e:
+            _release_unsent_blocks()
+            reply = ("error", f"{type(e).__name__}: {e}", False)
+        try:
+            conn.send(reply)
+            if reply[2]:
+                conn.recv()  # The parent has copied the shared audio
+        except EOFError:
+            break
+        finally:
+            _release_unsent_blocks()
+    conn.close()
+
+class FrameworkWorker:
+    """
+    A long-lived process that owns one ML framework.
+
+    Requests are sent over a pipe one at a time; the worker is (re)started on
+    the first call after it exits. A call that gets no reply within
+    pipeline.framework_workers.timeout_seconds terminates the worker, so the
+    next call starts a fresh one.
+    """
+
+    def __init__(self, kind, config):
+        self.kind = kind
+        self.config = config
+        self.key = _worker_key(kind, config)
+        self.timeout = config.get("pipeline", {}).get("framework_workers", {}).get(
+            "timeout_seconds", DEFAULT_TIMEOUT_SECONDS)
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        context = mp.get_context("spawn")  # A clean interpreter: no framework inherited from the parent
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_worker_main, args=(self.kind, self.config, child_conn),
+            name=f"{self.kind}-worker", daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        print(f"Started {self.kind} worker (pid {self._process.pid})")
+
+    def call(self, op, **kwargs):
+        """
+        Run op in the worker and return its result, with shared audio already copied.
+
+        Worker errors, a worker that exits and a reply that times out raise RuntimeError.
+        """
+        with self._lock:
+            if self._process is None or not self._process.is_alive():
+                self._start()
+            try:
+                self._conn.send((op, kwargs))
+                if not self._conn.poll(self.timeout):
+                    self._terminate()
+                    raise RuntimeError(f"{self.kind} worker gave no reply to {op} within {self.timeout}s; restarting it")
+                status, result, shared = self._conn.recv()
+                if shared:
+                    try:
+                        result = _receive_shared(result)
+                    except Exception as e:
+                        status, result = "error", f"could not copy the shared audio: {type(e).__name__}: {e}"
+                    self._conn.send("ack")
+            except (EOFError, OSError) as e:
+                self._terminate()
+                raise RuntimeError(f"{self.kind} worker exited: {e}")
+        if status == "error":
+            raise RuntimeError(f"{self.kind} worker failed on {op}: {result}")
+        return result
+
+    def _terminate(self):
+        """Kill an unresponsive or broken worker; the next call starts a new one."""
+        if self._process is not None and self._process.is_alive():
+            self._process.terminate()
+            self._process.join(timeout=10)
+        if self._conn is not None:
+            self._conn.close()
+        self._process = None
+
+    def stop(self):
+        with self._lock:
+            if self._process is not None and self._process.is_alive():
+                self._conn.send(None)
+                self._process.join(timeout=10)
+                if self._process.is_alive():
+                    self._process.terminate()
+            self._process = None
+
+# Workers are shared by every run in the process with the same configuration
+_WORKERS = {}
+
+def _worker_key(kind, config):
+    """The configuration sections a worker of this kind reads, as canonical JSON."""
+    return json.dumps({section: config.get(section) for section in WORKER_SECTIONS[kind]},
+                      sort_keys=True, default=str)
+
+def get_framework_workers(config):
+    """
+    Return the torch and TensorFlow workers, or None if they are disabled.
+
+    Enabled by pipeline.framework_workers.enabled; thread counts come from
+    pipeline.thread_budget (see src/thread_budget.py). A worker runs with
+    the configuration it was started with, so it is replaced when a section
+    it reads (WORKER_SECTIONS) differs from that of the running worker.
+    """
+    options = config.get("pipeline", {}).get("framework_workers", {})
+    if not options.get("enabled"):
+        return None
+    for kind in WORKER_KINDS:
+        key = _worker_key(kind, config)
+        worker = _WORKERS.get(kind)
+        if worker is not None and worker.key != key:
+            worker.stop()
+            worker = None
+        if worker is None:
+            _WORKERS[kind] = FrameworkWorker(kind, config)
+    return _WORKERS
+
+def shutdown_framework_workers():
+    """Stop all worker processes."""
+    for worker in _WORKERS.values():
+        worker.stop()
+    _WORKERS.clear()
+
+atexit.register(shutdown_framework_workers)
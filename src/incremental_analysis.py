@@ -0,0 +1,218 @@
+# src/incremental_analysis.py
+import json
+import time
+import hashlib
+import argparse
+from collections import Counter
+from src.data_processing import poem_content_hash
+from src.bulk_ingest import load_corpus
+from src.poem_record import PoemRecord, load_records, write_records, shared_value
+from src import nlp_analysis
+from src.sentiment_batch import SCORER_VERSION
+from src.music_mapping import get_mapping_tables, map_music_params, mapping_key
+
+# Derived fields of each analysis, in the order they are recomputed
+ANALYSIS_GROUPS = {
+    "sentiment": ("sentiment",),
+    "emotion": ("emotion",),
+    "keywords": ("keywords",),
+    "theme": ("theme", "theme_confidence"),
+    "rhyme": ("rhyme_pattern",)
+}
+
+def _fingerprint(settings):
+    """Short, stable hash of the settings an analysis depends on."""
+    payload = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+def analysis_versions(config):
+    """
+    Version of every analysis and of the music mapping under a configuration.
+
+    A version is a hash of the models and settings the derived fields depend
+    on, so a record is stale exactly when one of them changes. With
+    theme_source "keywords" the theme also depends on the keyword version.
+
+    Args:
+        config (dict): Full configuration dictionary.
+
+    Returns:
+        dict: {group: version} for ANALYSIS_GROUPS and "mapping".
+    """
+    nlp_config = config["nlp_analysis"]
+    theme_options = nlp_analysis.get_theme_options(nlp_config)
+    keywords = _fingerprint({"keyword_model": theme_options["model_name"],
+                             "keyword_top_n": nlp_config["keyword_top_n"]})
+    theme = dict(theme_options, theme_categories=nlp_config["theme_categories"])
+    if theme_options["source"] == "keywords":
+        theme["keywords"] = keywords
+    return {
+        "sentiment": _fingerprint({"sentiment_threshold": nlp_config["sentiment_threshold"],
+                                    "scorer": SCORER_VERSION}),
+        "emotion": _fingerprint({"emotion_model": nlp_config["emotion_model"]}),
+        "keywords": keywords,
+        "theme": _fingerprint(theme),
+        "rhyme": _fingerprint({"rhyme": "pronouncing"}),
+        "mapping": _fingerprint({"overrides": config.get("music_mapping", {}).get("overrides", {})})
+    }
+
+def _index_records(records):
+    """Derived records by poem ID (recomputed for files written before IDs were stored)."""
+    return {record.get("poem_id") or poem_content_hash(record): record for record in records}
+
+def _is_current(record, group, fields, versions):
+    return (record is not None and record.get("analysis_versions", {}).get(group) == versions[group]
+            and all(field in record for field in fields))
+
+def reanalyze_corpus(config, corpus=None, nlp_file=None, music_file=None, dry_run=False):
+    """
+    Bring the NLP and music-params files up to date with the corpus, redoing only stale work.
+
+    Every derived record carries its poem ID (the content hash) and the
+    version of each analysis that produced it. An analysis is rerun for a
+    poem only when the poem is new or edited (its ID is not in the derived
+    file) or the analysis version changed, e.g. a new emotion_model reruns
+    emotion for every poem and new theme_categories rerun theme classification,
+    but nothing else. Music params are remapped only for poems with a
+    recomputed analysis or a changed mapping. Both files are then rewritten
+    in corpus order, dropping poems that left the corpus.
+
+    Args:
+        config (dict): Full configuration dictionary.
+        corpus (list, optional): Corpus poems (defaults to nlp_analysis.input_file).
+        nlp_file (str, optional): Defaults to nlp_analysis.output_file.
+        music_file (str, optional): Defaults to music_mapping.output_file.
+        dry_run (bool): Only report what would be recomputed.
+
+    Returns:
+        dict: Counts of new, edited, removed and unchanged poems and of recomputed and reused work.
+    """
+    start = time.perf_counter()
+    nlp_config = config["nlp_analysis"]
+    mapping_config = config.get("music_mapping", {})
+    corpus = load_corpus(nlp_config["input_file"]) if corpus is None else corpus
+    nlp_file = nlp_file or nlp_config["output_file"]
+    music_file = music_file or mapping_config["output_file"]
+    previous_nlp = _index_records(load_records(nlp_file))
+    # Only the mapping of the previous music-params records is needed
+    previous_music = {poem_id: (record.get("music_params"), record.get("analysis_versions", {}).get("mapping"))
+                      for poem_id, record in _index_records(load_records(music_file)).items()}
+    versions = analysis_versions(config)
+
+    records, stale, seen = [], {group: [] for group in ANALYSIS_GROUPS}, set()
+    for poem in corpus:
+        poem_id = poem_content_hash(poem)
+        if poem_id in seen:
+            continue
+        seen.add(poem_id)
+        previous = previous_nlp.get(poem_id)
+        record = previous or PoemRecord.from_dict(poem)
+        record["poem_id"] = poem_id
+        for group, fields in ANALYSIS_GROUPS.items():
+            if not _is_current(previous, group, fields, versions):
+                stale[group].append(record)
+        record["analysis_versions"] = {group: versions[group] for group in ANALYSIS_GROUPS}
+        records.append(record)
+
+    # Edited poems have a new ID; they are told apart from new ones by title and author
+    removed = [record for poem_id, record in previous_nlp.items() if poem_id not in seen]
+    removed_names = Counter((record.get("title"), record.get("author")) for record in removed)
+    new_records = [record for record in records if record["poem_id"] not in previous_nlp]
+    edited = 0
+    for record in new_records:
+        name = (record.get("title"), record.get("author"))
+        if removed_names[name]:
+            removed_names[name] -= 1
+            edited += 1
+
+    recomputed = {id(record) for group in stale.values() for record in group}
+    to_map = [record for record in records
+              if id(record) in recomputed
+              or previous_music.get(record["poem_id"], (None, None))[1] != versions["mapping"]
+              or previous_music[record["poem_id"]][0] is None]
+
+    if not dry_run:
+        if stale["sentiment"]:
+            nlp_analysis.analyze_corpus_sentiment(nlp_config, stale["sentiment"])
+        for record in stale["emotion"]:
+            record["emotion"] = nlp_analysis.classify_emotion(
+                " ".join(record["lines"]), nlp_config["emotion_model"], nlp_config["device"]
+            )
+        if stale["keywords"] or stale["theme"]:
+            theme_options = nlp_analysis.get_theme_options(nlp_config)
+            with nlp_analysis.keyword_model(theme_options["model_name"]) as kw_model:
+                if stale["keywords"]:
+                    nlp_analysis.extract_corpus_keywords(nlp_config, stale["keywords"], kw_model)
+                if stale["theme"]:
+                    nlp_analysis.classify_corpus_themes(nlp_config, stale["theme"], kw_model)
+        for record in stale["rhyme"]:
+            record["rhyme_pattern"] = nlp_analysis.detect_rhyme_scheme(record["lines"])
+
+        tables = get_mapping_tables(mapping_config)
+        remap = {id(record) for record in to_map}
+        combos = {}
+        for record in records:
+            if id(record) in remap:
+                key = mapping_key(record, tables)
+                if key not in combos:
+                    combos[key] = shared_value(map_music_params(record, tables))
+                record["music_params"] = combos[key]
+            else:
+                record["music_params"] = previous_music[record["poem_id"]][0]
+
+        def nlp_record(poem):
+            poem.pop("music_params", None)
+            return poem
+
+        def music_record(poem):
+            poem["analysis_versions"]["mapping"] = versions["mapping"]
+            return poem
+
+        # Records are written one at a time (with and without music params), never held as dicts
+        order = [record["poem_id"] for record in records]
+        if recomputed or order != list(previous_nlp):
+            write_records(nlp_file, records, transform=nlp_record)
+        if to_map or order != list(previous_music):
+            write_records(music_file, records, transform=music_record)
+
+    total = len(records)
+    work_units = total * (len(ANALYSIS_GROUPS) + 1)
+    work_done = sum(len(group) for group in stale.values()) + len(to_map)
+    stats = {
+        "poems": total,
+        "new": len(new_records) - edited,
+        "edited": edited,
+        "removed": len(removed) - edited,
+        "unchanged": total - len(new_records),
+        "recomputed": {group: len(stale[group]) for group in ANALYSIS_GROUPS},
+        "remapped": len(to_map),
+        "work_skipped": round(1 - work_done / work_units, 4) if work_units else 1.0,
+        "seconds": round(time.perf_counter() - start, 3),
+        "dry_run": dry_run,
+        "versions": versions
+    }
+    print_reanalysis_report(stats, nlp_file, music_file)
+    return stats
+
+def print_reanalysis_report(stats, nlp_file, music_file):
+    """Print what an incremental re-analysis recomputed and skipped."""
+    print("\n=== Incremental Analysis Results ===" + (" (dry run)" if stats["dry_run"] else ""))
+    print(f"Poems: {stats['poems']} ({stats['unchanged']} unchanged, {stats['new']} new, "
+          f"{stats['edited']} edited, {stats['removed']} removed)")
+    for group, count in stats["recomputed"].items():
+        print(f"{group.capitalize()}: {count} recomputed, {stats['poems'] - count} reused")
+    print(f"Music Params: {stats['remapped']} remapped, {stats['poems'] - stats['remapped']} reused")
+    print(f"Work Skipped: {stats['work_skipped'] * 100:.1f}%")
+    print(f"Time: {stats['seconds']:.2f} seconds")
+    print(f"Output: {nlp_file}, {music_file}")
+    print("====================================\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-analyse only new, edited or stale poems of the corpus.")
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be recomputed")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    reanalyze_corpus(config, dry_run=args.dry_run)
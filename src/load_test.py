@@ -0,0 +1,370 @@
+# src/load_test.py
+import io
+import os
+import copy
+import json
+import time
+import random
+import argparse
+import threading
+import contextlib
+import contextvars
+from datetime import datetime
+from collections import defaultdict, Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pydub import AudioSegment
+from src import nlp_analysis
+from src import music_mapping
+from src import recitation_generation
+from src import melody_generation
+from src import music_synthesis
+from src.audio_format import get_audio_format, silence
+from src.model_residency import process_rss_bytes
+from src.thread_budget import configure_thread_budget
+from src.pipeline import run_pipeline
+
+# Stage order of the "stages" entry point (the five process_poem steps)
+STAGES = ["nlp_analysis", "music_mapping", "recitation_generation", "melody_generation", "music_synthesis"]
+
+# Request id of the poem being processed; a context variable, so stage threads see it too
+_REQUEST = contextvars.ContextVar("load_test_request", default=None)
+
+class LocalBackends:
+    """
+    Local stand-ins for the network backends (gTTS and OpenAI).
+
+    Recitation returns noise of a plausible length (about 65 ms per character
+    plus the line pauses) after a simulated request latency per line, both
+    for whole recitations and for the lines block rendering appends to a
+    file (synthesize_line, synthesize_lines); OpenAI lyric adjustment returns the lines
+    unchanged after one simulated request.
+    """
+
+    def __init__(self, tts_latency=0.2, openai_latency=1.0, seed=0):
+        self.tts_latency = tts_latency
+        self.openai_latency = openai_latency
+        self.seed = seed
+        self._originals = {}
+
+    def synthesize_line(self, line, audio_format=None, rng=None):
+        rng = rng or np.random.default_rng(self.seed)
+        time.sleep(self.tts_latency)
+        speech = silence(65 * len(line), audio_format)
+        if speech.sample_width == 2:
+            noise = rng.integers(-3000, 3000, size=len(speech.raw_data) // 2, dtype=np.int16)
+            speech = AudioSegment(data=noise.tobytes(), frame_rate=speech.frame_rate,
+                                  channels=speech.channels, sample_width=2)
+        return speech
+
+    def synthesize_lines(self, lines, audio_format=None):
+        rng = np.random.default_rng(self.seed)
+        return [self.synthesize_line(line, audio_format, rng) for line in lines]
+
+    def generate_recitation(self, lines, audio_format=None, pauses=None):
+        rng = np.random.default_rng(self.seed)
+        segments = []
+        for i, line in enumerate(lines):
+            if not line.strip():
+                continue
+            speech = self.synthesize_line(line, audio_format, rng)
+            segments.extend([speech, silence(pauses[i] if pauses else 500, audio_format)])
+        return sum(segments) if segments else None
+
+    def adjust_lyrics(self, lines, api_key, model="gpt-3.5-turbo"):
+        time.sleep(self.openai_latency)
+        return list(lines)
+
+    def __enter__(self):
+        self._originals = {
+            "generate_recitation": recitation_generation.generate_recitation,
+            "synthesize_line": recitation_generation.synthesize_line,
+            "synthesize_lines": recitation_generation.synthesize_lines,
+            "adjust_lyrics": recitation_generation.adjust_lyrics
+        }
+        for name in self._originals:
+            setattr(recitation_generation, name, getattr(self, name))
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self._originals.items():
+            setattr(recitation_generation, name, original)
+
+class CollisionDetector:
+    """Record which request claimed each artifact path; a path claimed by two requests is a collision."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.claims = defaultdict(set)
+
+    def __call__(self, path):
+        request_id = _REQUEST.get()
+        if request_id is not None:
+            with self._lock:
+                self.claims[path].add(request_id)
+
+    def collisions(self):
+        return {path: sorted(ids) for path, ids in self.claims.items() if len(ids) > 1}
+
+    def __enter__(self):
+        music_synthesis.ARTIFACT_OBSERVERS.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        music_synthesis.ARTIFACT_OBSERVERS.remove(self)
+
+class ResourceSampler(threading.Thread):
+    """Sample RSS and thread count in the background; CPU time comes from getrusage (or psutil)."""
+
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_threads = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak_rss = max(self.peak_rss, process_rss_bytes() or 0)
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def _cpu_seconds():
+    """CPU seconds of this process and of its finished subprocesses (FluidSynth / ffmpeg), or None each."""
+    try:
+        import resource  # Unix only
+    except ImportError:
+        resource = None
+    if resource is not None:
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+    try:
+        import psutil
+        times = psutil.Process().cpu_times()
+        return times.user + times.system, times.children_user + times.children_system
+    except ImportError:
+        return None, None
+
+def _elapsed(before, after):
+    return round(after - before, 2) if before is not None and after is not None else None
+
+def run_stages(config, poem, adjust_lyrics):
+    """
+    Run one poem through the five stage process_poem functions in order.
+
+    Returns:
+        tuple: (per-stage seconds, failed stage name or None).
+    """
+    timings = {}
+
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    poem = timed("nlp_analysis", nlp_analysis.process_poem, config["nlp_analysis"], dict(poem))
+    if not poem:
+        return timings, "nlp_analysis"
+    poem = timed("music_mapping", music_mapping.process_poem, config["music_mapping"], poem)
+    if not poem:
+        return timings, "music_mapping"
+    poem, recitation_audio = timed("recitation_generation", recitation_generation.process_poem,
+                                   config["recitation_generation"], poem, adjust_lyrics, get_audio_format(config))
+    if not poem:
+        return timings, "recitation_generation"
+    poem, pm_a, pm_b = timed("melody_generation", melody_generation.process_poem,
+                             config["melody_generation"], poem, recitation_audio)
+    if not poem:
+        return timings, "melody_generation"
+    audio_a, audio_b = timed("music_synthesis", music_synthesis.process_poem,
+                             config["music_synthesis"], poem, recitation_audio, pm_a, pm_b)
+    if audio_a is None:
+        return timings, "music_synthesis"
+    return timings, None
+
+def run_graph(config, poem, adjust_lyrics):
+    """Run one poem through the stage graph; returns (per-stage seconds, failed stage or None)."""
+    report = run_pipeline(config, poem, adjust_lyrics)
+    timings = {name: t["duration"] for name, t in report["timings"].items() if not t["skipped"]}
+    return timings, report["failed"]
+
+def percentiles(values):
+    """Return p50/p95/p99 (and the count) of a list of seconds."""
+    if not values:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3)}
+
+def run_load_test(config, poems, requests=20, concurrency=4, arrival_rate=None, entry="pipeline",
+                  adjust_lyrics=False, tts_latency=0.2, openai_latency=1.0, seed=0, quiet=True):
+    """
+    Drive many poems through the pipeline at once and measure it.
+
+    Requests arrive as a Poisson process at arrival_rate per second (open
+    loop), or all at once when arrival_rate is None (closed loop, limited by
+    concurrency). gTTS and OpenAI are replaced by LocalBackends. The stage
+    cache is disabled so every request does the full work. Framework worker
+    processes are refused: the stand-ins and the output collision check only
+    cover this process.
+
+    Args:
+        config (dict): Full configuration dictionary.
+        poems (list): Poems to draw requests from (cycled).
+        requests (int): Number of requests.
+        concurrency (int): Requests processed at the same time.
+        arrival_rate (float, optional): Requests per second.
+        entry (str): "pipeline" (stage graph) or "stages" (the five process_poem functions).
+        adjust_lyrics (bool): Adjust the lyrics (syllable normalizer, or the OpenAI stand-in if configured).
+        tts_latency (float): Simulated gTTS latency per line in seconds.
+        openai_latency (float): Simulated OpenAI latency in seconds.
+        seed (int): Seed for arrival times.
+        quiet (bool): Suppress the pipeline's own console output.
+
+    Returns:
+        dict: Load-test report.
+    """
+    if config.get("pipeline", {}).get("framework_workers", {}).get("enabled"):
+        raise ValueError("The load test cannot run with pipeline.framework_workers enabled: "
+                         "worker processes bypass the local backends and the collision check")
+    config = copy.deepcopy(config)
+    config.setdefault("pipeline", {})["stage_cache_dir"] = None
+    config["recitation_generation"].setdefault("openai_api_key", "local")
+    run_one = run_graph if entry == "pipeline" else run_stages
+    rng = random.Random(seed)
+    arrivals, t = [], 0.0
+    for _ in range(requests):
+        arrivals.append(t)
+        if arrival_rate:
+            t += rng.expovariate(arrival_rate)
+
+    results = []
+    results_lock = threading.Lock()
+    start = time.perf_counter()
+
+    def handle(request_id, arrival):
+        token = _REQUEST.set(request_id)
+        poem = poems[request_id % len(poems)]
+        begin = time.perf_counter()
+        try:
+            timings, failed = run_one(config, poem, adjust_lyrics)
+            error = None
+        except Exception as e:
+            timings, failed, error = {}, "exception", f"{type(e).__name__}: {e}"
+        finally:
+            _REQUEST.reset(token)
+        end = time.perf_counter()
+        with results_lock:
+            results.append({
+                "request": request_id,
+                "title": poem.get("title", "untitled"),
+                "queue_seconds": begin - start - arrival,
+                "latency_seconds": end - start - arrival,
+                "stages": timings,
+                "failed": failed,
+                "error": error
+            })
+
+    cpu_before = _cpu_seconds()
+    sampler = ResourceSampler()
+    sampler.start()
+    with LocalBackends(tts_latency, openai_latency), CollisionDetector() as detector, \
+            contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for request_id, arrival in enumerate(arrivals):
+                delay = arrival - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(handle, request_id, arrival)
+    wall = time.perf_counter() - start
+    sampler.stop()
+    cpu_after = _cpu_seconds()
+
+    stage_times = defaultdict(list)
+    for result in results:
+        for stage, seconds in result["stages"].items():
+            stage_times[stage].append(seconds)
+    failures = Counter(r["failed"] for r in results if r["failed"])
+    succeeded = sum(1 for r in results if not r["failed"])
+    collisions = detector.collisions()
+    return {
+        "entry": entry,
+        "requests": requests,
+        "concurrency": concurrency,
+        "arrival_rate": arrival_rate,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(succeeded / wall, 3) if wall > 0 else 0.0,
+        "error_rate": round(1 - succeeded / len(results), 3) if results else 0.0,
+        "failures_by_stage": dict(failures),
+        "error_samples": [r["error"] for r in results if r["error"]][:5],
+        "latency": percentiles([r["latency_seconds"] for r in results]),
+        "queue": percentiles([r["queue_seconds"] for r in results]),
+        "stages": {stage: percentiles(times) for stage, times in stage_times.items()},
+        "resources": {
+            "cpu_seconds": _elapsed(cpu_before[0], cpu_after[0]),
+            "child_cpu_seconds": _elapsed(cpu_before[1], cpu_after[1]),
+            "peak_rss_mb": round(sampler.peak_rss / 2**20, 1) if sampler.peak_rss else None,
+            "peak_threads": sampler.peak_threads
+        },
+        "output_collisions": collisions
+    }
+
+def print_load_report(report):
+    """Print a load-test report."""
+    print("\n=== Load Test Report ===")
+    print(f"Entry Point: {report['entry']}, {report['requests']} requests, concurrency {report['concurrency']}, "
+          f"arrival rate {report['arrival_rate'] or 'closed loop'}")
+    print(f"Wall Time: {report['wall_seconds']:.2f}s")
+    print(f"Throughput: {report['throughput_per_second']:.3f} poems/sec")
+    print(f"Error Rate: {report['error_rate']:.1%} {report['failures_by_stage'] or ''}")
+    for sample in report["error_samples"]:
+        print(f"  {sample}")
+    for name in ("latency", "queue"):
+        stats = report[name]
+        if stats["count"]:
+            print(f"{name.capitalize()}: p50 {stats['p50']}s, p95 {stats['p95']}s, p99 {stats['p99']}s")
+    for stage, stats in report["stages"].items():
+        print(f"  {stage}: p50 {stats['p50']}s, p95 {stats['p95']}s, p99 {stats['p99']}s (n={stats['count']})")
+    resources = report["resources"]
+    print(f"CPU: {resources['cpu_seconds']}s (subprocesses {resources['child_cpu_seconds']}s), "
+          f"Peak RSS: {resources['peak_rss_mb']} MB, Peak Threads: {resources['peak_threads']}")
+    print(f"Output Collisions: {len(report['output_collisions'])}")
+    for path, ids in list(report["output_collisions"].items())[:10]:
+        print(f"  {path} <- requests {ids}")
+    print("========================\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the pipeline with concurrent poems.")
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, help="Arrival rate in requests/sec (default: all at once)")
+    parser.add_argument("--entry", choices=["pipeline", "stages"], default="pipeline")
+    parser.add_argument("--poems", type=int, default=10, help="Distinct corpus poems to cycle through")
+    parser.add_argument("--adjust-lyrics", action="store_true")
+    parser.add_argument("--tts-latency", type=float, default=0.2)
+    parser.add_argument("--openai-latency", type=float, default=1.0)
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    configure_thread_budget(config)
+    with open(config["nlp_analysis"]["input_file"], "r", encoding="utf-8") as f:
+        poems = json.load(f)[:args.poems]
+    report = run_load_test(
+        config, poems, requests=args.requests, concurrency=args.concurrency, arrival_rate=args.rate,
+        entry=args.entry, adjust_lyrics=args.adjust_lyrics, tts_latency=args.tts_latency,
+        openai_latency=args.openai_latency, quiet=not args.verbose
+    )
+    print_load_report(report)
+    os.makedirs("output", exist_ok=True)
+    report_path = os.path.join("output", f"load_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved: {report_path}")
@@ -1,13 +1,13 @@
 # src/melody_generation.py
 import os
+import glob
 import random
 import pretty_midi
 from datetime import datetime
-import note_seq
-from magenta.models.music_vae import configs
-from magenta.models.music_vae.trained_model import TrainedModel
-from note_seq.protobuf import music_pb2
 import re
+from src.phrase_bank import load_phrase_bank, assemble_melody
+from src.model_residency import get_model_manager
+from src.thread_budget import apply_framework_threads
 
 def sanitize_filename(filename):
     """
@@ -53,31 +53,78 @@ def build_scale(base_note, mode='minor', octaves=3):
                 notes.append(note)
     return sorted(list(set(notes)))
 
-def generate_complex_melody(base_note, mode='minor', num_notes=64):
+def generate_complex_melody(base_note, mode='minor', num_notes=64, rng=None):
     """Generate a melody based on the scale and number of notes."""
+    rng = rng or random
     scale = build_scale(base_note, mode=mode, octaves=3)
     current_index = len(scale) // 2  # Start from the middle of the scale
     melody = []
     for _ in range(num_notes):
         melody.append(scale[current_index])
-        step = random.choices([-2, -1, 0, 1, 2], weights=[1, 3, 4, 3, 1])[0]
+        step = rng.choices([-2, -1, 0, 1, 2], weights=[1, 3, 4, 3, 1])[0]
         current_index += step
         current_index = max(0, min(current_index, len(scale) - 1))
     return melody
 
 # --- Plan B: Your previous logic using MusicVAE ---
-def generate_melody_musicvae(config, poem, recitation_length, tempo):
-    """Generate melody using MusicVAE for Plan B."""
-    music_params = poem["music_params"]
-    
-    # Initialize MusicVAE model
+def load_musicvae_model(config, batch_size=1):
+    """Load the cat-mel_2bar_big MusicVAE model from the configured checkpoint."""
+    # Imported here so that Plan B served from the phrase bank never loads TensorFlow
+    apply_framework_threads("tensorflow", "plan_b")
+    from magenta.models.music_vae import configs
+    from magenta.models.music_vae.trained_model import TrainedModel
+
     checkpoint_path = config.get("musicvae_checkpoint_path")
     if not checkpoint_path:
         raise ValueError("MusicVAE checkpoint path not provided in config")
-    
+
     vae_config = configs.CONFIG_MAP['cat-mel_2bar_big']
-    model = TrainedModel(vae_config, batch_size=1, checkpoint_dir_or_path=checkpoint_path)
+    model = TrainedModel(vae_config, batch_size=batch_size, checkpoint_dir_or_path=checkpoint_path)
     print("MusicVAE model loaded successfully!")
+    return model
+
+def _close_musicvae_session(model):
+    """Release the TensorFlow session of an evicted MusicVAE model."""
+    session = getattr(model, "_sess", None)
+    if session is not None:
+        session.close()
+
+# Size assumed for MusicVAE when neither the config nor the checkpoint files give one
+DEFAULT_MUSICVAE_BYTES = 512 * 2**20
+
+def musicvae_estimate_bytes(config):
+    """
+    Memory to count for MusicVAE in the residency budget.
+
+    Used when the RSS growth during loading cannot be measured (no psutil and
+    no /proc, e.g. on Windows): melody_generation.musicvae_memory_mb if set,
+    else twice the size of the checkpoint's files (weights plus the graph),
+    else DEFAULT_MUSICVAE_BYTES.
+    """
+    if config.get("musicvae_memory_mb"):
+        return int(config["musicvae_memory_mb"] * 2**20)
+    checkpoint_path = config.get("musicvae_checkpoint_path")
+    files = glob.glob(f"{glob.escape(checkpoint_path)}*") if checkpoint_path else []
+    checkpoint_bytes = sum(os.path.getsize(f) for f in files if os.path.isfile(f))
+    return 2 * checkpoint_bytes or DEFAULT_MUSICVAE_BYTES
+
+def musicvae_model(config):
+    """Acquire the MusicVAE model through the model residency manager."""
+    return get_model_manager().acquire(
+        f"musicvae:{config.get('musicvae_checkpoint_path')}",
+        lambda: load_musicvae_model(config),
+        unloader=_close_musicvae_session,
+        estimate_bytes=musicvae_estimate_bytes(config)
+    )
+
+def generate_melody_musicvae(config, poem, recitation_length, tempo, model=None):
+    """Generate melody using MusicVAE for Plan B."""
+    # Use the resident MusicVAE model, loading it if it was evicted
+    if model is None:
+        with musicvae_model(config) as model:
+            return generate_melody_musicvae(config, poem, recitation_length, tempo, model=model)
+
+    music_params = poem["music_params"]
 
     # Calculate number of 2-bar segments based on recitation length
     # Each 2-bar segment at 120 BPM (default for cat-mel_2bar_big) is 4 seconds
@@ -119,7 +166,7 @@ def generate_melody_musicvae(config, poem, recitation_length, tempo):
 # --- Shared Functions ---
 def add_chords(pm, chord_progression, total_duration):
     """Add chords to the PrettyMIDI object based on the chord progression."""
-    chord_instrument = pretty_midi.Instrument(program=0)  # Piano for chords
+    chord_instrument = pretty_midi.Instrument(program=0, name="chords")  # Piano for chords
     chord_idx = 0
     current_time = 0.0
     chord_duration = total_duration / len(chord_progression)  # Distribute chords evenly
@@ -137,31 +184,48 @@ def add_chords(pm, chord_progression, total_duration):
         chord_idx += 1
     pm.instruments.append(chord_instrument)
 
+def split_tracks(pm, instruments):
+    """
+    Split the melody track evenly across instruments, keeping the chord track.
+
+    The melody's notes are divided into consecutive segments, one per
+    instrument name (named tracks with that instrument's program). Without
+    a chord track (a single-track pm), or when the melody is already split
+    across these instruments (e.g. by save_melody), the tracks are returned
+    unchanged.
+
+    Returns:
+        list: New instrument tracks (melody segments, then the chord track).
+    """
+    if len(pm.instruments) <= 1:  # If chords are added, the last instrument is for chords
+        return list(pm.instruments)
+    if len(pm.instruments) == len(instruments) + 1 and [t.name for t in pm.instruments[:-1]] == list(instruments):
+        return list(pm.instruments)
+    num_segments = len(instruments)
+    melody_instrument = pm.instruments[0]
+    total_notes = len(melody_instrument.notes)
+    segment_length = total_notes // num_segments
+    new_instruments = []
+    for i, instrument_name in enumerate(instruments):
+        try:
+            program = pretty_midi.instrument_name_to_program(instrument_name)
+        except ValueError:
+            program = 0  # Default to Acoustic Grand Piano
+        new_instrument = pretty_midi.Instrument(program=program, name=instrument_name)
+        start_idx = i * segment_length
+        end_idx = start_idx + segment_length if i < num_segments - 1 else total_notes
+        for note in melody_instrument.notes[start_idx:end_idx]:
+            new_instrument.notes.append(note)
+        new_instruments.append(new_instrument)
+    return new_instruments + pm.instruments[1:]  # Keep chord instrument
+
 def save_melody(pm, instruments, output_midi_file):
     """Save PrettyMIDI object to MIDI file."""
     # Ensure path is absolute
     output_midi_file = os.path.abspath(output_midi_file)
     
     # Assign instruments to melody tracks
-    num_segments = len(instruments)
-    if len(pm.instruments) > 1:  # If chords are added, the last instrument is for chords
-        melody_instrument = pm.instruments[0]
-        total_notes = len(melody_instrument.notes)
-        segment_length = total_notes // num_segments
-        new_instruments = []
-        for i, instrument_name in enumerate(instruments):
-            try:
-                program = pretty_midi.instrument_name_to_program(instrument_name)
-            except ValueError:
-                program = 0  # Default to Acoustic Grand Piano
-            new_instrument = pretty_midi.Instrument(program=program)
-            start_idx = i * segment_length
-            end_idx = start_idx + segment_length if i < num_segments - 1 else total_notes
-            for note in melody_instrument.notes[start_idx:end_idx]:
-                new_instrument.notes.append(note)
-            new_instruments.append(new_instrument)
-        # Replace melody instrument with segmented instruments
-        pm.instruments = new_instruments + pm.instruments[1:]  # Keep chord instrument
+    pm.instruments = split_tracks(pm, instruments)
     
     # Save MIDI file
     pm.write(output_midi_file)
@@ -169,6 +233,92 @@ def save_melody(pm, instruments, output_midi_file):
     
     return pm
 
+def generate_plan_a(music_params, recitation_length, rng=None):
+    """
+    Generate the Plan A melody (scale random walk) with chords.
+
+    Args:
+        music_params (dict): Music parameters from music mapping.
+        recitation_length (float): Recitation length in seconds.
+        rng (random.Random, optional): Random generator, e.g. seeded for reproducible variants.
+
+    Returns:
+        PrettyMIDI: Plan A melody and chord tracks.
+    """
+    tempo = music_params["tempo"]
+
+    # Calculate number of notes based on recitation length and tempo
+    num_notes = int(recitation_length * (tempo / 60))
+    num_notes = max(16, num_notes)  # Ensure minimum notes
+    note_duration = recitation_length / num_notes  # Duration per note in seconds
+
+    melody_a = generate_complex_melody(
+        base_note=music_params["base_note"],
+        mode=music_params["mode"],
+        num_notes=num_notes,
+        rng=rng
+    )
+
+    # Create PrettyMIDI object for Plan A
+    pm_a = pretty_midi.PrettyMIDI()
+    instrument_a = pretty_midi.Instrument(program=0)  # Temporary instrument
+    current_time = 0.0
+    for note in melody_a:
+        pm_note = pretty_midi.Note(
+            velocity=100,
+            pitch=note,
+            start=current_time,
+            end=current_time + note_duration
+        )
+        instrument_a.notes.append(pm_note)
+        current_time += note_duration
+    pm_a.instruments.append(instrument_a)
+
+    # Add chords
+    add_chords(pm_a, music_params["chord_progression"], recitation_length)
+
+    print("\n=== Plan A Melody Generation Results ===")
+    print(f"Number of Notes: {len(melody_a)}")
+    print(f"Total Duration: {pm_a.get_end_time():.2f} seconds")
+    print("=====================================\n")
+    return pm_a
+
+def generate_plan_b(config, poem, recitation_length, model=None, rng=None):
+    """
+    Generate the Plan B melody (MusicVAE) with chords.
+
+    If a pre-sampled phrase bank exists at phrase_bank_path, the melody is
+    assembled from bank phrases matching melody_shape instead of sampling
+    MusicVAE at request time.
+
+    Args:
+        config (dict): Configuration dictionary.
+        poem (dict): Poem dictionary with music params.
+        recitation_length (float): Recitation length in seconds.
+        model (TrainedModel, optional): Already loaded MusicVAE model to reuse.
+        rng (random.Random, optional): Random generator for phrase bank lookups.
+
+    Returns:
+        PrettyMIDI: Plan B melody and chord tracks.
+    """
+    music_params = poem["music_params"]
+    bank_path = config.get("phrase_bank_path")
+    if model is None and bank_path and os.path.exists(bank_path):
+        pm_b = assemble_melody(
+            load_phrase_bank(bank_path), music_params, recitation_length,
+            rng=rng, bank_filters=config.get("phrase_bank_filters")
+        )
+    else:
+        pm_b = generate_melody_musicvae(config, poem, recitation_length, music_params["tempo"], model=model)
+
+    # Add chords
+    add_chords(pm_b, music_params["chord_progression"], recitation_length)
+
+    print("\n=== Plan B Melody Generation Results ===")
+    print(f"Total Duration: {pm_b.get_end_time():.2f} seconds")
+    print("=====================================\n")
+    return pm_b
+
 def process_poem(config, poem, recitation_audio):
     """
     Generate melodies using both Plan A and Plan B, saving only MIDI files.
@@ -184,42 +334,14 @@ def process_poem(config, poem, recitation_audio):
     try:
         music_params = poem["music_params"]
         recitation_length = poem["recitation_length"]
-        tempo = music_params["tempo"]
-        
+
         # Sanitize the title for the filename
         title = sanitize_filename(poem.get("title", "untitled"))
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
         # --- Plan A: Classmate's logic ---
-        # Calculate number of notes based on recitation length and tempo
-        num_notes = int(recitation_length * (tempo / 60))
-        num_notes = max(16, num_notes)  # Ensure minimum notes
-        note_duration = recitation_length / num_notes  # Duration per note in seconds
-
-        melody_a = generate_complex_melody(
-            base_note=music_params["base_note"],
-            mode=music_params["mode"],
-            num_notes=num_notes
-        )
-        
-        # Create PrettyMIDI object for Plan A
-        pm_a = pretty_midi.PrettyMIDI()
-        instrument_a = pretty_midi.Instrument(program=0)  # Temporary instrument
-        current_time = 0.0
-        for note in melody_a:
-            pm_note = pretty_midi.Note(
-                velocity=100,
-                pitch=note,
-                start=current_time,
-                end=current_time + note_duration
-            )
-            instrument_a.notes.append(pm_note)
-            current_time += note_duration
-        pm_a.instruments.append(instrument_a)
-        
-        # Add chords
-        add_chords(pm_a, music_params["chord_progression"], recitation_length)
-        
+        pm_a = generate_plan_a(music_params, recitation_length)
+
         # # Save Plan A melody (MIDI only)
         # output_midi_file_a = os.path.join("output", f"{title}_melody_plana_{timestamp}.mid")
         # pm_a = save_melody(
@@ -227,18 +349,10 @@ def process_poem(config, poem, recitation_audio):
         #     music_params["instruments"],
         #     output_midi_file_a
         # )
-        
-        print("\n=== Plan A Melody Generation Results ===")
-        print(f"Number of Notes: {len(melody_a)}")
-        print(f"Total Duration: {pm_a.get_end_time():.2f} seconds")
-        print("=====================================\n")
 
         # --- Plan B: Your logic using MusicVAE ---
-        pm_b = generate_melody_musicvae(config, poem, recitation_length, tempo)
-        
-        # Add chords
-        add_chords(pm_b, music_params["chord_progression"], recitation_length)
-        
+        pm_b = generate_plan_b(config, poem, recitation_length)
+
         # # Save Plan B melody (MIDI only)
         # output_midi_file_b = os.path.join("output", f"{title}_melody_planb_{timestamp}.mid")
         # pm_b = save_melody(
@@ -246,10 +360,6 @@ def process_poem(config, poem, recitation_audio):
         #     music_params["instruments"],
         #     output_midi_file_b
         # )
-        
-        print("\n=== Plan B Melody Generation Results ===")
-        print(f"Total Duration: {pm_b.get_end_time():.2f} seconds")
-        print("=====================================\n")
 
         return poem, pm_a, pm_b
     except Exception as e:
@@ -0,0 +1,215 @@
+# src/model_residency.py
+import gc
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+class _Resident:
+    """Bookkeeping for one named model."""
+
+    def __init__(self, name):
+        self.name = name
+        self.model = None
+        self.unloader = None
+        self.bytes = 0
+        self.loads = 0
+        self.evictions = 0
+        self.in_use = 0
+        self.last_used = 0.0
+        self.load_seconds = 0.0
+        self.lock = threading.Lock()
+
+def process_rss_bytes():
+    """Resident set size of this process, or None if it cannot be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _torch_module_bytes(module):
+    """Bytes held by the parameters and buffers of a torch module."""
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+def estimate_model_bytes(model):
+    """
+    Estimate the memory held by a loaded model.
+
+    Torch modules (a Hugging Face pipeline's .model, KeyBERT's sentence
+    transformer) are measured from their tensors. Other models return None,
+    and the caller falls back to the process RSS growth during loading.
+    """
+    if "torch" not in sys.modules:
+        return None
+    import torch
+
+    candidates = [model, getattr(model, "model", None)]
+    backend = getattr(model, "model", None)
+    candidates.append(getattr(backend, "embedding_model", None))  # KeyBERT -> SentenceTransformer
+    for candidate in candidates:
+        if isinstance(candidate, torch.nn.Module):
+            return _torch_module_bytes(candidate)
+    return None
+
+class ModelResidencyManager:
+    """
+    Keep loaded models within a memory budget.
+
+    Models are loaded on first use through acquire(). When loading a model
+    would exceed the budget, idle models (not inside an acquire block) are
+    unloaded in least-recently-used order. Models in use are never evicted;
+    if they alone exceed the budget a warning is printed and loading goes ahead.
+    """
+
+    def __init__(self, budget_bytes=None):
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._residents = {}
+
+    def resident_bytes(self):
+        """Estimated bytes of all currently loaded models."""
+        return sum(r.bytes for r in self._residents.values() if r.model is not None)
+
+    @contextmanager
+    def acquire(self, name, loader, unloader=None, estimate_bytes=None):
+        """
+        Use a model, loading it (and evicting idle models) if it is not resident.
+
+        Args:
+            name (str): Key of the model (e.g. "emotion:<model name>").
+            loader (callable): Returns a freshly loaded model.
+            unloader (callable, optional): Releases framework resources of an evicted model.
+            estimate_bytes (int, optional): Size to assume before the first load.
+
+        Yields:
+            The loaded model.
+        """
+        with self._lock:
+            resident = self._residents.setdefault(name, _Resident(name))
+            resident.in_use += 1
+        try:
+            with resident.lock:
+                if resident.model is None:
+                    with self._lock:
+                        self._make_room(resident.bytes or estimate_bytes or 0, keep=resident)
+                    start = time.perf_counter()
+                    rss_before = process_rss_bytes()
+                    model = loader()
+                    rss_after = process_rss_bytes()
+                    size = estimate_model_bytes(model)
+                    if size is None and rss_before is not None and rss_after is not None:
+                        size = max(rss_after - rss_before, 0)
+                    with self._lock:
+                        resident.model = model
+                        resident.unloader = unloader
+                        resident.bytes = size or estimate_bytes or resident.bytes
+                        resident.loads += 1
+                        resident.load_seconds += time.perf_counter() - start
+                        self._make_room(0, keep=resident)
+                model = resident.model
+            yield model
+        finally:
+            with self._lock:
+                resident.in_use -= 1
+                resident.last_used = time.monotonic()
+
+    def _make_room(self, needed, keep=None):
+        """Evict idle models, least recently used first, until needed bytes fit the budget."""
+        if self.budget_bytes is None:
+            return
+        idle = sorted(
+            (r for r in self._residents.values() if r.model is not None and r.in_use == 0 and r is not keep),
+            key=lambda r: r.last_used
+        )
+        for resident in idle:
+            if self.resident_bytes() + needed <= self.budget_bytes:
+                break
+            self._evict(resident)
+        if self.resident_bytes() + needed > self.budget_bytes:
+            print(f"[Warning] Models in use exceed the memory budget "
+                  f"({(self.resident_bytes() + needed) / 2**20:.0f} MB > {self.budget_bytes / 2**20:.0f} MB)")
+
+    def _evict(self, resident):
+        model, resident.model = resident.model, None
+        resident.evictions += 1
+        if resident.unloader:
+            try:
+                resident.unloader(model)
+            except Exception as e:
+                print(f"[Warning] Failed to unload {resident.name}: {e}")
+        del model
+        gc.collect()
+        if "torch" in sys.modules:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        print(f"Model evicted: {resident.name} ({resident.bytes / 2**20:.0f} MB)")
+
+    def evict_idle(self):
+        """Unload every model that is not in use."""
+        with self._lock:
+            for resident in list(self._residents.values()):
+                if resident.model is not None and resident.in_use == 0:
+                    self._evict(resident)
+
+    def report(self):
+        """
+        Report residency, load counts and eviction counts.
+
+        Returns:
+            dict: Budget and resident totals, plus per-model statistics.
+        """
+        with self._lock:
+            return {
+                "budget_bytes": self.budget_bytes,
+                "resident_bytes": self.resident_bytes(),
+                "process_rss_bytes": process_rss_bytes(),
+                "models": {
+                    r.name: {
+                        "resident": r.model is not None,
+                        "in_use": r.in_use,
+                        "bytes": r.bytes,
+                        "loads": r.loads,
+                        "reloads": max(r.loads - 1, 0),
+                        "evictions": r.evictions,
+                        "load_seconds": round(r.load_seconds, 3)
+                    }
+                    for r in self._residents.values()
+                }
+            }
+
+# One manager per process, shared by all pipeline stages
+_MANAGER = ModelResidencyManager()
+
+def get_model_manager():
+    """Return the process-wide model residency manager."""
+    return _MANAGER
+
+def configure_model_budget(config):
+    """Set the memory budget from pipeline.model_memory_budget_mb (null means unlimited)."""
+    budget_mb = (config or {}).get("model_memory_budget_mb")
+    _MANAGER.budget_bytes = int(budget_mb * 2**20) if budget_mb else None
+    return _MANAGER
+
+def print_residency_report(manager=None):
+    """Print the loaded models, their estimated size and load/eviction counts."""
+    report = (manager or _MANAGER).report()
+    budget = report["budget_bytes"]
+    print("\n=== Model Residency Report ===")
+    print(f"Budget: {f'{budget / 2**20:.0f} MB' if budget else 'unlimited'}")
+    print(f"Resident Models: {report['resident_bytes'] / 2**20:.0f} MB")
+    if report["process_rss_bytes"]:
+        print(f"Process RSS: {report['process_rss_bytes'] / 2**20:.0f} MB")
+    for name, info in report["models"].items():
+        state = "resident" if info["resident"] else "unloaded"
+        print(f"{name}: {state}, {info['bytes'] / 2**20:.0f} MB, "
+              f"loads {info['loads']}, evictions {info['evictions']}, load time {info['load_seconds']:.1f}s")
+    print("==============================\n")
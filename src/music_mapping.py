@@ -1,158 +1,235 @@
 # src/music_mapping.py
+import os
+import copy
+import json
+import time
+import argparse
+from src.poem_record import load_records, shared_value
 
-def map_sentiment(sentiment):
+# --- Default mapping tables (config.json "music_mapping.overrides" is merged on top) ---
+SENTIMENT_TABLE = {
+    "positive": {
+        "mode": "major",
+        "base_note": 60,  # C4
+        "chord_progression": [
+            [60, 64, 67],  # C major (C, E, G)
+            [65, 69, 72],  # F major (F, A, C)
+            [67, 71, 74],  # G major (G, B, D)
+            [60, 64, 67]   # back to C major
+        ]
+    },
+    "negative": {
+        "mode": "minor",
+        "base_note": 57,  # A3
+        "chord_progression": [
+            [57, 60, 64],  # Am (A, C, E)
+            [50, 53, 57],  # Dm (approximation)
+            [52, 56, 59],  # Em (approximation)
+            [57, 60, 64]   # back to Am
+        ]
+    },
+    "neutral": {
+        "mode": "modal",
+        "base_note": 60,
+        "chord_progression": [
+            [60, 62, 67]   # an example modal chord
+        ]
+    },
+    "default": {
+        "mode": "minor",
+        "base_note": 60,
+        "chord_progression": [
+            [60, 63, 67]
+        ]
+    }
+}
+
+# Map tempo character to numerical tempo
+TEMPO_MAPPING = {
+    "lively": (90, 110),
+    "slow": (60, 80),
+    "fast or irregular": (110, 130),
+    "sudden shifts": (80, 120),
+    "uneven": (70, 90),
+    "unpredictable": (90, 120)
+}
+
+# emotion -> (melody shape, tempo character, dynamics, ornamentation)
+EMOTION_SPECS = {
+    "joy": ("ascending", "lively", "active", "rich"),
+    "sadness": ("descending", "slow", "soft", "minimal"),
+    "anger": ("abrupt", "fast or irregular", "strong and staccato", "sporadic with dissonances"),
+    "surprise": ("variable", "sudden shifts", "unexpected", "sporadic"),
+    "fear": ("unstable", "uneven", "tense", "sparse, with suspenseful intervals"),
+    "disgust": ("irregular", "unpredictable", "uneven", "dissonant")
+}
+
+EMOTION_DEFAULT = {
+    "melody_shape": "smooth",
+    "tempo": 90,
+    "dynamics": "normal",
+    "ornamentation": "minimal"
+}
+
+THEME_TABLE = {
+    "nature": ["flute", "clarinet", "harp", "tubular_bells"],
+    "love": ["piano", "violin", "cello", "guitar"],
+    "death": ["cello", "contrabass", "organ", "tuba"],
+    "war": ["timpani", "trumpet", "french_horn", "trombone"],
+    "other": ["piano", "guitar", "violin", "alto_sax"]
+}
+
+RHYME_TABLE = {
+    "aabb": {
+        "structure": "symmetric paired repetition",
+        "time_signature": "4/4"
+    },
+    "abab": {
+        "structure": "alternating thematic sections",
+        "time_signature": "3/4"
+    },
+    "free verse": {
+        "structure": "free form",
+        "time_signature": "4/4"
+    },
+    "default": {
+        "structure": "free form",
+        "time_signature": "4/4"
+    }
+}
+
+KEYWORD_EFFECTS = [
+    {
+        "keywords": ["nests", "squirrels", "dormouse", "seeds", "autumn"],
+        "background_effects": ["bird chirps", "water flow", "wind rustle"]
+    }
+]
+
+def _emotion_entry(melody_shape, tempo_character, dynamics, ornamentation, tempo_mapping):
+    tempo_range = tempo_mapping[tempo_character]
+    return {
+        "melody_shape": melody_shape,
+        "tempo": tempo_range[0] + (tempo_range[1] - tempo_range[0]) * 0.5,  # Midpoint
+        "dynamics": dynamics,
+        "ornamentation": ornamentation
+    }
+
+def compile_mapping_tables(overrides=None):
+    """
+    Compile the lookup tables used by the map_* functions.
+
+    Overrides from config.json ("music_mapping.overrides") replace or add
+    entries per table: "sentiment", "emotion", "theme", "rhyme_pattern",
+    "tempo" (tempo character ranges) and "keyword_effects". An emotion
+    override may give "tempo_character" instead of a numeric "tempo".
+
+    Args:
+        overrides (dict, optional): Per-table overrides keyed by lower-case label.
+
+    Returns:
+        dict: Compiled tables.
+    """
+    overrides = overrides or {}
+    tempo_mapping = dict(TEMPO_MAPPING)
+    tempo_mapping.update({k: tuple(v) for k, v in overrides.get("tempo", {}).items()})
+
+    emotion = {name: _emotion_entry(*spec, tempo_mapping) for name, spec in EMOTION_SPECS.items()}
+    emotion["default"] = dict(EMOTION_DEFAULT)
+    for name, entry in overrides.get("emotion", {}).items():
+        entry = dict(emotion.get(name.lower(), EMOTION_DEFAULT), **entry)
+        if "tempo_character" in entry:
+            tempo_range = tempo_mapping[entry.pop("tempo_character")]
+            entry["tempo"] = tempo_range[0] + (tempo_range[1] - tempo_range[0]) * 0.5
+        emotion[name.lower()] = entry
+
+    tables = {
+        "sentiment": copy.deepcopy(SENTIMENT_TABLE),
+        "emotion": emotion,
+        "theme": copy.deepcopy(THEME_TABLE),
+        "rhyme_pattern": copy.deepcopy(RHYME_TABLE)
+    }
+    for table in ("sentiment", "theme", "rhyme_pattern"):
+        for name, entry in overrides.get(table, {}).items():
+            if isinstance(entry, dict):
+                entry = dict(tables[table].get(name.lower(), tables[table].get("default", {})), **entry)
+            tables[table][name.lower()] = entry
+
+    tables["keyword_effects"] = [
+        (frozenset(k.lower() for k in rule["keywords"]), list(rule["background_effects"]))
+        for rule in overrides.get("keyword_effects", KEYWORD_EFFECTS)
+    ]
+    return tables
+
+# Compiled tables keyed by the JSON of their overrides
+_TABLE_CACHE = {}
+
+def get_mapping_tables(config):
+    """Return the compiled tables for a music_mapping config, compiling them once."""
+    overrides = (config or {}).get("overrides", {})
+    key = json.dumps(overrides, sort_keys=True)
+    if key not in _TABLE_CACHE:
+        _TABLE_CACHE[key] = compile_mapping_tables(overrides)
+    return _TABLE_CACHE[key]
+
+DEFAULT_TABLES = compile_mapping_tables()
+
+def map_sentiment(sentiment, tables=None):
     """Map sentiment to mode, base note, and chord progression."""
-    sentiment = sentiment.lower()
-    if sentiment == "positive":
-        return {
-            "mode": "major",
-            "base_note": 60,  # C4
-            "chord_progression": [
-                [60, 64, 67],  # C major (C, E, G)
-                [65, 69, 72],  # F major (F, A, C)
-                [67, 71, 74],  # G major (G, B, D)
-                [60, 64, 67]   # back to C major
-            ]
-        }
-    elif sentiment == "negative":
-        return {
-            "mode": "minor",
-            "base_note": 57,  # A3
-            "chord_progression": [
-                [57, 60, 64],  # Am (A, C, E)
-                [50, 53, 57],  # Dm (approximation)
-                [52, 56, 59],  # Em (approximation)
-                [57, 60, 64]   # back to Am
-            ]
-        }
-    elif sentiment == "neutral":
-        return {
-            "mode": "modal",
-            "base_note": 60,
-            "chord_progression": [
-                [60, 62, 67]   # an example modal chord
-            ]
-        }
-    else:
-        return {
-            "mode": "minor",
-            "base_note": 60,
-            "chord_progression": [
-                [60, 63, 67]
-            ]
-        }
-
-def map_emotion(emotion):
+    table = (tables or DEFAULT_TABLES)["sentiment"]
+    return copy.deepcopy(table.get(sentiment.lower(), table["default"]))
+
+def map_emotion(emotion, tables=None):
     """Map emotion to melody shape, tempo, dynamics, and ornamentation."""
-    emotion = emotion.lower()
-    # Map tempo character to numerical tempo
-    tempo_mapping = {
-        "lively": (90, 110),
-        "slow": (60, 80),
-        "fast or irregular": (110, 130),
-        "sudden shifts": (80, 120),
-        "uneven": (70, 90),
-        "unpredictable": (90, 120)
-    }
-    if emotion == "joy":
-        tempo_range = tempo_mapping["lively"]
-        return {
-            "melody_shape": "ascending",
-            "tempo": tempo_range[0] + (tempo_range[1] - tempo_range[0]) * 0.5,  # Midpoint
-            "dynamics": "active",
-            "ornamentation": "rich"
-        }
-    elif emotion == "sadness":
-        tempo_range = tempo_mapping["slow"]
-        return {
-            "melody_shape": "descending",
-            "tempo": tempo_range[0] + (tempo_range[1] - tempo_range[0]) * 0.5,
-            "dynamics": "soft",
-            "ornamentation": "minimal"
-        }
-    elif emotion == "anger":
-        tempo_range = tempo_mapping["fast or irregular"]
-        return {
-            "melody_shape": "abrupt",
-            "tempo": tempo_range[0] + (tempo_range[1] - tempo_range[0]) * 0.5,
-            "dynamics": "strong and staccato",
-            "ornamentation": "sporadic with dissonances"
-        }
-    elif emotion == "surprise":
-        tempo_range = tempo_mapping["sudden shifts"]
-        return {
-            "melody_shape": "variable",
-            "tempo": tempo_range[0] + (tempo_range[1] - tempo_range[0]) * 0.5,
-            "dynamics": "unexpected",
-            "ornamentation": "sporadic"
-        }
-    elif emotion == "fear":
-        tempo_range = tempo_mapping["uneven"]
-        return {
-            "melody_shape": "unstable",
-            "tempo": tempo_range[0] + (tempo_range[1] - tempo_range[0]) * 0.5,
-            "dynamics": "tense",
-            "ornamentation": "sparse, with suspenseful intervals"
-        }
-    elif emotion == "disgust":
-        tempo_range = tempo_mapping["unpredictable"]
-        return {
-            "melody_shape": "irregular",
-            "tempo": tempo_range[0] + (tempo_range[1] - tempo_range[0]) * 0.5,
-            "dynamics": "uneven",
-            "ornamentation": "dissonant"
-        }
-    else:
-        return {
-            "melody_shape": "smooth",
-            "tempo": 90,
-            "dynamics": "normal",
-            "ornamentation": "minimal"
-        }
-
-def map_theme(theme):
+    table = (tables or DEFAULT_TABLES)["emotion"]
+    return copy.deepcopy(table.get(emotion.lower(), table["default"]))
+
+def map_theme(theme, tables=None):
     """Map theme to a list of instruments."""
-    theme_mapping = {
-        "nature": ["flute", "clarinet", "harp", "tubular_bells"],
-        "love": ["piano", "violin", "cello", "guitar"],
-        "death": ["cello", "contrabass", "organ", "tuba"],
-        "war": ["timpani", "trumpet", "french_horn", "trombone"],
-        "other": ["piano", "guitar", "violin", "alto_sax"]
-    }
-    return theme_mapping.get(theme.lower(), theme_mapping["other"])
+    table = (tables or DEFAULT_TABLES)["theme"]
+    return list(table.get(theme.lower(), table["other"]))
 
-def map_keywords(keywords):
+def map_keywords(keywords, tables=None):
     """Map keywords to background effects."""
     suggestions = {}
-    keywords_lower = [kw.lower() for kw in keywords]
-    nature_related = {"nests", "squirrels", "dormouse", "seeds", "autumn"}
-    if nature_related.intersection(keywords_lower):
-        suggestions["background_effects"] = ["bird chirps", "water flow", "wind rustle"]
+    keywords_lower = {kw.lower() for kw in keywords}
+    for triggers, effects in (tables or DEFAULT_TABLES)["keyword_effects"]:
+        if triggers & keywords_lower:
+            suggestions["background_effects"] = list(effects)
+            break
     return suggestions
 
-def map_rhyme_pattern(rhyme_pattern):
+def map_rhyme_pattern(rhyme_pattern, tables=None):
     """Map rhyme pattern to structure and time signature."""
-    pattern = rhyme_pattern.lower()
-    if pattern == "aabb":
-        return {
-            "structure": "symmetric paired repetition",
-            "time_signature": "4/4"
-        }
-    elif pattern == "abab":
-        return {
-            "structure": "alternating thematic sections",
-            "time_signature": "3/4"
-        }
-    elif pattern == "free verse":
-        return {
-            "structure": "free form",
-            "time_signature": "4/4"
-        }
-    else:
-        return {
-            "structure": "free form",
-            "time_signature": "4/4"
-        }
+    table = (tables or DEFAULT_TABLES)["rhyme_pattern"]
+    return copy.deepcopy(table.get(rhyme_pattern.lower(), table["default"]))
+
+def map_music_params(poem, tables=None):
+    """
+    Build the music_params dictionary for an analysed poem.
+
+    Args:
+        poem (dict): Poem dictionary with NLP features.
+        tables (dict, optional): Compiled mapping tables.
+
+    Returns:
+        dict: Music parameters.
+    """
+    sentiment_map = map_sentiment(poem.get("sentiment", "neutral"), tables)
+    emotion_map = map_emotion(poem.get("emotion", "joy"), tables)
+    rhyme_map = map_rhyme_pattern(poem.get("rhyme_pattern", "free verse"), tables)
+    return {
+        "mode": sentiment_map["mode"],
+        "base_note": sentiment_map["base_note"],
+        "chord_progression": sentiment_map["chord_progression"],
+        "melody_shape": emotion_map["melody_shape"],
+        "tempo": emotion_map["tempo"],
+        "dynamics": emotion_map["dynamics"],
+        "ornamentation": emotion_map["ornamentation"],
+        "instruments": map_theme(poem.get("theme", "other"), tables),
+        "keyword_decorations": map_keywords(poem.get("keywords", []), tables),
+        "structure": rhyme_map["structure"],
+        "time_signature": rhyme_map["time_signature"]
+    }
 
 def process_poem(config, poem):
     """
@@ -167,22 +244,7 @@ def process_poem(config, poem):
     """
     try:
         # Map features to music parameters
-        music_params = {}
-        sentiment_map = map_sentiment(poem.get("sentiment", "neutral"))
-        emotion_map = map_emotion(poem.get("emotion", "joy"))
-        rhyme_map = map_rhyme_pattern(poem.get("rhyme_pattern", "free verse"))
-
-        music_params["mode"] = sentiment_map["mode"]
-        music_params["base_note"] = sentiment_map["base_note"]
-        music_params["chord_progression"] = sentiment_map["chord_progression"]
-        music_params["melody_shape"] = emotion_map["melody_shape"]
-        music_params["tempo"] = emotion_map["tempo"]
-        music_params["dynamics"] = emotion_map["dynamics"]
-        music_params["ornamentation"] = emotion_map["ornamentation"]
-        music_params["instruments"] = map_theme(poem.get("theme", "other"))
-        music_params["keyword_decorations"] = map_keywords(poem.get("keywords", []))
-        music_params["structure"] = rhyme_map["structure"]
-        music_params["time_signature"] = rhyme_map["time_signature"]
+        music_params = map_music_params(poem, get_mapping_tables(config))
 
         # Add music_params to poem
         poem["music_params"] = music_params
@@ -205,4 +267,69 @@ def process_poem(config, poem):
         return poem
     except Exception as e:
         print(f"[Error] Failed to map music parameters: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def mapping_key(poem, tables=None):
+    """The features that determine a poem's music params; poems with equal keys map identically."""
+    return (
+        poem.get("sentiment", "neutral").lower(),
+        poem.get("emotion", "joy").lower(),
+        poem.get("theme", "other").lower(),
+        poem.get("rhyme_pattern", "free verse").lower(),
+        json.dumps(map_keywords(poem.get("keywords", []), tables))
+    )
+
+def process_corpus(config, input_file, output_file=None):
+    """
+    Map a whole analysed corpus in one pass and stream out the music-params file.
+
+    Poems are held as PoemRecords sharing one music_params per distinct
+    combination of mapped features, which is computed once. Records
+    are written one at a time to a temporary file that replaces output_file
+    when complete.
+
+    Args:
+        config (dict): music_mapping configuration dictionary.
+        input_file (str): JSON list of poems with NLP features.
+        output_file (str, optional): Defaults to music_mapping.output_file.
+
+    Returns:
+        int: Number of poems written.
+    """
+    output_file = output_file or config["output_file"]
+    tables = get_mapping_tables(config)
+    start = time.perf_counter()
+    poems = load_records(input_file)
+
+    combos = {}
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        out.write("[\n")
+        for i, poem in enumerate(poems):
+            key = mapping_key(poem, tables)
+            if key not in combos:
+                combos[key] = shared_value(map_music_params(poem, tables))
+            poem["music_params"] = combos[key]
+            out.write(("" if i == 0 else ",\n") + json.dumps(poem.to_dict(), ensure_ascii=False))
+        out.write("\n]\n")
+    os.replace(tmp_path, output_file)
+
+    print("\n=== Bulk Music Mapping Results ===")
+    print(f"Poems Mapped: {len(poems)}")
+    print(f"Distinct Parameter Sets: {len(combos)}")
+    print(f"Time: {time.perf_counter() - start:.2f} seconds")
+    print(f"Output: {output_file}")
+    print("=================================\n")
+    return len(poems)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Map an analysed corpus to music parameters.")
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("--input", help="Analysed corpus (defaults to nlp_analysis.output_file)")
+    parser.add_argument("--output", help="Output file (defaults to music_mapping.output_file)")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    process_corpus(config["music_mapping"], args.input or config["nlp_analysis"]["output_file"], args.output)
@@ -1,10 +1,16 @@
 # src/music_synthesis.py
 import os
 import re
+import time
+import wave
+import numpy as np
 from datetime import datetime
 from pydub import AudioSegment
 import pretty_midi
-from midi2audio import FluidSynth
+from src.thread_budget import make_fluidsynth
+from src.sample_renderer import SampleCache, render_from_samples, write_wav_int16
+from src.stem_rendering import render_stems
+from src.audio_format import DEFAULT_AUDIO_FORMAT, to_canonical, silence, require_same_format
 
 def sanitize_filename(filename):
     """
@@ -25,16 +31,52 @@ def sanitize_filename(filename):
     filename = filename[:100]
     return filename
 
-def midi_to_wav(pm, output_midi_file, output_wav_file, soundfont_path, ffmpeg_bin_path):
+# Callbacks told about every artifact path handed out (used by the load-test harness)
+ARTIFACT_OBSERVERS = []
+
+# Directory artifacts are written to (pipeline.output_dir, e.g. a shared filesystem)
+OUTPUT_DIR = "output"
+
+def configure_output_dir(config):
+    """Set the artifact directory from pipeline.output_dir and create it."""
+    global OUTPUT_DIR
+    OUTPUT_DIR = config.get("pipeline", {}).get("output_dir", "output")
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    return OUTPUT_DIR
+
+def artifact_path(title, timestamp, *parts, ext="wav"):
+    """
+    Build the path of an output artifact: <OUTPUT_DIR>/<title>_<parts...>_<timestamp>.<ext>.
+
+    Args:
+        title (str): Sanitized poem title.
+        timestamp (str): Run timestamp (or another run tag, such as a poem ID prefix).
+        *parts (str): Name parts between title and timestamp (e.g. "final_song", "plana").
+        ext (str): File extension.
+
+    Returns:
+        str: Path inside the output directory.
+    """
+    path = os.path.join(OUTPUT_DIR, "_".join([title, *parts, timestamp]) + f".{ext}")
+    for observer in ARTIFACT_OBSERVERS:
+        observer(os.path.abspath(path))
+    return path
+
+def midi_to_wav(pm, output_midi_file, output_wav_file, soundfont_path, ffmpeg_bin_path, fs=None, audio_format=None):
     """
     Convert a PrettyMIDI object to a WAV file using FluidSynth.
 
+    FluidSynth renders at the canonical frame rate, so the result only needs
+    converting if the canonical format is not 16-bit stereo.
+
     Args:
         pm (PrettyMIDI): The PrettyMIDI object to convert.
         output_midi_file (str): Path to save the temporary MIDI file.
         output_wav_file (str): Path to save the WAV file.
         soundfont_path (str): Path to the SoundFont file.
         ffmpeg_bin_path (str): Path to the ffmpeg binary directory.
+        fs (FluidSynth, optional): Shared synthesizer; one is created if not given.
+        audio_format (dict, optional): Canonical audio format (see src/audio_format.py).
 
     Returns:
         AudioSegment: The generated audio segment, or a silent segment if conversion fails.
@@ -56,26 +98,39 @@ def midi_to_wav(pm, output_midi_file, output_wav_file, soundfont_path, ffmpeg_bi
             AudioSegment.ffprobe = os.path.join(ffmpeg_bin_path, "ffprobe.exe")
 
         # Convert MIDI to WAV using FluidSynth
-        fs = FluidSynth(soundfont_path)
+        audio_format = audio_format or DEFAULT_AUDIO_FORMAT
+        fs = fs or make_fluidsynth(soundfont_path, audio_format["frame_rate"])
         fs.midi_to_audio(output_midi_file, output_wav_file)
         print(f"Melody converted to WAV: {output_wav_file}")
 
         # Load the WAV file
-        audio = AudioSegment.from_wav(output_wav_file)
+        audio = to_canonical(AudioSegment.from_wav(output_wav_file), audio_format)
         return audio
 
     except Exception as e:
         print(f"[Error] Failed to convert MIDI to WAV: {e}")
         duration_ms = int(pm.get_end_time() * 1000)
-        audio = AudioSegment.silent(duration=duration_ms)
+        audio = silence(duration_ms, audio_format)
         audio.export(output_wav_file, format="wav")
         print(f"Fallback WAV file created: {output_wav_file}")
         return audio
 
+def _pad_frames(audio, frames):
+    """Append silent frames in the segment's own format."""
+    return AudioSegment(
+        data=audio.raw_data + bytes(frames * audio.frame_width),
+        frame_rate=audio.frame_rate,
+        channels=audio.channels,
+        sample_width=audio.sample_width
+    )
+
 def mix_audio(recitation_audio, melody_audio, recitation_volume, melody_volume):
     """
     Mix recitation audio with melody audio, applying volume adjustments from config.
 
+    Both inputs must already be in the same (canonical) format; nothing is
+    resampled or re-channelled here.
+
     Args:
         recitation_audio (AudioSegment): The recitation audio.
         melody_audio (AudioSegment): The melody audio.
@@ -86,13 +141,15 @@ def mix_audio(recitation_audio, melody_audio, recitation_volume, melody_volume):
         AudioSegment: The mixed audio.
     """
     try:
+        require_same_format(recitation_audio, melody_audio)
+
         # Ensure both audio segments are the same length
-        if len(recitation_audio) < len(melody_audio):
-            padding = AudioSegment.silent(duration=len(melody_audio) - len(recitation_audio))
-            recitation_audio = recitation_audio + padding
-        elif len(recitation_audio) > len(melody_audio):
-            padding = AudioSegment.silent(duration=len(recitation_audio) - len(melody_audio))
-            melody_audio = melody_audio + padding
+        recitation_frames = int(recitation_audio.frame_count())
+        melody_frames = int(melody_audio.frame_count())
+        if recitation_frames < melody_frames:
+            recitation_audio = _pad_frames(recitation_audio, melody_frames - recitation_frames)
+        elif recitation_frames > melody_frames:
+            melody_audio = _pad_frames(melody_audio, recitation_frames - melody_frames)
 
         # Apply volume adjustments
         recitation_audio = recitation_audio + recitation_volume
@@ -106,6 +163,216 @@ def mix_audio(recitation_audio, melody_audio, recitation_volume, melody_volume):
         print(f"[Error] Failed to mix audio: {e}")
         return recitation_audio  # Fallback to recitation audio
 
+def midi_to_wav_file(pm, output_midi_file, output_wav_file, soundfont_path, fs=None, audio_format=None):
+    """
+    Render a PrettyMIDI object to a WAV file with FluidSynth without loading the result.
+
+    Returns:
+        str: Absolute path of the WAV file (silent if conversion fails).
+    """
+    audio_format = audio_format or DEFAULT_AUDIO_FORMAT
+    output_midi_file = os.path.abspath(output_midi_file)
+    output_wav_file = os.path.abspath(output_wav_file)
+    try:
+        pm.write(output_midi_file)
+        fs = fs or make_fluidsynth(os.path.abspath(soundfont_path), audio_format["frame_rate"])
+        fs.midi_to_audio(output_midi_file, output_wav_file)
+        print(f"Melody converted to WAV: {output_wav_file}")
+    except Exception as e:
+        print(f"[Error] Failed to convert MIDI to WAV: {e}")
+        write_silent_wav(output_wav_file, pm.get_end_time(), **audio_format)
+        print(f"Fallback WAV file created: {output_wav_file}")
+    finally:
+        if os.path.exists(output_midi_file):
+            os.remove(output_midi_file)
+    return output_wav_file
+
+def write_silent_wav(output_wav_file, duration, frame_rate=44100, channels=2, sample_width=2, block_seconds=10):
+    """Write a silent WAV file one block at a time."""
+    total_frames = int(duration * frame_rate)
+    block = bytes(int(block_seconds * frame_rate) * channels * sample_width)
+    with wave.open(output_wav_file, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(sample_width)
+        out.setframerate(frame_rate)
+        frame_bytes = channels * sample_width
+        while total_frames > 0:
+            frames = min(total_frames, len(block) // frame_bytes)
+            out.writeframes(block[:frames * frame_bytes])
+            total_frames -= frames
+
+def mix_wav_files(recitation_wav, melody_wav, output_wav, recitation_volume, melody_volume, block_seconds=10):
+    """
+    Mix two 16-bit stereo WAV files window by window and append each mixed window to the output.
+
+    Peak memory is a few windows of samples regardless of the file lengths.
+    The shorter input is padded with silence, as in mix_audio.
+
+    Args:
+        recitation_wav (str): Path of the recitation WAV file.
+        melody_wav (str): Path of the melody WAV file.
+        output_wav (str): Path of the mixed WAV file to write.
+        recitation_volume (float): Volume adjustment for recitation in dB.
+        melody_volume (float): Volume adjustment for melody in dB.
+        block_seconds (float): Window length in seconds.
+
+    Returns:
+        float: Length of the mixed audio in seconds.
+    """
+    recitation_gain = 10 ** (recitation_volume / 20.0)
+    melody_gain = 10 ** (melody_volume / 20.0)
+    with wave.open(recitation_wav, "rb") as rec, wave.open(melody_wav, "rb") as mel:
+        params = (rec.getframerate(), rec.getnchannels(), rec.getsampwidth())
+        if params != (mel.getframerate(), mel.getnchannels(), mel.getsampwidth()):
+            raise ValueError(f"Recitation format {params} does not match melody format "
+                             f"{(mel.getframerate(), mel.getnchannels(), mel.getsampwidth())}")
+        if params[1:] != (2, 2):
+            raise ValueError(f"Block mixing expects 16-bit stereo WAV files, got {params[1]} channel(s) "
+                             f"of {8 * params[2]}-bit samples")
+        frame_rate, channels, _ = params
+        block_frames = int(block_seconds * frame_rate)
+        total_frames = 0
+
+        with wave.open(output_wav, "wb") as out:
+            out.setnchannels(channels)
+            out.setsampwidth(2)
+            out.setframerate(frame_rate)
+            while True:
+                rec_block = np.frombuffer(rec.readframes(block_frames), dtype=np.int16)
+                mel_block = np.frombuffer(mel.readframes(block_frames), dtype=np.int16)
+                if not len(rec_block) and not len(mel_block):
+                    break
+                mixed = np.zeros(max(len(rec_block), len(mel_block)), dtype=np.float32)
+                mixed[:len(rec_block)] += rec_block * recitation_gain
+                mixed[:len(mel_block)] += mel_block * melody_gain
+                out.writeframes(np.clip(mixed, -32768, 32767).astype(np.int16).tobytes())
+                total_frames += len(mixed) // channels
+    return total_frames / frame_rate
+
+def render_plan_blocked(config, title, timestamp, plan, recitation_wav, pm, fs=None, audio_format=None):
+    """
+    Render one plan to WAV and mix it with the recitation WAV in fixed-size windows.
+
+    Unlike render_plan, no full-length audio is ever held in memory. FluidSynth
+    writes 16-bit stereo, so the canonical format must be 16-bit stereo here.
+
+    Returns:
+        str: Path of the final WAV file.
+    """
+    soundfont_path = config.get("soundfont_path")
+    if not soundfont_path:
+        raise ValueError("Soundfont path not provided in config")
+
+    temp_midi_file = artifact_path(title, timestamp, "temp", plan, ext="mid")
+    melody_wav_file = artifact_path(title, timestamp, "melody", plan)
+    melody_wav_file = midi_to_wav_file(pm, temp_midi_file, melody_wav_file, soundfont_path, fs=fs,
+                                       audio_format=audio_format)
+
+    final_output = os.path.abspath(artifact_path(title, timestamp, "final_song", plan))
+    mix_wav_files(
+        recitation_wav, melody_wav_file, final_output,
+        config.get("recitation_volume", 0), config.get("melody_volume", -3),
+        block_seconds=config.get("block_seconds", 10)
+    )
+    plan_name = {"plana": "Plan A", "planb": "Plan B"}.get(plan, plan)
+    print(f"Final {plan_name} audio saved: {final_output}")
+    return final_output
+
+# Sample caches keyed by soundfont path and frame rate, shared by every render in the process
+_SAMPLE_CACHES = {}
+
+def fast_render_melody(config, pm, output_wav_file, fs=None, audio_format=None):
+    """
+    Render a melody from cached note and chord samples instead of a full FluidSynth pass.
+
+    Used when music_synthesis.fast_render is enabled. Plan A (fixed scale
+    pitches, even note lengths and repeated chords) needs only a few samples;
+    MIDI that would need more than sample_cache_max_keys samples is not cacheable.
+
+    Returns:
+        AudioSegment: The rendered melody, or None if pm is not cacheable.
+    """
+    audio_format = audio_format or DEFAULT_AUDIO_FORMAT
+    soundfont_path = os.path.abspath(config["soundfont_path"])
+    cache_key = (soundfont_path, audio_format["frame_rate"])
+    if cache_key not in _SAMPLE_CACHES:
+        _SAMPLE_CACHES[cache_key] = SampleCache(
+            soundfont_path, frame_rate=audio_format["frame_rate"], cache_dir=config.get("sample_cache_dir"), fs=fs,
+            max_bytes=int(config.get("sample_cache_max_mb", 256) * 2**20),
+            max_disk_bytes=int(config["sample_cache_max_disk_mb"] * 2**20)
+            if config.get("sample_cache_max_disk_mb") else None
+        )
+    cache = _SAMPLE_CACHES[cache_key]
+
+    start = time.perf_counter()
+    hits, misses = cache.hits, cache.misses
+    audio = render_from_samples(pm, cache, config.get("sample_cache_max_keys", 512))
+    if audio is None:
+        return None
+    output_wav_file = os.path.abspath(output_wav_file)
+    write_wav_int16(output_wav_file, audio, cache.frame_rate)
+    print(f"Melody rendered from samples: {output_wav_file} "
+          f"({cache.hits - hits} cached, {cache.misses - misses} new, {time.perf_counter() - start:.2f}s)")
+    audio = AudioSegment(data=audio.tobytes(), frame_rate=cache.frame_rate, channels=2, sample_width=2)
+    return to_canonical(audio, audio_format)
+
+def render_plan(config, title, timestamp, plan, recitation_audio, pm, fs=None, melody_audio=None, audio_format=None,
+                instruments=None):
+    """
+    Render one plan's melody to WAV, mix it with the recitation and save the result.
+
+    Args:
+        config (dict): Configuration dictionary.
+        title (str): Sanitized poem title used in filenames.
+        timestamp (str): Run timestamp used in filenames.
+        plan (str): Plan label used in filenames ("plana" or "planb").
+        recitation_audio (AudioSegment): The recitation audio.
+        pm (PrettyMIDI): PrettyMIDI object for the plan.
+        fs (FluidSynth, optional): Shared synthesizer.
+        melody_audio (AudioSegment, optional): Melody already rendered (e.g. by a framework worker).
+        audio_format (dict, optional): Canonical audio format shared by the recitation and melody.
+        instruments (list, optional): Instruments to split the melody across when rendering stems.
+
+    Returns:
+        tuple: (Mixed AudioSegment, path of the final WAV file).
+    """
+    # Get paths and volume settings from config
+    soundfont_path = config.get("soundfont_path")
+    ffmpeg_bin_path = config.get("ffmpeg_bin_path")
+    recitation_volume = config.get("recitation_volume", 0)  # Default to 0 dB
+    melody_volume = config.get("melody_volume", -3)        # Default to -3 dB
+    if not soundfont_path:
+        raise ValueError("Soundfont path not provided in config")
+
+    temp_midi_file = artifact_path(title, timestamp, "temp", plan, ext="mid")
+    melody_wav_file = artifact_path(title, timestamp, "melody", plan)
+    if melody_audio is None and config.get("stem_rendering"):
+        try:
+            melody_audio = render_stems(config, pm, melody_wav_file, instruments=instruments, fs=fs,
+                                        audio_format=audio_format)
+        except Exception as e:
+            print(f"[Warning] Stem rendering failed, rendering the full arrangement: {e}")
+    if melody_audio is None and config.get("fast_render"):
+        try:
+            melody_audio = fast_render_melody(config, pm, melody_wav_file, fs=fs, audio_format=audio_format)
+        except Exception as e:
+            print(f"[Warning] Sample rendering failed, using FluidSynth: {e}")
+    if melody_audio is None:
+        melody_audio = midi_to_wav(pm, temp_midi_file, melody_wav_file, soundfont_path, ffmpeg_bin_path, fs=fs,
+                                   audio_format=audio_format)
+
+    mixed_audio = mix_audio(recitation_audio, melody_audio, recitation_volume, melody_volume)
+    final_output = artifact_path(title, timestamp, "final_song", plan)
+    final_output = os.path.abspath(final_output)
+    mixed_audio.export(final_output, format="wav")
+    plan_name = {"plana": "Plan A", "planb": "Plan B"}.get(plan, plan)
+    print(f"Final {plan_name} audio saved: {final_output}")
+
+    if os.path.exists(temp_midi_file):
+        os.remove(temp_midi_file)
+
+    return mixed_audio, final_output
+
 def process_poem(config, poem, recitation_audio, pm_a, pm_b):
     """
     Synthesize the final audio by mixing recitation with melodies for Plan A and Plan B.
@@ -125,41 +392,11 @@ def process_poem(config, poem, recitation_audio, pm_a, pm_b):
         title = sanitize_filename(poem.get("title", "untitled"))
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-        # Get paths and volume settings from config
-        soundfont_path = config.get("soundfont_path")
-        ffmpeg_bin_path = config.get("ffmpeg_bin_path")
-        recitation_volume = config.get("recitation_volume", 0)  # Default to 0 dB
-        melody_volume = config.get("melody_volume", -3)        # Default to -3 dB
-        if not soundfont_path:
-            raise ValueError("Soundfont path not provided in config")
-
         # --- Plan A: Convert MIDI to WAV and Mix ---
-        temp_midi_file_a = os.path.join("output", f"{title}_temp_plana_{timestamp}.mid")
-        melody_wav_file_a = os.path.join("output", f"{title}_melody_plana_{timestamp}.wav")
-        melody_audio_a = midi_to_wav(pm_a, temp_midi_file_a, melody_wav_file_a, soundfont_path, ffmpeg_bin_path)
-
-        mixed_audio_a = mix_audio(recitation_audio, melody_audio_a, recitation_volume, melody_volume)
-        final_output_a = os.path.join("output", f"{title}_final_song_plana_{timestamp}.wav")
-        final_output_a = os.path.abspath(final_output_a)
-        mixed_audio_a.export(final_output_a, format="wav")
-        print(f"Final Plan A audio saved: {final_output_a}")
-
-        if os.path.exists(temp_midi_file_a):
-            os.remove(temp_midi_file_a)
+        mixed_audio_a, final_output_a = render_plan(config, title, timestamp, "plana", recitation_audio, pm_a)
 
         # --- Plan B: Convert MIDI to WAV and Mix ---
-        temp_midi_file_b = os.path.join("output", f"{title}_temp_planb_{timestamp}.mid")
-        melody_wav_file_b = os.path.join("output", f"{title}_melody_planb_{timestamp}.wav")
-        melody_audio_b = midi_to_wav(pm_b, temp_midi_file_b, melody_wav_file_b, soundfont_path, ffmpeg_bin_path)
-
-        mixed_audio_b = mix_audio(recitation_audio, melody_audio_b, recitation_volume, melody_volume)
-        final_output_b = os.path.join("output", f"{title}_final_song_planb_{timestamp}.wav")
-        final_output_b = os.path.abspath(final_output_b)
-        mixed_audio_b.export(final_output_b, format="wav")
-        print(f"Final Plan B audio saved: {final_output_b}")
-
-        if os.path.exists(temp_midi_file_b):
-            os.remove(temp_midi_file_b)
+        mixed_audio_b, final_output_b = render_plan(config, title, timestamp, "planb", recitation_audio, pm_b)
 
         print("\n=== Music Synthesis Results ===")
         print(f"Plan A Final Audio: {final_output_a}")
@@ -1,8 +1,11 @@
 # src/nlp_analysis.py
 from textblob import TextBlob
-from transformers import pipeline
-from keybert import KeyBERT
 import pronouncing
+from contextlib import nullcontext
+from src.model_residency import get_model_manager
+from src.thread_budget import apply_framework_threads
+from src.theme_classification import classify_themes
+from src.sentiment_batch import analyze_sentiment_batch
 
 def analyze_sentiment(poem_text, sentiment_threshold):
     """Analyze sentiment of poem text using TextBlob."""
@@ -18,16 +21,44 @@ def analyze_sentiment(poem_text, sentiment_threshold):
         print(f"[Warning] Sentiment analysis failed: {e}")
         return "Neutral"
 
+def analyze_corpus_sentiment(config, poems):
+    """
+    Label the sentiment of a whole corpus with one sparse lexicon product.
+
+    Args:
+        config (dict): nlp_analysis configuration dictionary.
+        poems (list): Poem dictionaries.
+
+    Returns:
+        list: Poems with "sentiment" set.
+    """
+    labels = analyze_sentiment_batch([" ".join(p["lines"]) for p in poems], config["sentiment_threshold"])
+    for poem, label in zip(poems, labels):
+        poem["sentiment"] = label
+    return poems
+
+def emotion_model(model_name, device):
+    """Acquire the Hugging Face emotion pipeline through the model residency manager."""
+    def load():
+        # Imported here so that a process using the torch worker never loads torch itself
+        from transformers import pipeline
+        return pipeline("text-classification", model=model_name, top_k=None, device=device)
+    apply_framework_threads("torch", "emotion")
+    return get_model_manager().acquire(f"emotion:{model_name}:{device}", load)
+
+def keyword_model(model_name):
+    """Acquire the KeyBERT model through the model residency manager."""
+    def load():
+        from keybert import KeyBERT
+        return KeyBERT(model=model_name)
+    apply_framework_threads("torch", "keywords")
+    return get_model_manager().acquire(f"keybert:{model_name}", load)
+
 def classify_emotion(poem_text, model_name, device):
     """Classify emotion of poem text using a Hugging Face pipeline."""
     try:
-        emotion_classifier = pipeline(
-            "text-classification",
-            model=model_name,
-            top_k=None,
-            device=device
-        )
-        result_list = emotion_classifier(poem_text[:512])
+        with emotion_model(model_name, device) as emotion_classifier:
+            result_list = emotion_classifier(poem_text[:512])
         if result_list and isinstance(result_list[0], list):
             top = max(result_list[0], key=lambda x: x["score"])
             return top["label"].capitalize()
@@ -38,20 +69,88 @@ def classify_emotion(poem_text, model_name, device):
         print(f"[Warning] Emotion classification failed: {e}")
     return "Unknown"
 
-def extract_keywords_and_theme(poem_text, kw_model, top_n, theme_categories):
-    """Extract keywords and theme from poem text using KeyBERT."""
+def extract_keywords_and_theme(poem_text, kw_model, top_n, theme_categories, theme_options=None):
+    """Extract keywords with KeyBERT and classify the theme against category centroids."""
+    theme_options = theme_options or {}
     try:
         keywords = kw_model.extract_keywords(poem_text, top_n=top_n)
         poem_keywords = [kw[0].lower() for kw in keywords]
-        theme = "Other"
-        for t, word_list in theme_categories.items():
-            if any(word in poem_keywords for word in word_list):
-                theme = t
-                break
-        return poem_keywords, theme
+        source = poem_text
+        if theme_options.get("source") == "keywords" and poem_keywords:
+            source = " ".join(poem_keywords)
+        themes, scores = classify_themes(
+            kw_model,
+            [source],
+            theme_categories,
+            model_name=theme_options.get("model_name", "default"),
+            min_similarity=theme_options.get("min_similarity", 0.2),
+            temperature=theme_options.get("temperature", 0.05)
+        )
+        return poem_keywords, themes[0], scores[0]
     except Exception as e:
         print(f"[Warning] Keyword extraction failed: {e}")
-        return [], "Other"
+        return [], "Other", {}
+
+def get_theme_options(config):
+    """Collect the theme classifier settings from the nlp_analysis config."""
+    return {
+        "model_name": config.get("keyword_model", "all-MiniLM-L6-v2"),
+        "source": config.get("theme_source", "document"),
+        "min_similarity": config.get("theme_min_similarity", 0.2),
+        "temperature": config.get("theme_temperature", 0.05)
+    }
+
+def extract_corpus_keywords(config, poems, kw_model=None):
+    """
+    Extract the KeyBERT keywords of a list of poems with one model acquisition.
+
+    Args:
+        config (dict): nlp_analysis configuration dictionary.
+        poems (list): Poem dictionaries.
+        kw_model (KeyBERT, optional): Already loaded KeyBERT model.
+
+    Returns:
+        list: Poems with "keywords" set.
+    """
+    options = get_theme_options(config)
+    with nullcontext(kw_model) if kw_model else keyword_model(options["model_name"]) as kw_model:
+        for poem in poems:
+            try:
+                keywords = kw_model.extract_keywords(" ".join(poem["lines"]), top_n=config["keyword_top_n"])
+                poem["keywords"] = [kw[0].lower() for kw in keywords]
+            except Exception as e:
+                print(f"[Warning] Keyword extraction failed: {e}")
+                poem["keywords"] = []
+    return poems
+
+def classify_corpus_themes(config, poems, kw_model=None):
+    """
+    Classify the themes of a whole corpus in batched matrix products.
+
+    Args:
+        config (dict): nlp_analysis configuration dictionary.
+        poems (list): Poem dictionaries; uses "keywords" when theme_source is "keywords".
+        kw_model (KeyBERT, optional): Already loaded KeyBERT model.
+
+    Returns:
+        list: Poems with "theme" and "theme_confidence" set.
+    """
+    options = get_theme_options(config)
+    if options["source"] == "keywords":
+        texts = [" ".join(p.get("keywords", [])) or " ".join(p["lines"]) for p in poems]
+    else:
+        texts = [" ".join(p["lines"]) for p in poems]
+    with nullcontext(kw_model) if kw_model else keyword_model(options["model_name"]) as kw_model:
+        themes, scores = classify_themes(
+            kw_model, texts, config["theme_categories"],
+            model_name=options["model_name"],
+            min_similarity=options["min_similarity"],
+            temperature=options["temperature"]
+        )
+    for poem, theme, score in zip(poems, themes, scores):
+        poem["theme"] = theme
+        poem["theme_confidence"] = score
+    return poems
 
 def detect_rhyme_scheme(poem_lines):
     """Detect rhyme scheme of poem lines."""
@@ -74,6 +173,19 @@ def detect_rhyme_scheme(poem_lines):
         print(f"[Warning] Rhyme detection failed: {e}")
         return "Free Verse"
 
+def print_analysis(poem):
+    """Print the NLP analysis results of a poem."""
+    print("\n=== NLP Analysis Results ===")
+    print(f"Title: {poem['title']}")
+    print(f"Author: {poem['author']}")
+    print(f"Sentiment: {poem['sentiment']}")
+    print(f"Emotion: {poem['emotion']}")
+    print(f"Keywords: {', '.join(poem['keywords'])}")
+    print(f"Theme: {poem['theme']}")
+    print(f"Theme Confidence: {poem.get('theme_confidence', {})}")
+    print(f"Rhyme Pattern: {poem['rhyme_pattern']}")
+    print("===========================\n")
+
 def process_poem(config, poem):
     """
     Process a single poem to extract NLP features.
@@ -85,29 +197,19 @@ def process_poem(config, poem):
     Returns:
         dict: Poem with added NLP features, or None if failed.
     """
-    # Initialize models
-    kw_model = KeyBERT()
+    theme_options = get_theme_options(config)
 
     try:
         full_text = " ".join(poem["lines"])
         poem["sentiment"] = analyze_sentiment(full_text, config["sentiment_threshold"])
         poem["emotion"] = classify_emotion(full_text, config["emotion_model"], config["device"])
-        poem["keywords"], poem["theme"] = extract_keywords_and_theme(
-            full_text, kw_model, config["keyword_top_n"], config["theme_categories"]
-        )
+        with keyword_model(theme_options["model_name"]) as kw_model:
+            poem["keywords"], poem["theme"], poem["theme_confidence"] = extract_keywords_and_theme(
+                full_text, kw_model, config["keyword_top_n"], config["theme_categories"], theme_options
+            )
         poem["rhyme_pattern"] = detect_rhyme_scheme(poem["lines"])
 
-        # Print NLP analysis results
-        print("\n=== NLP Analysis Results ===")
-        print(f"Title: {poem['title']}")
-        print(f"Author: {poem['author']}")
-        print(f"Sentiment: {poem['sentiment']}")
-        print(f"Emotion: {poem['emotion']}")
-        print(f"Keywords: {', '.join(poem['keywords'])}")
-        print(f"Theme: {poem['theme']}")
-        print(f"Rhyme Pattern: {poem['rhyme_pattern']}")
-        print("===========================\n")
-
+        print_analysis(poem)
         return poem
     except Exception as e:
         print(f"[Error] Failed to process poem: {e}")
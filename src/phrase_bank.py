@@ -0,0 +1,213 @@
+# src/phrase_bank.py
+import os
+import json
+import time
+import random
+import argparse
+import numpy as np
+import pretty_midi
+
+# Contour codes stored in the bank
+CONTOURS = ["ascending", "descending", "smooth", "variable"]
+
+# melody_shape from map_emotion -> bank contour
+SHAPE_TO_CONTOUR = {
+    "ascending": "ascending",
+    "descending": "descending",
+    "smooth": "smooth",
+    "abrupt": "variable",
+    "variable": "variable",
+    "unstable": "variable",
+    "irregular": "variable"
+}
+
+# Loaded banks keyed by absolute path, with the modification time of the file they were read from
+_BANKS = {}
+
+# Consecutive batches without a single non-empty phrase before sampling gives up
+MAX_EMPTY_BATCHES = 10
+
+def classify_contour(pitches):
+    """
+    Classify a phrase's pitch contour.
+
+    Ascending/descending compare the mean pitch of the second half of the
+    phrase with the first half; otherwise a phrase moving by small steps is
+    smooth and anything else is variable.
+    """
+    if len(pitches) < 2:
+        return "smooth"
+    half = len(pitches) // 2
+    drift = np.mean(pitches[half:]) - np.mean(pitches[:half])
+    if drift >= 2:
+        return "ascending"
+    if drift <= -2:
+        return "descending"
+    if np.max(np.abs(np.diff(pitches))) <= 4:
+        return "smooth"
+    return "variable"
+
+def sequence_to_phrase(sequence, step_seconds):
+    """Quantize a sampled NoteSequence to (pitches, start steps, end steps, velocities) arrays."""
+    notes = sorted(sequence.notes, key=lambda n: (n.start_time, n.pitch))
+    pitches = np.array([n.pitch for n in notes], dtype=np.int16)
+    starts = np.array([round(n.start_time / step_seconds) for n in notes], dtype=np.int16)
+    ends = np.array([max(round(n.end_time / step_seconds), s + 1) for n, s in zip(notes, starts)], dtype=np.int16)
+    velocities = np.array([n.velocity for n in notes], dtype=np.int16)
+    return pitches, starts, ends, velocities
+
+def build_phrase_bank(config, num_phrases, output_path, steps=32, batch_size=64, temperature=0.5):
+    """
+    Pre-sample a bank of cat-mel_2bar_big phrases and store it as a compressed .npz file.
+
+    Notes of all phrases are stored in flat int8/uint8 arrays addressed by an
+    offsets array, alongside per-phrase contour, pitch range and note density.
+
+    Args:
+        config (dict): melody_generation configuration dictionary.
+        num_phrases (int): Number of phrases to sample.
+        output_path (str): Path of the .npz file to write.
+        steps (int): Length of each phrase in 16th-note steps (32 = 2 bars).
+        batch_size (int): MusicVAE sampling batch size.
+        temperature (float): MusicVAE sampling temperature.
+
+    Returns:
+        int: Number of non-empty phrases stored.
+
+    Raises:
+        RuntimeError: If MAX_EMPTY_BATCHES batches in a row sample only empty phrases.
+    """
+    from src.melody_generation import load_musicvae_model
+
+    model = load_musicvae_model(config, batch_size=batch_size)
+    start = time.perf_counter()
+    phrases = []
+    step_seconds = None
+    empty_batches = 0
+    while len(phrases) < num_phrases:
+        sampled = len(phrases)
+        for sequence in model.sample(n=batch_size, length=steps, temperature=temperature):
+            qpm = sequence.tempos[0].qpm if sequence.tempos else 120.0
+            step_seconds = 60.0 / qpm / 4
+            phrase = sequence_to_phrase(sequence, step_seconds)
+            if len(phrase[0]):
+                phrases.append(phrase)
+        empty_batches = empty_batches + 1 if len(phrases) == sampled else 0
+        if empty_batches >= MAX_EMPTY_BATCHES:
+            raise RuntimeError(f"MusicVAE sampled only empty phrases in {empty_batches} batches in a row "
+                               f"({len(phrases)}/{num_phrases} phrases); try a higher temperature")
+        print(f"Sampled {len(phrases)}/{num_phrases} phrases")
+    phrases = phrases[:num_phrases]
+
+    counts = np.array([len(p[0]) for p in phrases])
+    contour = np.array([CONTOURS.index(classify_contour(p[0])) for p in phrases], dtype=np.uint8)
+    pitch_range = np.array([p[0].max() - p[0].min() for p in phrases], dtype=np.uint8)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    np.savez_compressed(
+        output_path,
+        pitches=np.concatenate([p[0] for p in phrases]).astype(np.int8),
+        starts=np.concatenate([p[1] for p in phrases]).clip(0, 255).astype(np.uint8),
+        ends=np.concatenate([p[2] for p in phrases]).clip(0, 255).astype(np.uint8),
+        velocities=np.concatenate([p[3] for p in phrases]).astype(np.uint8),
+        offsets=np.concatenate(([0], np.cumsum(counts))).astype(np.int32),
+        contour=contour,
+        pitch_range=pitch_range,
+        density=(counts / steps).astype(np.float16),
+        steps=np.int16(steps),
+        step_seconds=np.float32(step_seconds or 0.125)
+    )
+    print(f"Phrase bank saved: {output_path} ({len(phrases)} phrases, {time.perf_counter() - start:.1f}s)")
+    return len(phrases)
+
+def load_phrase_bank(path):
+    """Load a phrase bank (again whenever the file changes) and index phrase ids by contour."""
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    if path not in _BANKS or _BANKS[path][0] != mtime:
+        with np.load(path) as data:
+            bank = {key: data[key] for key in data.files}
+        bank["index"] = {name: np.flatnonzero(bank["contour"] == code) for code, name in enumerate(CONTOURS)}
+        _BANKS[path] = (mtime, bank)
+    return _BANKS[path][1]
+
+def select_phrases(bank, contour, count, rng, max_range=None, min_density=None, max_density=None):
+    """
+    Pick phrase ids matching a contour and optional range/density limits.
+
+    Falls back to the whole bank when no phrase matches.
+    """
+    candidates = bank["index"].get(contour, np.arange(len(bank["contour"])))
+    mask = np.ones(len(candidates), dtype=bool)
+    if max_range is not None:
+        mask &= bank["pitch_range"][candidates] <= max_range
+    if min_density is not None:
+        mask &= bank["density"][candidates] >= min_density
+    if max_density is not None:
+        mask &= bank["density"][candidates] <= max_density
+    candidates = candidates[mask]
+    if not len(candidates):
+        candidates = np.arange(len(bank["contour"]))
+    return [int(candidates[rng.randrange(len(candidates))]) for _ in range(count)]
+
+def assemble_melody(bank, music_params, recitation_length, rng=None, bank_filters=None):
+    """
+    Assemble a Plan B melody from bank phrases matching melody_shape.
+
+    Phrases are laid end to end, transposed by base_note - 60 and stretched
+    to the recitation length, like the MusicVAE path.
+
+    Args:
+        bank (dict): Phrase bank from load_phrase_bank.
+        music_params (dict): Music parameters with base_note and melody_shape.
+        recitation_length (float): Recitation length in seconds.
+        rng (random.Random, optional): Random generator.
+        bank_filters (dict, optional): max_range / min_density / max_density limits.
+
+    Returns:
+        PrettyMIDI: Melody on a single piano track.
+    """
+    rng = rng or random
+    steps = int(bank["steps"])
+    step_seconds = float(bank["step_seconds"])
+    segment_duration = steps * step_seconds
+    num_segments = max(1, int(recitation_length / segment_duration))
+    contour = SHAPE_TO_CONTOUR.get(music_params.get("melody_shape", "smooth"), "variable")
+    phrase_ids = select_phrases(bank, contour, num_segments, rng, **(bank_filters or {}))
+
+    transpose = music_params["base_note"] - 60
+    pm = pretty_midi.PrettyMIDI()
+    instrument = pretty_midi.Instrument(program=0)  # Default to piano
+    offsets = bank["offsets"]
+    for segment, phrase_id in enumerate(phrase_ids):
+        lo, hi = offsets[phrase_id], offsets[phrase_id + 1]
+        pitches = np.clip(bank["pitches"][lo:hi].astype(np.int16) + transpose, 0, 127)
+        starts = (bank["starts"][lo:hi] + segment * steps) * step_seconds
+        ends = (bank["ends"][lo:hi] + segment * steps) * step_seconds
+        for pitch, start, end, velocity in zip(pitches.tolist(), starts.tolist(), ends.tolist(),
+                                               bank["velocities"][lo:hi].tolist()):
+            instrument.notes.append(pretty_midi.Note(velocity=velocity, pitch=pitch, start=start, end=end))
+    pm.instruments.append(instrument)
+
+    # Adjust total duration to match recitation_length
+    current_duration = pm.get_end_time()
+    if current_duration > 0:
+        scale_factor = recitation_length / current_duration
+        for note in instrument.notes:
+            note.start *= scale_factor
+            note.end *= scale_factor
+    return pm
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-sample a MusicVAE phrase bank for Plan B.")
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("--size", type=int, default=20000, help="Number of phrases to sample")
+    parser.add_argument("--output", help="Output .npz path (defaults to melody_generation.phrase_bank_path)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--temperature", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        melody_config = json.load(f)["melody_generation"]
+    output_path = args.output or melody_config.get("phrase_bank_path", "data/phrase_bank.npz")
+    build_phrase_bank(melody_config, args.size, output_path,
+                      batch_size=args.batch_size, temperature=args.temperature)
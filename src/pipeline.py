@@ -0,0 +1,292 @@
+# src/pipeline.py
+import os
+from datetime import datetime
+from src import nlp_analysis
+from src import music_mapping
+from src import recitation_generation
+from src import melody_generation
+from src import music_synthesis
+from src.audio_format import get_audio_format
+from src.framework_workers import get_framework_workers
+from src.poem_record import PoemRecord
+from src.thread_budget import make_fluidsynth
+from src.stage_scheduler import Stage, StageError, StageCache, run_stage_graph, print_run_report
+
+# Error message printed by main.py when a stage fails
+STAGE_ERRORS = {
+    "sentiment": "NLP analysis failed",
+    "emotion": "NLP analysis failed",
+    "keywords": "NLP analysis failed",
+    "rhyme": "NLP analysis failed",
+    "analysis": "NLP analysis failed",
+    "mapping": "Music mapping failed",
+    "recitation": "Recitation generation failed",
+    "plan_a": "Melody generation failed",
+    "plan_b": "Melody generation failed",
+    "synthesis_a": "Music synthesis failed",
+    "synthesis_b": "Music synthesis failed"
+}
+
+def _full_text(poem):
+    return " ".join(poem["lines"])
+
+def stage_settings(config):
+    """
+    Settings the NLP and mapping stages depend on.
+
+    They are passed to the graph as initial values and declared as stage
+    inputs, so they are part of each stage's cache key: changing the
+    threshold, a model, the theme lists or the mapping overrides recomputes
+    the stages that use them instead of returning cached results.
+
+    Returns:
+        dict: Initial values "sentiment_settings", "emotion_settings",
+            "keyword_settings" and "mapping_settings".
+    """
+    nlp_config = config["nlp_analysis"]
+    return {
+        "sentiment_settings": {"sentiment_threshold": nlp_config["sentiment_threshold"]},
+        "emotion_settings": {"emotion_model": nlp_config["emotion_model"], "device": nlp_config["device"]},
+        "keyword_settings": {
+            "keyword_top_n": nlp_config["keyword_top_n"],
+            "theme_categories": nlp_config["theme_categories"],
+            "theme_options": nlp_analysis.get_theme_options(nlp_config)
+        },
+        "mapping_settings": {"overrides": config.get("music_mapping", {}).get("overrides", {})}
+    }
+
+def build_stage_graph(config):
+    """
+    Express the five pipeline steps as a graph of stages with declared inputs and outputs.
+
+    NLP sub-tasks only read the poem text, so they run alongside each other and
+    alongside recitation (which only reads the lines). Both melody plans need
+    the music params and the recitation length; each plan is synthesized as
+    soon as its own melody exists.
+
+    Melody and synthesis stages are not cacheable: melodies are sampled at
+    random, so re-running them is how a new arrangement is produced.
+
+    With music_synthesis.block_rendering enabled, recitation is streamed to a
+    WAV file and each plan is mixed window by window, so peak memory does not
+    depend on the length of the poem.
+
+    With music_synthesis.stem_rendering enabled (and block rendering off),
+    each plan's melody is split across the mapped instruments and every track
+    is rendered as its own cached stem (see src/stem_rendering.py).
+
+    With pipeline.framework_workers enabled, emotion and keywords run in the
+    torch worker and Plan B in the TensorFlow worker, which also renders the
+    Plan B melody and hands it back through shared memory.
+
+    Args:
+        config (dict): Full configuration dictionary.
+
+    Returns:
+        list: Stage objects.
+    """
+    recitation_config = config.get("recitation_generation", {})
+    melody_config = config.get("melody_generation", {})
+    synthesis_config = config.get("music_synthesis", {})
+    block_rendering = synthesis_config.get("block_rendering", False)
+    stem_rendering = synthesis_config.get("stem_rendering", False) and not block_rendering
+    workers = get_framework_workers(config)
+    audio_format = get_audio_format(config)
+    soundfont_path = os.path.abspath(synthesis_config.get("soundfont_path", ""))
+
+    def sentiment_stage(poem, sentiment_settings):
+        return {"sentiment": nlp_analysis.analyze_sentiment(_full_text(poem), sentiment_settings["sentiment_threshold"])}
+
+    def emotion_stage(poem, emotion_settings):
+        if workers:
+            return {"emotion": workers["torch"].call("emotion", text=_full_text(poem))}
+        return {"emotion": nlp_analysis.classify_emotion(
+            _full_text(poem), emotion_settings["emotion_model"], emotion_settings["device"]
+        )}
+
+    def keywords_stage(poem, keyword_settings):
+        if workers:
+            keywords, theme, theme_confidence = workers["torch"].call("keywords", text=_full_text(poem))
+            return {"keywords": keywords, "theme": theme, "theme_confidence": theme_confidence}
+        theme_options = keyword_settings["theme_options"]
+        with nlp_analysis.keyword_model(theme_options["model_name"]) as kw_model:
+            keywords, theme, theme_confidence = nlp_analysis.extract_keywords_and_theme(
+                _full_text(poem), kw_model, keyword_settings["keyword_top_n"], keyword_settings["theme_categories"],
+                theme_options
+            )
+        return {"keywords": keywords, "theme": theme, "theme_confidence": theme_confidence}
+
+    def rhyme_stage(poem):
+        return {"rhyme_pattern": nlp_analysis.detect_rhyme_scheme(poem["lines"])}
+
+    def analysis_stage(poem, sentiment, emotion, keywords, theme, theme_confidence, rhyme_pattern):
+        analyzed_poem = PoemRecord.from_dict(poem)
+        analyzed_poem.update(
+            sentiment=sentiment,
+            emotion=emotion,
+            keywords=keywords,
+            theme=theme,
+            theme_confidence=theme_confidence,
+            rhyme_pattern=rhyme_pattern
+        )
+        nlp_analysis.print_analysis(analyzed_poem)
+        return {"analyzed_poem": analyzed_poem}
+
+    def mapping_stage(analyzed_poem, mapping_settings):
+        mapped_poem = music_mapping.process_poem(mapping_settings, analyzed_poem.copy())
+        if not mapped_poem:
+            raise StageError("Music mapping failed")
+        return {"mapped_poem": mapped_poem}
+
+    def recitation_stage(poem, adjust_lyrics, adjust_settings, audio_format):
+        updated_poem, recitation_audio = recitation_generation.process_poem(
+            dict(recitation_config, **adjust_settings), dict(poem), adjust_lyrics, audio_format
+        )
+        if not updated_poem or not recitation_audio:
+            raise StageError("Recitation generation failed")
+        return {
+            "recitation_audio": recitation_audio,
+            "recitation_length": updated_poem["recitation_length"],
+            "adjusted_lyrics": updated_poem.get("adjusted_lyrics")
+        }
+
+    def recitation_file_stage(poem, adjust_lyrics, adjust_settings, run_timestamp, audio_format):
+        title = music_synthesis.sanitize_filename(poem.get("title", "untitled"))
+        os.makedirs(music_synthesis.OUTPUT_DIR, exist_ok=True)
+        recitation_wav = os.path.abspath(music_synthesis.artifact_path(title, run_timestamp, "recitation"))
+        updated_poem, recitation_length = recitation_generation.process_poem_to_file(
+            dict(recitation_config, **adjust_settings), dict(poem), recitation_wav, adjust_lyrics, audio_format
+        )
+        if not updated_poem:
+            raise StageError("Recitation generation failed")
+        return {
+            "recitation_wav": recitation_wav,
+            "recitation_length": recitation_length,
+            "adjusted_lyrics": updated_poem.get("adjusted_lyrics")
+        }
+
+    def plan_a_stage(mapped_poem, recitation_length):
+        return {"pm_a": melody_generation.generate_plan_a(mapped_poem["music_params"], recitation_length)}
+
+    def plan_b_stage(mapped_poem, recitation_length, run_timestamp):
+        if workers:
+            # Block and stem rendering render from the MIDI itself, so only the melody is generated remotely
+            title = None if block_rendering or stem_rendering else music_synthesis.sanitize_filename(mapped_poem.get("title", "untitled"))
+            result = workers["tensorflow"].call(
+                "plan_b", poem=mapped_poem, recitation_length=recitation_length,
+                title=title, timestamp=run_timestamp
+            )
+            return {"pm_b": result["pm"], "melody_audio_b": result["melody_audio"]}
+        return {
+            "pm_b": melody_generation.generate_plan_b(melody_config, mapped_poem, recitation_length),
+            "melody_audio_b": None
+        }
+
+    def make_synthesis_stage(plan, pm_name, suffix):
+        def synthesis_stage(mapped_poem, run_timestamp, recitation_audio, **kwargs):
+            title = music_synthesis.sanitize_filename(mapped_poem.get("title", "untitled"))
+            final_audio, final_path = music_synthesis.render_plan(
+                synthesis_config, title, run_timestamp, plan, recitation_audio, kwargs[pm_name],
+                fs=make_fluidsynth(soundfont_path, audio_format["frame_rate"], f"synthesis_{suffix}"),
+                melody_audio=kwargs.get(f"melody_audio_{suffix}"), audio_format=audio_format,
+                instruments=mapped_poem["music_params"].get("instruments")
+            )
+            return {f"final_audio_{suffix}": final_audio, f"final_path_{suffix}": final_path}
+        return synthesis_stage
+
+    def make_blocked_synthesis_stage(plan, pm_name, suffix):
+        def synthesis_stage(mapped_poem, run_timestamp, recitation_wav, **kwargs):
+            title = music_synthesis.sanitize_filename(mapped_poem.get("title", "untitled"))
+            final_path = music_synthesis.render_plan_blocked(
+                synthesis_config, title, run_timestamp, plan, recitation_wav, kwargs[pm_name],
+                fs=make_fluidsynth(soundfont_path, audio_format["frame_rate"], f"synthesis_{suffix}"),
+                audio_format=audio_format
+            )
+            return {f"final_path_{suffix}": final_path}
+        return synthesis_stage
+
+    stages = [
+        Stage("sentiment", sentiment_stage, ["poem", "sentiment_settings"], ["sentiment"]),
+        Stage("emotion", emotion_stage, ["poem", "emotion_settings"], ["emotion"]),
+        Stage("keywords", keywords_stage, ["poem", "keyword_settings"], ["keywords", "theme", "theme_confidence"]),
+        Stage("rhyme", rhyme_stage, ["poem"], ["rhyme_pattern"]),
+        Stage("analysis", analysis_stage,
+              ["poem", "sentiment", "emotion", "keywords", "theme", "theme_confidence", "rhyme_pattern"],
+              ["analyzed_poem"]),
+        Stage("mapping", mapping_stage, ["analyzed_poem", "mapping_settings"], ["mapped_poem"]),
+        Stage("plan_a", plan_a_stage, ["mapped_poem", "recitation_length"], ["pm_a"], cacheable=False),
+        Stage("plan_b", plan_b_stage, ["mapped_poem", "recitation_length", "run_timestamp"],
+              ["pm_b", "melody_audio_b"], cacheable=False)
+    ]
+    if block_rendering:
+        return stages + [
+            Stage("recitation", recitation_file_stage, ["poem", "adjust_lyrics", "adjust_settings", "run_timestamp", "audio_format"],
+                  ["recitation_wav", "recitation_length", "adjusted_lyrics"], cacheable=False),
+            Stage("synthesis_a", make_blocked_synthesis_stage("plana", "pm_a", "a"),
+                  ["mapped_poem", "run_timestamp", "recitation_wav", "pm_a"],
+                  ["final_path_a"], cacheable=False),
+            Stage("synthesis_b", make_blocked_synthesis_stage("planb", "pm_b", "b"),
+                  ["mapped_poem", "run_timestamp", "recitation_wav", "pm_b"],
+                  ["final_path_b"], cacheable=False)
+        ]
+    return stages + [
+        Stage("recitation", recitation_stage, ["poem", "adjust_lyrics", "adjust_settings", "audio_format"],
+              ["recitation_audio", "recitation_length", "adjusted_lyrics"]),
+        Stage("synthesis_a", make_synthesis_stage("plana", "pm_a", "a"),
+              ["mapped_poem", "run_timestamp", "recitation_audio", "pm_a"],
+              ["final_audio_a", "final_path_a"], cacheable=False),
+        Stage("synthesis_b", make_synthesis_stage("planb", "pm_b", "b"),
+              ["mapped_poem", "run_timestamp", "recitation_audio", "pm_b", "melody_audio_b"],
+              ["final_audio_b", "final_path_b"], cacheable=False)
+    ]
+
+def stage_cache_max_bytes(pipeline_config):
+    """Size limit of the on-disk stage cache from pipeline.stage_cache_max_mb (None: unlimited)."""
+    max_mb = pipeline_config.get("stage_cache_max_mb")
+    return int(max_mb * 1024 * 1024) if max_mb else None
+
+def run_pipeline(config, poem, adjust_lyrics, cache=None, on_stage_done=None, run_tag=None):
+    """
+    Run the full pipeline for one poem through the stage scheduler.
+
+    Args:
+        config (dict): Full configuration dictionary.
+        poem (dict): Poem dictionary with title, author and lines.
+        adjust_lyrics (bool): Whether to adjust the lyrics before recitation.
+        cache (StageCache, optional): Cache used to skip stages with unchanged inputs.
+        on_stage_done (callable, optional): Called with (name, outputs, timing) as each stage completes.
+        run_tag (str, optional): Used in artifact names instead of the run timestamp
+            (corpus runs use the poem ID so names never collide).
+
+    Returns:
+        dict: Run report from run_stage_graph, with "poem" set to the final PoemRecord.
+    """
+    pipeline_config = config.get("pipeline", {})
+    if cache is None and pipeline_config.get("stage_cache_dir"):
+        cache = StageCache(pipeline_config["stage_cache_dir"], max_bytes=stage_cache_max_bytes(pipeline_config))
+
+    report = run_stage_graph(
+        build_stage_graph(config),
+        {
+            "poem": poem,
+            "adjust_lyrics": adjust_lyrics,
+            "adjust_settings": recitation_generation.adjust_settings(config["recitation_generation"]),
+            "run_timestamp": run_tag or datetime.now().strftime("%Y%m%d_%H%M%S"),
+            "audio_format": get_audio_format(config),
+            **stage_settings(config)
+        },
+        max_workers=pipeline_config.get("max_workers", 4),
+        cache=cache,
+        on_stage_done=on_stage_done
+    )
+
+    values = report["values"]
+    final_poem = (values.get("mapped_poem") or PoemRecord.from_dict(poem)).copy()
+    if "recitation_length" in values:
+        final_poem["recitation_length"] = values["recitation_length"]
+    if values.get("adjusted_lyrics"):
+        final_poem["adjusted_lyrics"] = values["adjusted_lyrics"]
+    report["poem"] = final_poem
+
+    print_run_report(report)
+    return report
@@ -0,0 +1,313 @@
+# src/poem_index.py
+import os
+import json
+import time
+import argparse
+import numpy as np
+from src.data_processing import poem_content_hash
+from src.bulk_ingest import load_corpus, write_json_atomic
+from src.theme_classification import embed_texts, _normalize_rows
+from src.nlp_analysis import keyword_model, get_theme_options
+
+# Rows scored per matrix product; bounds the working set of a query over a memory-mapped matrix
+BLOCK_ROWS = 65536
+
+EMBEDDINGS_FILE = "embeddings.npy"
+META_FILE = "meta.json"
+IVF_FILE = "ivf.npz"
+
+def poem_text(poem):
+    """Text embedded for a poem: its title and lines."""
+    return f"{poem.get('title', '')}. " + " ".join(poem.get("lines", []))
+
+def exact_top_k(matrix, queries, k, exclude=None, block_rows=BLOCK_ROWS):
+    """
+    Exact top-k cosine search over all rows, one block of rows at a time.
+
+    Each block is scored for every query in one matrix product and merged
+    into the running top k with argpartition, so memory stays bounded by the
+    block size however large the (memory-mapped) matrix is.
+
+    Args:
+        matrix (np.ndarray): Normalized row vectors (n, dim), possibly a memmap.
+        queries (np.ndarray): Normalized query vectors (q, dim).
+        k (int): Number of results per query.
+        exclude (list, optional): Row to leave out for each query (e.g. the query poem itself), or None.
+        block_rows (int): Rows per matrix product.
+
+    Returns:
+        tuple: (row indices (q, k), similarities (q, k)), best first.
+    """
+    n = len(matrix)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, n, block_rows):
+        block = np.asarray(matrix[start:start + block_rows])
+        scores = queries @ block.T
+        for q, row in enumerate(exclude or []):
+            if row is not None and start <= row < start + len(block):
+                scores[q, row - start] = -np.inf
+        top = min(k, scores.shape[1])
+        rows = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+        best_scores = np.concatenate([best_scores, np.take_along_axis(scores, rows, axis=1)], axis=1)
+        best_rows = np.concatenate([best_rows, rows + start], axis=1)
+        if best_scores.shape[1] > k:
+            keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+def build_ivf(matrix, n_lists, iterations=10, sample_size=100000, seed=0, block_rows=BLOCK_ROWS):
+    """
+    Build an inverted-file index: spherical k-means centroids and the rows of each list.
+
+    Centroids are trained on a sample; every row is then assigned to its
+    nearest centroid block by block.
+
+    Returns:
+        tuple: (centroids (n_lists, dim), row order grouped by list, list offsets (n_lists + 1)).
+    """
+    rng = np.random.default_rng(seed)
+    n = len(matrix)
+    n_lists = min(n_lists, n)
+    sample = np.asarray(matrix[np.sort(rng.choice(n, min(n, sample_size), replace=False))])
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = np.bincount(assignments, minlength=n_lists) == 0
+        sums[empty] = centroids[empty]  # keep centroids that attracted no rows
+        centroids = _normalize_rows(sums)
+
+    assignments = np.concatenate([
+        np.argmax(np.asarray(matrix[start:start + block_rows]) @ centroids.T, axis=1)
+        for start in range(0, n, block_rows)
+    ])
+    order = np.argsort(assignments, kind="stable")
+    offsets = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+    return centroids.astype(np.float32), order, offsets
+
+class PoemIndex:
+    """
+    Similar-poem search over a memory-mapped embedding matrix.
+
+    The index directory holds embeddings.npy (normalized float32 rows, opened
+    with mmap so only the pages a search touches are read), meta.json (the
+    embedding model and the poem ID of each row) and optionally ivf.npz.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.matrix = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        self.poem_ids = self.meta["poem_ids"]
+        self.rows = {poem_id: row for row, poem_id in enumerate(self.poem_ids)}
+        self.ivf = None
+        ivf_path = os.path.join(index_dir, IVF_FILE)
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as data:
+                self.ivf = {name: data[name] for name in ("centroids", "order", "offsets")}
+
+    def __len__(self):
+        return len(self.poem_ids)
+
+    def search_vectors(self, queries, k=10, exclude=None, n_probe=None):
+        """
+        Return the k most similar poems for each query vector.
+
+        Uses the IVF index when it exists and n_probe is given (approximate:
+        only the n_probe nearest lists are scored); otherwise scores every row.
+
+        Returns:
+            list: For each query, a list of (poem ID, similarity) pairs, best first.
+        """
+        queries = _normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if self.ivf is not None and n_probe:
+            results = [self._search_ivf(query, k, row, n_probe)
+                       for query, row in zip(queries, exclude or [None] * len(queries))]
+        else:
+            rows, scores = exact_top_k(self.matrix, queries, k, exclude)
+            results = list(zip(rows.tolist(), scores.tolist()))
+        return [[(self.poem_ids[r], float(s)) for r, s in zip(rows, scores) if np.isfinite(s)]
+                for rows, scores in results]
+
+    def _search_ivf(self, query, k, exclude, n_probe):
+        centroids, order, offsets = self.ivf["centroids"], self.ivf["order"], self.ivf["offsets"]
+        lists = np.argsort(-(centroids @ query))[:n_probe]
+        rows = np.sort(np.concatenate([order[offsets[l]:offsets[l + 1]] for l in lists]))
+        if exclude is not None:
+            rows = rows[rows != exclude]
+        if not len(rows):
+            return [], []
+        scores = np.asarray(self.matrix[rows]) @ query
+        top = np.argsort(-scores)[:k]
+        return rows[top].tolist(), scores[top].tolist()
+
+    def similar_to(self, poem_id, k=10, n_probe=None):
+        """Return the k poems most similar to an indexed poem (excluding itself)."""
+        row = self.rows[poem_id]
+        return self.search_vectors(np.asarray(self.matrix[row])[None, :], k, exclude=[row], n_probe=n_probe)[0]
+
+    def search_text(self, text, k=10, n_probe=None):
+        """Embed a free-text query with the index's model and return the k most similar poems."""
+        with keyword_model(self.meta["model_name"]) as kw_model:
+            query = embed_texts(kw_model, [text])
+        return self.search_vectors(query, k, n_probe=n_probe)[0]
+
+def build_poem_index(poems, index_dir, model_name, batch_size=256, ivf_lists=None):
+    """
+    Embed every poem once and write the memory-mapped index.
+
+    Rows of an existing index built with the same model are reused by poem
+    ID, so rebuilding after adding poems only embeds the new ones. The matrix
+    is written to a temporary file and swapped in atomically. An empty
+    corpus raises ValueError, leaving any existing index in place.
+
+    Args:
+        poems (list): Corpus poems.
+        index_dir (str): Directory of the index.
+        model_name (str): Sentence-embedding model (the KeyBERT model).
+        batch_size (int): Poems embedded per batch.
+        ivf_lists (int, optional): Number of IVF lists to build for approximate search.
+
+    Returns:
+        dict: Build statistics.
+    """
+    if not poems:
+        raise ValueError("Cannot build a poem index from an empty corpus")
+    start = time.perf_counter()
+    os.makedirs(index_dir, exist_ok=True)
+    poem_ids = list(dict.fromkeys(poem_content_hash(p) for p in poems))
+    by_id = {poem_content_hash(p): p for p in poems}
+
+    previous = None
+    if os.path.exists(os.path.join(index_dir, META_FILE)):
+        previous = PoemIndex(index_dir)
+        if previous.meta["model_name"] != model_name:
+            previous = None
+    missing = [poem_id for poem_id in poem_ids if previous is None or poem_id not in previous.rows]
+
+    new_vectors = {}
+    if missing:
+        with keyword_model(model_name) as kw_model:
+            for offset in range(0, len(missing), batch_size):
+                batch = missing[offset:offset + batch_size]
+                vectors = _normalize_rows(embed_texts(kw_model, [poem_text(by_id[i]) for i in batch]))
+                new_vectors.update(zip(batch, vectors))
+    dim = len(next(iter(new_vectors.values()))) if new_vectors else previous.matrix.shape[1]
+
+    tmp_path = os.path.join(index_dir, EMBEDDINGS_FILE + ".tmp")
+    matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(len(poem_ids), dim))
+    for row, poem_id in enumerate(poem_ids):
+        matrix[row] = new_vectors[poem_id] if poem_id in new_vectors else previous.matrix[previous.rows[poem_id]]
+    matrix.flush()
+    del matrix, previous
+    os.replace(tmp_path, os.path.join(index_dir, EMBEDDINGS_FILE))
+    write_json_atomic(os.path.join(index_dir, META_FILE), {"model_name": model_name, "poem_ids": poem_ids})
+
+    ivf_path = os.path.join(index_dir, IVF_FILE)
+    if ivf_lists:
+        centroids, order, offsets = build_ivf(np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r"), ivf_lists)
+        with open(ivf_path + ".tmp", "wb") as f:
+            np.savez(f, centroids=centroids, order=order, offsets=offsets)
+        os.replace(ivf_path + ".tmp", ivf_path)
+    elif os.path.exists(ivf_path):
+        os.remove(ivf_path)  # an IVF index of the old rows would point at the wrong poems
+
+    stats = {"poems": len(poem_ids), "embedded": len(missing), "reused": len(poem_ids) - len(missing),
+             "dim": dim, "ivf_lists": ivf_lists, "seconds": round(time.perf_counter() - start, 3)}
+    print("\n=== Poem Index Build ===")
+    print(f"Poems Indexed: {stats['poems']} ({stats['embedded']} embedded, {stats['reused']} reused)")
+    print(f"Dimensions: {dim}")
+    if ivf_lists:
+        print(f"IVF Lists: {ivf_lists}")
+    print(f"Time: {stats['seconds']:.2f} seconds")
+    print("========================\n")
+    return stats
+
+# Loaded indexes keyed by directory and embeddings file modification time
+_INDEX_CACHE = {}
+
+# Corpus position of each poem ID, for the corpus list last searched
+_POSITIONS = {"corpus": None, "positions": {}}
+
+def load_poem_index(config):
+    """
+    Return the poem index configured by nlp_analysis.poem_index_dir, or None if it has not been built.
+
+    The index is loaded once and reloaded when it is rebuilt.
+    """
+    index_dir = config.get("poem_index_dir")
+    embeddings_path = os.path.join(index_dir or "", EMBEDDINGS_FILE)
+    if not index_dir or not os.path.exists(embeddings_path):
+        return None
+    key = (index_dir, os.path.getmtime(embeddings_path))
+    if key not in _INDEX_CACHE:
+        _INDEX_CACHE.clear()
+        _INDEX_CACHE[key] = PoemIndex(index_dir)
+    return _INDEX_CACHE[key]
+
+def similar_poems(config, poetry_data, query=None, poem=None, k=5):
+    """
+    Find corpus poems similar to a text query or to a poem.
+
+    Args:
+        config (dict): nlp_analysis configuration.
+        poetry_data (list): Corpus poems.
+        query (str, optional): Free-text query.
+        poem (dict, optional): Poem to find neighbours of ("poems like this one").
+        k (int): Number of results.
+
+    Returns:
+        list: (corpus index, poem, similarity) tuples, best first; empty if no index is built.
+    """
+    index = load_poem_index(config)
+    if index is None:
+        return []
+    n_probe = config.get("poem_index_probes")
+    poem_id = poem_content_hash(poem) if poem else None
+    if poem_id in index.rows:
+        hits = index.similar_to(poem_id, k, n_probe=n_probe)
+    elif poem is not None:
+        hits = index.search_text(poem_text(poem), k + 1, n_probe=n_probe)
+    else:
+        hits = index.search_text(query, k, n_probe=n_probe)
+    if _POSITIONS["corpus"] is not poetry_data:
+        _POSITIONS.update(corpus=poetry_data, positions={poem_content_hash(p): i for i, p in enumerate(poetry_data)})
+    positions = _POSITIONS["positions"]
+    return [(positions[i], poetry_data[positions[i]], score) for i, score in hits
+            if i in positions and i != poem_id][:k]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the similar-poem index.")
+    parser.add_argument("command", choices=["build", "query", "similar"])
+    parser.add_argument("text", nargs="?", help="Query text (query) or poem title (similar)")
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--ivf-lists", type=int, help="Build an IVF index with this many lists")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        nlp_config = json.load(f)["nlp_analysis"]
+    corpus = load_corpus(nlp_config["input_file"])
+    if args.command == "build":
+        build_poem_index(corpus, nlp_config["poem_index_dir"], get_theme_options(nlp_config)["model_name"],
+                         ivf_lists=args.ivf_lists or nlp_config.get("poem_index_ivf_lists"))
+    else:
+        target = None
+        if args.command == "similar":
+            target = next((p for p in corpus if p.get("title", "").lower() == (args.text or "").lower()), None)
+            if target is None:
+                parser.error(f"No poem titled '{args.text}'")
+        start = time.perf_counter()
+        results = similar_poems(nlp_config, corpus, query=args.text, poem=target, k=args.k)
+        elapsed = (time.perf_counter() - start) * 1000
+        for i, poem, score in results:
+            print(f"{score:.3f}  [{i}] {poem.get('title')} by {poem.get('author')}")
+        print(f"({len(results)} results in {elapsed:.1f} ms)")
@@ -0,0 +1,249 @@
+# src/poem_record.py
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from types import MappingProxyType
+
+# Fields of a poem as the pipeline builds it, in the order they are written out
+FIELDS = ("title", "author", "lines", "linecount", "poem_id", "sentiment", "emotion", "keywords", "theme",
+          "theme_confidence", "rhyme_pattern", "music_params", "analysis_versions",
+          "recitation_length", "adjusted_lyrics")
+_FIELD_SET = frozenset(FIELDS)
+
+# Categorical labels, interned so every record shares one copy of each
+CATEGORICAL_FIELDS = frozenset(("author", "sentiment", "emotion", "theme", "rhyme_pattern"))
+
+# Sequences stored as tuples
+SEQUENCE_FIELDS = frozenset(("lines", "keywords", "adjusted_lyrics"))
+
+# Nested settings shared by every record with the same value (one per mapping combination)
+SHARED_FIELDS = frozenset(("music_params", "analysis_versions"))
+
+# Frozen values by canonical JSON, and theme label tuples, shared by all records in the process
+_SHARED = {}
+_LABEL_SETS = {}
+
+def freeze(value):
+    """Deep read-only copy of a JSON value: dicts become mapping proxies, lists tuples, strings are interned."""
+    if isinstance(value, (dict, MappingProxyType)):
+        return MappingProxyType({sys.intern(k): freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+def thaw(value):
+    """Plain, mutable JSON copy of a frozen value."""
+    if isinstance(value, (dict, MappingProxyType)):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+def shared_value(value):
+    """
+    Return the frozen copy of value shared by every record holding an equal value.
+
+    A corpus has few distinct music_params (one per mapping combination), so
+    records point at one read-only copy each instead of their own nested dicts.
+    """
+    if value is None or isinstance(value, MappingProxyType):
+        return value
+    key = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    frozen = _SHARED.get(key)
+    if frozen is None:
+        frozen = _SHARED.setdefault(key, freeze(value))
+    return frozen
+
+def _pack(field, value):
+    if value is None:
+        return None
+    if field in CATEGORICAL_FIELDS:
+        return sys.intern(value)
+    if field in SHARED_FIELDS:
+        return shared_value(value)
+    if field == "theme_confidence":
+        # Labels are the same theme categories for every poem; only the scores are per record
+        labels = tuple(sys.intern(label) for label in value)
+        return _LABEL_SETS.setdefault(labels, labels), tuple(value.values())
+    if field == "keywords":
+        return tuple(sys.intern(keyword) for keyword in value)
+    if field in SEQUENCE_FIELDS:
+        return tuple(value)
+    return value
+
+class PoemRecord:
+    """
+    Compact poem passed between stages and held per poem in corpus runs.
+
+    Behaves like the poem dict it replaces (record["theme"], record.get(...),
+    record["music_params"] = ...), but stores fields in slots: labels are
+    interned, lines and keywords are tuples, theme scores share one label
+    tuple, and music_params is a read-only value shared by every record
+    with the same mapping. Keys outside FIELDS are kept in a small dict.
+    to_dict() and from_dict() convert to and from the JSON shape.
+    """
+
+    __slots__ = FIELDS + ("extra",)
+
+    def __init__(self, **fields):
+        self.extra = None
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, poem):
+        """Build a record from a poem dict (or another record)."""
+        record = cls()
+        for key in poem.keys():
+            record[key] = poem[key]
+        return record
+
+    def to_dict(self, exclude=()):
+        """Plain JSON-shaped dict of the record, without the keys in exclude."""
+        return {key: thaw(self[key]) for key in self.keys() if key not in exclude}
+
+    def copy(self):
+        """Shallow copy; the stored values are immutable, so it is independent of the original."""
+        record = PoemRecord()
+        for field in self.__slots__:
+            if hasattr(self, field):
+                setattr(record, field, getattr(self, field))
+        record.extra = dict(self.extra) if self.extra else None
+        return record
+
+    def keys(self):
+        keys = [field for field in FIELDS if hasattr(self, field)]
+        return keys + list(self.extra) if self.extra else keys
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                value = getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            if key == "theme_confidence" and value is not None:
+                return dict(zip(*value))
+            return value
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            setattr(self, key, _pack(key, value))
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return hasattr(self, key) if key in _FIELD_SET else bool(self.extra) and key in self.extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, *args, **fields):
+        for key, value in dict(*args, **fields).items():
+            self[key] = value
+
+    def __reduce__(self):
+        # Pickled (stage cache, worker pipes) in the JSON shape; mapping proxies do not pickle
+        return PoemRecord.from_dict, (self.to_dict(),)
+
+    def __repr__(self):
+        return f"PoemRecord(title={self.get('title')!r}, author={self.get('author')!r})"
+
+def _record_hook(value):
+    """json object_hook turning each poem object (it has "lines") into a record as it is parsed."""
+    return PoemRecord.from_dict(value) if "lines" in value and "title" in value else value
+
+def load_records(path):
+    """
+    Load a corpus-shaped JSON file (a list of poems) as PoemRecords.
+
+    Poems are converted as the parser produces them, so the whole file is
+    never held as dicts. A missing file loads as an empty list.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f, object_hook=_record_hook)
+    except FileNotFoundError:
+        return []
+
+def write_records(path, records, transform=None, indent=2):
+    """
+    Stream records to a JSON list file, one converted poem at a time, then atomically replace path.
+
+    Args:
+        path (str): Output file.
+        records (iterable): PoemRecords (or poem dicts).
+        transform (callable, optional): Applied to each poem dict before it is written.
+        indent (int): Indentation of each poem, as in the other corpus files.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        out.write("[")
+        for i, record in enumerate(records):
+            poem = record.to_dict() if isinstance(record, PoemRecord) else dict(record)
+            if transform:
+                poem = transform(poem)
+            text = json.dumps(poem, ensure_ascii=False, indent=indent)
+            if indent:
+                text = "\n".join(" " * indent + line for line in text.split("\n"))
+            out.write(("" if i == 0 else ",") + "\n" + text)
+        out.write("\n]\n")
+    os.replace(tmp_path, path)
+
+def _load_dicts(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def measure_corpus_memory(path):
+    """
+    Compare the memory of a derived corpus file held as dicts and as PoemRecords.
+
+    Returns:
+        dict: Poems, peak and retained megabytes for each representation, and the reduction factor.
+    """
+    results = {}
+    for name, load in (("dicts", _load_dicts), ("records", load_records)):
+        _SHARED.clear()
+        _LABEL_SETS.clear()
+        tracemalloc.start()
+        start = time.perf_counter()
+        poems = load(path)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {"poems": len(poems), "retained_mb": round(retained / 2 ** 20, 2),
+                         "peak_mb": round(peak / 2 ** 20, 2), "seconds": round(time.perf_counter() - start, 3)}
+        del poems
+    results["retained_reduction"] = round(results["dicts"]["retained_mb"] / max(results["records"]["retained_mb"], 1e-9), 2)
+    results["peak_reduction"] = round(results["dicts"]["peak_mb"] / max(results["records"]["peak_mb"], 1e-9), 2)
+
+    print("\n=== Poem Record Memory ===")
+    print(f"Poems: {results['dicts']['poems']} ({path})")
+    for name in ("dicts", "records"):
+        r = results[name]
+        print(f"{name.capitalize()}: {r['retained_mb']} MB retained, {r['peak_mb']} MB peak, {r['seconds']}s to load")
+    print(f"Reduction: {results['retained_reduction']}x retained, {results['peak_reduction']}x peak")
+    print("==========================\n")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure corpus memory as poem dicts vs PoemRecords.")
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("--input", help="Corpus file (defaults to music_mapping.output_file)")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    measure_corpus_memory(args.input or config["music_mapping"]["output_file"])
@@ -1,11 +1,15 @@
 # src/recitation_generation.py
 import os
 import io
+import wave
 from datetime import datetime
 from gtts import gTTS
 from pydub import AudioSegment
 from openai import OpenAI
 import re
+from src.audio_format import silence, format_of
+from src.audio_decoding import decode_clips, in_process_backend, FFMPEG_BATCH_CLIPS
+from src.syllables import get_syllable_settings, syllable_report, print_syllable_report
 
 def sanitize_filename(filename):
     """
@@ -79,31 +83,79 @@ def adjust_lyrics(lines, api_key, model="gpt-3.5-turbo"):
         print(f"[Error] Failed to adjust lyrics with OpenAI: {e}")
         return lines
 
-def generate_recitation(lines):
+def fetch_line_mp3(line):
+    """Synthesize one line with gTTS and return the MP3 bytes."""
+    tts = gTTS(text=line, lang="en")
+    mp3_fp = io.BytesIO()
+    tts.write_to_fp(mp3_fp)
+    return mp3_fp.getvalue()
+
+def synthesize_line(line, audio_format=None):
+    """Synthesize one line with gTTS and decode it to a canonical AudioSegment."""
+    segments, _ = decode_clips([fetch_line_mp3(line)], audio_format)
+    if segments[0] is None:
+        raise RuntimeError("the synthesized audio could not be decoded")
+    return segments[0]
+
+def synthesize_lines(lines, audio_format=None):
+    """
+    Synthesize a group of lines with gTTS and decode them together.
+
+    Returns:
+        list: Canonical AudioSegment per line, or None for a line that failed to synthesize or decode.
+    """
+    clips = []
+    for line in lines:
+        try:
+            clips.append(fetch_line_mp3(line))
+        except Exception as e:
+            print(f"[Warning] Failed to synthesize line '{line}': {e}")
+            clips.append(None)
+    decoded = iter(decode_clips([c for c in clips if c is not None], audio_format)[0])
+    return [next(decoded, None) if clip is not None else None for clip in clips]
+
+def generate_recitation(lines, audio_format=None, pauses=None):
     """
     Generate recitation audio for each line using gTTS.
 
+    All lines are fetched first and decoded together (in-process when a
+    decoder is installed, see src/audio_decoding.py). A line that fails to
+    synthesize or decode is left out, keeping its pause. Each line is converted
+    to the canonical format once, so the recitation is mixed later without
+    further conversion.
+
     Args:
         lines (list): List of lines to synthesize.
+        audio_format (dict, optional): Canonical audio format (see src/audio_format.py).
+        pauses (list, optional): Pause in ms after each line; 0.5s after every line if None.
 
     Returns:
         AudioSegment: Combined recitation audio with pauses.
     """
-    output_segments = []
+    # Fetch every line first so all clips are decoded together
+    clips = []
+    clip_pauses = []
     for i, line in enumerate(lines):
         if not line.strip():
             continue
         try:
-            tts = gTTS(text=line, lang="en")
-            mp3_fp = io.BytesIO()
-            tts.write_to_fp(mp3_fp)
-            mp3_fp.seek(0)
-            segment = AudioSegment.from_file(mp3_fp, format="mp3")
-            output_segments.append(segment)
-            output_segments.append(AudioSegment.silent(duration=500))  # 0.5s pause
+            clips.append(fetch_line_mp3(line))
         except Exception as e:
             print(f"[Warning] Failed to synthesize line {i+1}: {e}")
-            output_segments.append(AudioSegment.silent(duration=500))
+            clips.append(None)
+        clip_pauses.append(pauses[i] if pauses else 500)
+
+    decoded, decoder = decode_clips([c for c in clips if c is not None], audio_format)
+    if decoder:
+        print(f"Decoded {sum(d is not None for d in decoded)} recitation lines with {decoder}")
+
+    decoded = iter(decoded)
+    output_segments = []
+    for clip, pause_ms in zip(clips, clip_pauses):
+        segment = next(decoded, None) if clip is not None else None
+        if segment is not None:
+            output_segments.append(segment)
+        output_segments.append(silence(pause_ms, audio_format))
 
     if not output_segments:
         print("[Error] No audio segments generated")
@@ -111,47 +163,134 @@ def generate_recitation(lines):
 
     return sum(output_segments)
 
-def process_poem(config, poem):
+def generate_recitation_to_file(lines, output_path, audio_format=None, pauses=None):
+    """
+    Generate recitation audio line by line, appending each line to a WAV file.
+
+    With an in-process decoder only one line is held in memory at a time;
+    otherwise lines are synthesized in groups of FFMPEG_BATCH_CLIPS, each
+    decoded by one ffmpeg process. Either way memory use does not grow with
+    the length of the poem. The file is written in the canonical format so
+    it can be mixed block by block with FluidSynth output.
+
+    Args:
+        lines (list): List of lines to synthesize.
+        output_path (str): Path of the WAV file to write.
+        audio_format (dict, optional): Canonical audio format (see src/audio_format.py).
+        pauses (list, optional): Pause in ms after each line; 0.5s after every line if None.
+
+    Returns:
+        float: Recitation length in seconds, or None if no line was synthesized.
+    """
+    pause = silence(500, audio_format)
+    frame_rate = pause.frame_rate
+    total_frames = 0
+    with wave.open(output_path, "wb") as out:
+        out.setnchannels(pause.channels)
+        out.setsampwidth(pause.sample_width)
+        out.setframerate(frame_rate)
+        indices = [i for i, line in enumerate(lines) if line.strip()]
+        group_size = 1 if in_process_backend() else FFMPEG_BATCH_CLIPS
+        for start in range(0, len(indices), group_size):
+            group = indices[start:start + group_size]
+            try:
+                segments = synthesize_lines([lines[i] for i in group], format_of(pause))
+            except Exception as e:
+                print(f"[Warning] Failed to synthesize lines {group[0]+1}-{group[-1]+1}: {e}")
+                segments = [None] * len(group)
+            for i, segment in zip(group, segments):
+                if segment is not None:
+                    out.writeframes(segment.raw_data)
+                    total_frames += int(segment.frame_count())
+                line_pause = silence(pauses[i], format_of(pause)) if pauses else pause  # 0.5s by default
+                out.writeframes(line_pause.raw_data)
+                total_frames += int(line_pause.frame_count())
+
+    if not total_frames:
+        print("[Error] No audio segments generated")
+        return None
+    return total_frames / frame_rate
+
+def configure_ffmpeg(config):
+    """Point pydub at the configured ffmpeg binaries."""
+    ffmpeg_bin_path = config.get("ffmpeg_bin_path", "E:/Program Files/ffmpeg/bin")
+    os.environ["PATH"] += os.pathsep + ffmpeg_bin_path
+    AudioSegment.converter = os.path.join(ffmpeg_bin_path, "ffmpeg.exe")
+    AudioSegment.ffprobe = os.path.join(ffmpeg_bin_path, "ffprobe.exe")
+
+def adjust_settings(config):
+    """Return the config settings that change how lyrics are adjusted (part of the recitation cache key)."""
+    return dict(get_syllable_settings(config), lyric_adjustment=config.get("lyric_adjustment", "local"))
+
+def select_lines(config, poem, adjust):
+    """
+    Return the lines to recite and the pause after each, adjusting them first if requested.
+
+    Adjustment is local by default: the lines keep their words, the pauses
+    are retimed toward the syllable target and lines far from it are flagged
+    (see src/syllables.py). With "lyric_adjustment": "openai" the lines are
+    rewritten by OpenAI instead.
+
+    Returns:
+        tuple: (lines to recite, pause in ms after each line or None for 0.5s),
+            or (None, None) if OpenAI adjustment was requested but is not configured.
+    """
+    if not adjust:
+        return poem["lines"], None
+
+    if config.get("lyric_adjustment", "local") != "openai":
+        settings = get_syllable_settings(config)
+        report = syllable_report(poem["lines"], **settings)
+        poem["syllable_report"] = report
+        print_syllable_report(report, settings["syllable_target"])
+        return poem["lines"], [entry["pause_ms"] for entry in report]
+
+    # Use OpenAI to adjust lyrics
+    api_key = config.get("openai_api_key")
+    model = config.get("openai_model", "gpt-3.5-turbo")
+    if not api_key:
+        print("[Error] OpenAI API key not provided in config")
+        return None, None
+    adjusted_lyrics = adjust_lyrics(poem["lines"], api_key, model)
+    poem["adjusted_lyrics"] = adjusted_lyrics
+    # Print adjusted lyrics
+    print("\n=== Adjusted Lyrics ===")
+    for i, line in enumerate(adjusted_lyrics, 1):
+        print(f"Line {i}: {line}")
+    print("=======================\n")
+    return adjusted_lyrics, None
+
+def ask_adjust_lyrics():
+    """Ask the user whether the lyrics should be adjusted before recitation."""
+    print("\nDo you want to adjust the poem's lyrics for recitation? (e.g., normalize to 8 syllables per line)")
+    return input("Enter 'yes' or 'no': ").strip().lower() == "yes"
+
+def process_poem(config, poem, adjust=None, audio_format=None):
     """
     Generate recitation audio for the poem and calculate its length.
 
     Args:
         config (dict): Configuration dictionary with parameters.
         poem (dict): Poem dictionary with lines and music params.
+        adjust (bool, optional): Whether to adjust the lyrics; asks the user if None.
+        audio_format (dict, optional): Canonical audio format of the recitation.
 
     Returns:
         tuple: (Updated poem dictionary, AudioSegment object) or (None, None) if failed.
     """
     try:
         # Configure ffmpeg
-        ffmpeg_bin_path = config.get("ffmpeg_bin_path", "E:/Program Files/ffmpeg/bin")
-        os.environ["PATH"] += os.pathsep + ffmpeg_bin_path
-        AudioSegment.converter = os.path.join(ffmpeg_bin_path, "ffmpeg.exe")
-        AudioSegment.ffprobe = os.path.join(ffmpeg_bin_path, "ffprobe.exe")
+        configure_ffmpeg(config)
 
         # Ask user if they want to adjust lyrics
-        print("\nDo you want to adjust the poem's lyrics for recitation? (e.g., normalize to 8 syllables per line)")
-        adjust_choice = input("Enter 'yes' or 'no': ").strip().lower()
-        if adjust_choice == "yes":
-            # Use OpenAI to adjust lyrics
-            api_key = config.get("openai_api_key")
-            model = config.get("openai_model", "gpt-3.5-turbo")
-            if not api_key:
-                print("[Error] OpenAI API key not provided in config")
-                return None, None
-            adjusted_lyrics = adjust_lyrics(poem["lines"], api_key, model)
-            poem["adjusted_lyrics"] = adjusted_lyrics
-            lines_to_use = adjusted_lyrics
-            # Print adjusted lyrics
-            print("\n=== Adjusted Lyrics ===")
-            for i, line in enumerate(adjusted_lyrics, 1):
-                print(f"Line {i}: {line}")
-            print("=======================\n")
-        else:
-            lines_to_use = poem["lines"]
+        if adjust is None:
+            adjust = ask_adjust_lyrics()
+        lines_to_use, pauses = select_lines(config, poem, adjust)
+        if lines_to_use is None:
+            return None, None
 
         # Generate recitation audio
-        recitation_audio = generate_recitation(lines_to_use)
+        recitation_audio = generate_recitation(lines_to_use, audio_format, pauses)
         if not recitation_audio:
             return None, None
 
@@ -180,4 +319,41 @@ def process_poem(config, poem):
         return poem, recitation_audio
     except Exception as e:
         print(f"[Error] Failed to generate recitation: {e}")
-        return None, None
\ No newline at end of file
+        return None, None
+
+def process_poem_to_file(config, poem, output_path, adjust=None, audio_format=None):
+    """
+    Generate recitation audio straight into a WAV file (bounded-memory block rendering).
+
+    Args:
+        config (dict): Configuration dictionary with parameters.
+        poem (dict): Poem dictionary with lines.
+        output_path (str): Path of the WAV file to write.
+        adjust (bool, optional): Whether to adjust the lyrics; asks the user if None.
+        audio_format (dict, optional): Canonical audio format of the WAV file.
+
+    Returns:
+        tuple: (Updated poem dictionary, recitation length in seconds) or (None, None) if failed.
+    """
+    try:
+        configure_ffmpeg(config)
+        if adjust is None:
+            adjust = ask_adjust_lyrics()
+        lines_to_use, pauses = select_lines(config, poem, adjust)
+        if lines_to_use is None:
+            return None, None
+
+        recitation_length = generate_recitation_to_file(lines_to_use, output_path, audio_format, pauses)
+        if not recitation_length:
+            return None, None
+        poem["recitation_length"] = recitation_length
+
+        print("\n=== Recitation Generation Results ===")
+        print(f"Recitation Length: {recitation_length:.2f} seconds")
+        print(f"Recitation Audio Saved To: {output_path}")
+        print("=====================================\n")
+
+        return poem, recitation_length
+    except Exception as e:
+        print(f"[Error] Failed to generate recitation: {e}")
+        return None, None
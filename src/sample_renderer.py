@@ -0,0 +1,297 @@
+# src/sample_renderer.py
+import os
+import json
+import time
+import wave
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+import pretty_midi
+from src.thread_budget import make_fluidsynth
+
+# Seconds rendered after each note-off so the release and reverb tail are kept
+RELEASE_SECONDS = 1.0
+
+# Shortest sample; longer notes use samples held for the next power-of-two multiple of it
+MIN_SAMPLE_SECONDS = 0.125
+
+# Seconds over which a note held shorter than its sample fades out after its note-off
+NOTE_OFF_FADE_SECONDS = 0.2
+
+# Undefined MIDI controller used only to extend a file past the last note-off
+_PADDING_CONTROLLER = 110
+
+def quantize_duration(duration):
+    """Sample length of a note: the smallest MIN_SAMPLE_SECONDS * 2**k that holds it."""
+    steps = max(duration, 1e-6) / MIN_SAMPLE_SECONDS
+    return MIN_SAMPLE_SECONDS * 2 ** max(0, int(np.ceil(np.log2(steps) - 1e-9)))
+
+class SampleCache:
+    """
+    Pre-rendered note and chord samples for one soundfont.
+
+    A sample is keyed by (program, pitches, velocity, duration), where the
+    duration is quantized (quantize_duration) so melodies at different tempos
+    share samples; a single note is a chord of one pitch. Missing samples are
+    rendered together in one FluidSynth pass and kept in memory up to
+    max_bytes and, with a cache_dir, on disk up to max_disk_bytes, least
+    recently used first out (on disk by file modification time).
+    """
+
+    def __init__(self, soundfont_path, frame_rate=44100, cache_dir=None, fs=None, max_bytes=256 * 2**20,
+                 max_disk_bytes=None):
+        self.soundfont_path = os.path.abspath(soundfont_path)
+        self.frame_rate = frame_rate
+        self.cache_dir = cache_dir
+        self.fs = fs
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.samples = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Samples rendered with another soundfont file must not be reused
+        stat = os.stat(self.soundfont_path) if os.path.exists(self.soundfont_path) else None
+        self._soundfont_id = f"{self.soundfont_path}:{stat.st_size}:{stat.st_mtime_ns}" if stat else self.soundfont_path
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(json.dumps([self._soundfont_id, self.frame_rate, key]).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.npy")
+
+    def get_many(self, keys):
+        """Return {key: int16 sample array (frames x 2)}, rendering any missing keys in one pass."""
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self.samples:
+                    self.samples.move_to_end(key)
+                    self.hits += 1
+                elif self.cache_dir and os.path.exists(self._disk_path(key)):
+                    self._store(key, np.load(self._disk_path(key)))
+                    if self.max_disk_bytes is not None:
+                        os.utime(self._disk_path(key))
+                    self.hits += 1
+                else:
+                    missing.append(key)
+            if missing:
+                self.misses += len(missing)
+                self._render(missing)
+                if self.cache_dir and self.max_disk_bytes is not None:
+                    self._evict_disk()
+            result = {key: self.samples[key] for key in keys}
+            self._evict()
+            return result
+
+    def _store(self, key, sample):
+        self.samples[key] = sample
+        self.nbytes += sample.nbytes
+
+    def _evict(self):
+        """Drop least recently used samples until the in-memory samples fit in max_bytes."""
+        while self.max_bytes is not None and self.nbytes > self.max_bytes and self.samples:
+            _, sample = self.samples.popitem(last=False)
+            self.nbytes -= sample.nbytes
+
+    def _evict_disk(self):
+        """Delete the least recently used sample files until cache_dir fits in max_disk_bytes."""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npy"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def _render(self, keys):
+        """Lay the missing samples end to end in one MIDI file, render it once and slice it."""
+        pm = pretty_midi.PrettyMIDI()
+        instruments = {}
+        slots = []
+        current_time = 0.0
+        for key in keys:
+            program, pitches, velocity, duration = key
+            if program not in instruments:
+                instruments[program] = pretty_midi.Instrument(program=program)
+                pm.instruments.append(instruments[program])
+            for pitch in pitches:
+                instruments[program].notes.append(
+                    pretty_midi.Note(velocity=velocity, pitch=pitch, start=current_time, end=current_time + duration)
+                )
+            slots.append((current_time, duration + RELEASE_SECONDS))
+            current_time += duration + RELEASE_SECONDS
+        next(iter(instruments.values())).control_changes.append(
+            pretty_midi.ControlChange(number=_PADDING_CONTROLLER, value=0, time=current_time)
+        )
+
+        with tempfile.TemporaryDirectory() as tmp:
+            midi_path = os.path.join(tmp, "samples.mid")
+            wav_path = os.path.join(tmp, "samples.wav")
+            pm.write(midi_path)
+            fs = self.fs or make_fluidsynth(self.soundfont_path, self.frame_rate)
+            fs.midi_to_audio(midi_path, wav_path)
+            rendered = read_wav_int16(wav_path)
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        for key, (start, length) in zip(keys, slots):
+            first = int(round(start * self.frame_rate))
+            sample = rendered[first:first + int(round(length * self.frame_rate))].copy()
+            self._store(key, sample)
+            if self.cache_dir:
+                np.save(self._disk_path(key), sample)
+
+def read_wav_int16(path):
+    """Read a 16-bit WAV file as a (frames x 2) int16 array, duplicating mono to stereo."""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError("Sample rendering expects 16-bit WAV output")
+        channels = f.getnchannels()
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16).reshape(-1, channels)
+    return np.repeat(data, 2, axis=1) if channels == 1 else data[:, :2]
+
+def sample_placements(pm, max_keys=512):
+    """
+    Group a PrettyMIDI object's notes into cacheable samples and their start times.
+
+    Notes of one instrument that share start, end and velocity form a chord.
+
+    Returns:
+        dict: {(program, pitches, velocity, sample duration): [(start, duration)]}, or None if
+            the MIDI uses drums, pitch bends or controllers, or needs more than max_keys samples.
+    """
+    placements = {}
+    for instrument in pm.instruments:
+        if instrument.is_drum or instrument.pitch_bends or instrument.control_changes:
+            return None
+        chords = {}
+        for note in instrument.notes:
+            chords.setdefault((round(note.start, 4), round(note.end, 4), note.velocity), []).append(note.pitch)
+        for (start, end, velocity), pitches in chords.items():
+            duration = end - start
+            key = (instrument.program, tuple(sorted(pitches)), velocity, quantize_duration(duration))
+            placements.setdefault(key, []).append((start, duration))
+    if len(placements) > max_keys:
+        return None
+    return placements
+
+def render_from_samples(pm, cache, max_keys=512):
+    """
+    Assemble a PrettyMIDI object's audio by mix-adding cached samples into one buffer.
+
+    A note shorter than its sample is cut at its note-off with a short fade
+    (NOTE_OFF_FADE_SECONDS); a note filling its sample keeps the rendered
+    release tail.
+
+    Returns:
+        np.ndarray: (frames x 2) int16 audio, or None if the MIDI is not cacheable.
+    """
+    placements = sample_placements(pm, max_keys)
+    if placements is None:
+        return None
+    samples = cache.get_many(list(placements))
+    total_frames = int(np.ceil(pm.get_end_time() * cache.frame_rate))
+    longest = max((len(s) for s in samples.values()), default=0)
+    buffer = np.zeros((total_frames + longest, 2), dtype=np.float32)
+
+    fade_frames = max(1, int(round(NOTE_OFF_FADE_SECONDS * cache.frame_rate)))
+    fade = np.linspace(1.0, 0.0, fade_frames, dtype=np.float32)[:, None]
+    for key, notes in placements.items():
+        sample = samples[key].astype(np.float32)
+        held_frames = int(round(key[3] * cache.frame_rate))
+        shaped = {}
+        for start, duration in notes:
+            note_off = int(round(duration * cache.frame_rate))
+            if note_off not in shaped:
+                if note_off >= held_frames:
+                    shaped[note_off] = sample
+                else:
+                    tail = sample[note_off:note_off + fade_frames] * fade[:len(sample) - note_off]
+                    shaped[note_off] = np.concatenate([sample[:note_off], tail])
+            offset = int(round(start * cache.frame_rate))
+            buffer[offset:offset + len(shaped[note_off])] += shaped[note_off]
+
+    # Trim the release tails to the last audible frame
+    audible = np.flatnonzero(np.abs(buffer[total_frames:].ravel()) >= 1.0)
+    end = total_frames + (int(audible[-1]) // 2 + 1 if len(audible) else 0)
+    return np.clip(buffer[:end], -32768, 32767).astype(np.int16)
+
+def write_wav_int16(path, audio, frame_rate):
+    """Write a (frames x 2) int16 array as a 16-bit stereo WAV file."""
+    with wave.open(path, "wb") as out:
+        out.setnchannels(2)
+        out.setsampwidth(2)
+        out.setframerate(frame_rate)
+        out.writeframes(audio.tobytes())
+
+def benchmark_fast_render(pm, soundfont_path, cache_dir=None, max_keys=512):
+    """
+    Time the sample renderer (cold and warm cache) against a full FluidSynth pass.
+
+    Returns:
+        dict: Seconds for each path and the warm-cache speedup, or None if pm is not cacheable.
+    """
+    if sample_placements(pm, max_keys) is None:
+        print("[Warning] MIDI is not cacheable; only the full synthesizer can render it")
+        return None
+    fs = make_fluidsynth(os.path.abspath(soundfont_path))
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        pm.write(os.path.join(tmp, "full.mid"))
+        fs.midi_to_audio(os.path.join(tmp, "full.mid"), os.path.join(tmp, "full.wav"))
+        full_seconds = time.perf_counter() - start
+
+    cache = SampleCache(soundfont_path, cache_dir=cache_dir, fs=fs)
+    start = time.perf_counter()
+    render_from_samples(pm, cache, max_keys)
+    cold_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    render_from_samples(pm, cache, max_keys)
+    warm_seconds = time.perf_counter() - start
+
+    result = {
+        "full_seconds": round(full_seconds, 3),
+        "cold_cache_seconds": round(cold_seconds, 3),
+        "warm_cache_seconds": round(warm_seconds, 3),
+        "samples": len(cache.samples),
+        "speedup": round(full_seconds / max(warm_seconds, 1e-9), 1)
+    }
+    print("\n=== Fast Render Benchmark ===")
+    print(f"Full FluidSynth Pass: {result['full_seconds']:.2f} seconds")
+    print(f"Sample Renderer (cold cache): {result['cold_cache_seconds']:.2f} seconds")
+    print(f"Sample Renderer (warm cache): {result['warm_cache_seconds']:.2f} seconds")
+    print(f"Cached Samples: {result['samples']}")
+    print(f"Speedup: {result['speedup']}x")
+    print("=============================\n")
+    return result
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the sample renderer against a full FluidSynth pass.")
+    parser.add_argument("midi", help="MIDI file to render (e.g. a saved Plan A melody)")
+    parser.add_argument("--config", default="config/config.json")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        synthesis_config = json.load(f)["music_synthesis"]
+    benchmark_fast_render(
+        pretty_midi.PrettyMIDI(args.midi),
+        synthesis_config["soundfont_path"],
+        cache_dir=synthesis_config.get("sample_cache_dir"),
+        max_keys=synthesis_config.get("sample_cache_max_keys", 512)
+    )
@@ -0,0 +1,252 @@
+# src/sentiment_batch.py
+import re
+import json
+import time
+import argparse
+import numpy as np
+from scipy import sparse
+from textblob import TextBlob
+
+# Version of the scorer, part of the sentiment analysis version of derived records
+SCORER_VERSION = "sparse-3"
+
+# Words, numbers and hyphenated words; "(!)", and every other non-space character on its own.
+# As in pattern's tokenizer, "isn't" splits into "is n ' t".
+_TOKEN_RE = re.compile(r"\(!\)|[a-z0-9]+(?=n't)|[a-z0-9]+(?:-[a-z0-9]+)*|[^\sa-z0-9]")
+
+# Separator between texts when a batch is tokenized in one pass
+_SEPARATOR = "\uE000"
+
+# Lexicon vocabulary, polarity and intensity vectors, built once per process
+_LEXICON = None
+
+def load_polarity_lexicon():
+    """
+    Build the polarity lexicon from the pattern lexicon that TextBlob ships.
+
+    Columns 0..V-1 are plain words; columns V..2V-1 are the same words
+    after a negation, weighted -0.5 * polarity as TextBlob does.
+
+    Returns:
+        dict: "vocab" (word -> column), "weights" (2V polarities), "polarity",
+            "intensity", "is_modifier" and "is_ly_modifier" per word, and "negations".
+    """
+    global _LEXICON
+    if _LEXICON is None:
+        from textblob.en import sentiment as pattern_sentiment
+
+        # Only single-token words with a sense for untagged text can match
+        words = sorted(w for w in pattern_sentiment.keys()
+                       if None in pattern_sentiment[w] and _TOKEN_RE.fullmatch(w))
+        polarity = np.array([pattern_sentiment[w][None][0] for w in words], dtype=np.float64)
+        is_modifier = np.array([any(m in pattern_sentiment[w] for m in pattern_sentiment.modifiers)
+                                for w in words], dtype=bool)
+        _LEXICON = {
+            "vocab": {w: i for i, w in enumerate(words)},
+            "weights": np.concatenate([polarity, -0.5 * polarity]),
+            "polarity": polarity,
+            "intensity": np.array([pattern_sentiment[w][None][2] for w in words], dtype=np.float64),
+            "is_modifier": is_modifier,
+            "is_ly_modifier": is_modifier & np.array([pattern_sentiment.modifier(w) for w in words], dtype=bool),
+            "negations": frozenset(pattern_sentiment.negations)
+        }
+    return _LEXICON
+
+def _previous(mask):
+    """Index of the last True position strictly before each position (-1 if none)."""
+    last = np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+    return np.concatenate(([-1], last[:-1]))
+
+def tokenize_batch(texts, lexicon):
+    """
+    Tokenize a batch of texts in one regex pass and describe every token.
+
+    Every text, the last included, ends on a separator token, so windows
+    that look back along the token stream never cross into another text.
+
+    Returns:
+        dict: Per-token arrays: "doc" (text index), "column" (lexicon column or -1)
+            and the masks "separator", "negation", "bang", "neutral", "short" (at most
+            one character besides apostrophes) and "small" (at most two characters).
+    """
+    joined = f" {_SEPARATOR} ".join(text.replace(_SEPARATOR, " ") for text in texts)
+    tokens = _TOKEN_RE.findall(f"{joined} {_SEPARATOR}".lower())
+    interned = {}
+    inverse = np.fromiter((interned.setdefault(t, len(interned)) for t in tokens), dtype=np.int64, count=len(tokens))
+    unique = list(interned)
+    vocab, negations = lexicon["vocab"], lexicon["negations"]
+
+    def per_token(values, dtype):
+        return np.array(values, dtype=dtype)[inverse]
+
+    is_separator = per_token([u == _SEPARATOR for u in unique], bool)
+    return {
+        "doc": np.cumsum(is_separator) - is_separator,
+        "column": per_token([vocab.get(u, -1) for u in unique], np.int64),
+        "separator": is_separator,
+        "negation": per_token([u in negations for u in unique], bool),
+        "bang": per_token([u == "!" for u in unique], bool),
+        "neutral": per_token([u == "(!)" for u in unique], bool),
+        "short": per_token([len(u.strip("'")) <= 1 for u in unique], bool) & ~is_separator,
+        "small": per_token([len(u) <= 2 for u in unique], bool) & ~is_separator
+    }
+
+def build_term_matrix(texts, lexicon):
+    """
+    Build the sparse (texts x 2V) matrix of lexicon assessments for a batch of texts.
+
+    The rules of TextBlob's PatternAnalyzer are applied with array operations
+    over the whole token stream:
+
+    - A known word counts in its plain column, or in its negated column when
+      a negation ("not", "never") precedes it with only one-character tokens
+      in between ("not a good").
+    - A known adverb ("very") merges into the next known word when only
+      tokens of two characters or fewer separate them. The word is scaled by
+      the adverb's intensity (inverted if the adverb itself is negated) and
+      inherits the adverb's negation.
+    - A negation right after an "-ly" adverb negates the adverb instead
+      ("really not good").
+    - Each "!" boosts the last known word before it by 1.25; "(!)" adds a
+      neutral assessment.
+    - Stored values are capped so no assessment exceeds |1|, as TextBlob
+      clamps them.
+
+    This is an approximation of TextBlob: emoticons are not scored, and only
+    the first negation after an "-ly" adverb is folded into it ("really never
+    never happy" negates "happy" too).
+
+    Returns:
+        tuple: (CSR matrix, number of assessments per text).
+    """
+    vocab_size = len(lexicon["vocab"])
+    tokens = tokenize_batch(texts, lexicon)
+    doc, column = tokens["doc"], tokens["column"]
+    hit = column >= 0
+    safe = np.where(hit, column, 0)
+    is_modifier = hit & lexicon["is_modifier"][safe]
+
+    # The adverb modifying a token is the last known word or longer token before it
+    adverb = np.maximum(_previous(~tokens["small"] | hit), 0)
+    cancelled = tokens["negation"] & ~hit & is_modifier[adverb] & lexicon["is_ly_modifier"][safe[adverb]]
+    anchor = _previous(~(tokens["small"] | cancelled) | hit)
+    merged = hit & (anchor >= 0) & is_modifier[np.maximum(anchor, 0)]
+    sources, targets = anchor[merged], np.flatnonzero(merged)
+
+    negation_anchor = _previous(~tokens["short"])
+    negated = hit & (negation_anchor >= 0) & (tokens["negation"] & ~cancelled)[np.maximum(negation_anchor, 0)]
+    intensity = lexicon["intensity"][safe]
+    intensity = np.where(negated, 1.0 / intensity, intensity)
+
+    scale = np.ones(len(column))
+    scale[targets] = intensity[sources]
+    negated[adverb[cancelled]] = True
+    # A chain of adverbs ("not very very good") carries the first adverb's negation
+    while targets.size:
+        inherited = negated[targets] | negated[sources]
+        if np.array_equal(inherited, negated[targets]):
+            break
+        negated[targets] = inherited
+
+    # "!" boosts the last known word before it; lost if that word merges into a later one
+    bangs = np.flatnonzero(tokens["bang"])
+    boosted = _previous(hit)[bangs]
+    boosted = boosted[(boosted >= 0) & (doc[np.maximum(boosted, 0)] == doc[bangs])]
+    scale *= 1.25 ** np.bincount(boosted, minlength=len(column))
+
+    assessed = hit.copy()
+    assessed[sources] = False
+    polarity = np.abs(lexicon["polarity"][safe[assessed]])
+    values = np.minimum(scale[assessed], 1.0 / np.maximum(polarity, 1e-12))
+    rows = doc[assessed]
+    matrix = sparse.csr_matrix(
+        (values, (rows, column[assessed] + vocab_size * negated[assessed])),
+        shape=(len(texts), 2 * vocab_size)
+    )
+    counts = np.bincount(rows, minlength=len(texts)) + np.bincount(doc[tokens["neutral"]], minlength=len(texts))
+    return matrix, counts[:len(texts)]
+
+def polarity_batch(texts):
+    """
+    Compute the polarity of every text with one sparse-dense product.
+
+    Polarity is the mean of the lexicon assessments in each text, as in
+    TextBlob's PatternAnalyzer (see build_term_matrix for the rules and
+    where they approximate it).
+
+    Returns:
+        np.ndarray: Polarity per text in [-1, 1].
+    """
+    if not texts:
+        return np.zeros(0)
+    lexicon = load_polarity_lexicon()
+    matrix, counts = build_term_matrix(texts, lexicon)
+    totals = matrix @ lexicon["weights"]
+    return np.clip(totals / np.maximum(counts, 1), -1.0, 1.0)
+
+def analyze_sentiment_batch(texts, sentiment_threshold):
+    """
+    Label a batch of texts Positive/Negative/Neutral with array operations.
+
+    Args:
+        texts (list): Poem texts.
+        sentiment_threshold (float): Polarity threshold, as in analyze_sentiment.
+
+    Returns:
+        list: Sentiment labels.
+    """
+    return label_polarity(polarity_batch(texts), sentiment_threshold).tolist()
+
+def label_polarity(polarity, sentiment_threshold):
+    """Map an array of polarities to sentiment labels."""
+    return np.where(polarity > sentiment_threshold, "Positive",
+                    np.where(polarity < -sentiment_threshold, "Negative", "Neutral"))
+
+def benchmark_against_textblob(texts, sentiment_threshold):
+    """
+    Compare batch labels and throughput with TextBlob itself.
+
+    Returns:
+        dict: Label agreement, mean absolute polarity difference and poems/sec of both paths.
+    """
+    load_polarity_lexicon()  # Both paths share the pattern lexicon; load it outside the timings
+    start = time.perf_counter()
+    batch_polarity = polarity_batch(texts)
+    batch_labels = label_polarity(batch_polarity, sentiment_threshold)
+    batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    textblob_polarity = np.array([TextBlob(t).sentiment.polarity for t in texts])
+    textblob_seconds = time.perf_counter() - start
+    textblob_labels = label_polarity(textblob_polarity, sentiment_threshold)
+
+    result = {
+        "poems": len(texts),
+        "label_agreement": float(np.mean(batch_labels == textblob_labels)) if texts else 1.0,
+        "mean_abs_polarity_diff": float(np.mean(np.abs(batch_polarity - textblob_polarity))) if texts else 0.0,
+        "batch_poems_per_second": len(texts) / max(batch_seconds, 1e-9),
+        "textblob_poems_per_second": len(texts) / max(textblob_seconds, 1e-9)
+    }
+    result["speedup"] = result["batch_poems_per_second"] / max(result["textblob_poems_per_second"], 1e-9)
+
+    print("\n=== Batch Sentiment Benchmark ===")
+    print(f"Poems: {result['poems']}")
+    print(f"Label Agreement: {result['label_agreement']:.1%}")
+    print(f"Mean |Polarity Difference|: {result['mean_abs_polarity_diff']:.4f}")
+    print(f"Batch: {result['batch_poems_per_second']:.0f} poems/sec")
+    print(f"TextBlob: {result['textblob_poems_per_second']:.0f} poems/sec")
+    print(f"Speedup: {result['speedup']:.1f}x")
+    print("=================================\n")
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batch sentiment against TextBlob.")
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("--limit", type=int, default=2000, help="Number of corpus poems to benchmark")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        nlp_config = json.load(f)["nlp_analysis"]
+    with open(nlp_config["input_file"], "r", encoding="utf-8") as f:
+        poems = json.load(f)[:args.limit]
+    benchmark_against_textblob([" ".join(p["lines"]) for p in poems], nlp_config["sentiment_threshold"])
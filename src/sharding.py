@@ -0,0 +1,149 @@
+# src/sharding.py
+import os
+import json
+import argparse
+from collections import Counter
+from src.data_processing import poem_content_hash
+from src.bulk_ingest import load_corpus, write_json_atomic
+from src.poem_record import load_records, write_records
+from src.corpus_run import run_corpus
+from src.model_residency import configure_model_budget
+from src.thread_budget import configure_thread_budget
+from src.music_synthesis import configure_output_dir
+
+def shard_of(poem_id, num_shards):
+    """Shard number of a poem ID (a SHA-1 hex digest); the same on every node and every run."""
+    return int(poem_id[:15], 16) % num_shards
+
+def shard_dir(run_root, shard, num_shards):
+    """Run directory of one shard, e.g. <run_root>/shard-03-of-16."""
+    return os.path.join(run_root, f"shard-{shard:02d}-of-{num_shards:02d}")
+
+def select_shard(corpus, shard, num_shards):
+    """
+    Return the poems of one shard and their corpus positions.
+
+    Returns:
+        tuple: (list of poems, list of corpus indices).
+    """
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"Shard {shard} is outside 0..{num_shards - 1}")
+    selected = [(i, poem) for i, poem in enumerate(corpus) if shard_of(poem_content_hash(poem), num_shards) == shard]
+    return [poem for _, poem in selected], [i for i, _ in selected]
+
+def run_shard(config, corpus, run_root, shard, num_shards, adjust_lyrics=False):
+    """
+    Render one shard of the corpus into the shared output directory.
+
+    Each shard has its own journal, stage cache and manifests under run_root,
+    so nodes never write the same file and need no coordination beyond the
+    shared filesystem. A restarted node resumes its shard from the journal.
+
+    Returns:
+        dict: Summary of the shard's corpus run.
+    """
+    poems, indices = select_shard(corpus, shard, num_shards)
+    print(f"Shard {shard + 1}/{num_shards}: {len(poems)} of {len(corpus)} poems")
+    return run_corpus(config, poems, shard_dir(run_root, shard, num_shards),
+                      adjust_lyrics=adjust_lyrics, indices=indices)
+
+def _read_manifest(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def merge_shards(run_root, num_shards, corpus=None):
+    """
+    Combine the per-shard NLP, music-params and render manifests.
+
+    Merged manifests are written to <run_root>/merged in corpus order. Shards
+    that have not written manifests yet are reported as missing, and with the
+    corpus given, poems of finished shards that have no entry are reported too.
+
+    Args:
+        run_root (str): Directory holding the shard run directories.
+        num_shards (int): Number of shards the corpus was split into.
+        corpus (list, optional): The corpus, to check every poem was rendered.
+
+    Returns:
+        dict: Merge statistics.
+    """
+    nlp, music_params, renders = [], [], {}
+    missing_shards, duplicates = [], []
+    for shard in range(num_shards):
+        directory = shard_dir(run_root, shard, num_shards)
+        shard_renders = _read_manifest(os.path.join(directory, "renders.json"), None)
+        if shard_renders is None:
+            missing_shards.append(shard)
+            continue
+        duplicates.extend(poem_id for poem_id in shard_renders if poem_id in renders)
+        renders.update(shard_renders)
+        nlp.extend(load_records(os.path.join(directory, "nlp.json")))
+        music_params.extend(_read_manifest(os.path.join(directory, "music_params.json"), []))
+
+    def position(poem_id):
+        index = renders.get(poem_id, {}).get("index")
+        return (index is None, index if index is not None else 0, poem_id)
+
+    nlp.sort(key=lambda poem: position(poem["poem_id"]))
+    music_params.sort(key=lambda entry: position(entry["poem_id"]))
+    renders = dict(sorted(renders.items(), key=lambda item: position(item[0])))
+
+    unrendered = []
+    if corpus is not None:
+        for poem in corpus:
+            poem_id = poem_content_hash(poem)
+            if shard_of(poem_id, num_shards) not in missing_shards and poem_id not in renders:
+                unrendered.append(poem_id)
+
+    merged_dir = os.path.join(run_root, "merged")
+    write_records(os.path.join(merged_dir, "nlp.json"), nlp)
+    write_json_atomic(os.path.join(merged_dir, "music_params.json"), music_params, indent=2)
+    write_json_atomic(os.path.join(merged_dir, "renders.json"), renders, indent=2)
+
+    statuses = Counter(entry["status"] for entry in renders.values())
+    stats = {
+        "shards": num_shards,
+        "missing_shards": missing_shards,
+        "poems": len(renders),
+        "statuses": dict(statuses),
+        "duplicates": duplicates,
+        "unrendered": unrendered
+    }
+    print("\n=== Shard Merge Results ===")
+    print(f"Shards Merged: {num_shards - len(missing_shards)}/{num_shards}")
+    if missing_shards:
+        print(f"Missing Shards: {missing_shards}")
+    print(f"Poems: {len(renders)} {dict(statuses)}")
+    if duplicates:
+        print(f"[Warning] Poems listed by more than one shard: {len(duplicates)}")
+    if unrendered:
+        print(f"Poems Not Yet Run: {len(unrendered)}")
+    print(f"Merged Manifests: {merged_dir}")
+    print("===========================\n")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the corpus in shards and merge their manifests.")
+    parser.add_argument("command", choices=["run", "merge"])
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("--run-id", default="corpus", help="Name of the sharded run")
+    parser.add_argument("--num-shards", type=int, required=True)
+    parser.add_argument("--shard", type=int, help="Shard to run on this node (0-based)")
+    parser.add_argument("--adjust-lyrics", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    corpus = load_corpus(config["nlp_analysis"]["input_file"])
+    run_root = os.path.join(config.get("pipeline", {}).get("runs_dir", "output/runs"), args.run_id)
+    if args.command == "merge":
+        merge_shards(run_root, args.num_shards, corpus)
+    else:
+        if args.shard is None:
+            parser.error("run needs --shard")
+        configure_model_budget(config.get("pipeline"))
+        configure_thread_budget(config)
+        configure_output_dir(config)
+        run_shard(config, corpus, run_root, args.shard, args.num_shards, adjust_lyrics=args.adjust_lyrics)
@@ -0,0 +1,296 @@
+# src/stage_scheduler.py
+import os
+import time
+import pickle
+import hashlib
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class StageError(Exception):
+    """Raised by a stage function when it cannot produce its outputs."""
+
+class Stage:
+    """
+    A node in the pipeline graph.
+
+    Args:
+        name (str): Unique stage name.
+        func (callable): Called with the declared inputs as keyword arguments;
+            returns a dict with (at least) the declared outputs.
+        inputs (list): Names of the values the stage reads.
+        outputs (list): Names of the values the stage produces.
+        cacheable (bool): Whether the stage may be skipped when its inputs are unchanged.
+    """
+
+    def __init__(self, name, func, inputs, outputs, cacheable=True):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.cacheable = cacheable
+
+def fingerprint(values):
+    """Return a content hash of a dict of input values, or None if they cannot be hashed."""
+    try:
+        payload = pickle.dumps(sorted(values.items()), protocol=4)
+    except Exception:
+        return None
+    return hashlib.sha1(payload).hexdigest()
+
+class StageCache:
+    """
+    In-memory stage output cache, optionally persisted to a directory of pickles.
+
+    With max_entries, only that many entries (the most recently used) are
+    kept in memory; older ones are read back from cache_dir when needed.
+    With max_bytes, the least recently used pickles are deleted whenever
+    cache_dir grows beyond that size (recitation audio makes entries large).
+    """
+
+    def __init__(self, cache_dir=None, max_entries=None, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def _touch(self, key):
+        """Mark a persisted entry as recently used (eviction goes by modification time)."""
+        if self.cache_dir and self.max_bytes is not None:
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Delete the least recently used pickles until cache_dir fits in max_bytes."""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def _remember(self, key, outputs):
+        self._entries[key] = outputs
+        self._entries.move_to_end(key)
+        while self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self._touch(key)
+            return self._entries[key]
+        if self.cache_dir and os.path.exists(self._path(key)):
+            try:
+                with open(self._path(key), "rb") as f:
+                    outputs = pickle.load(f)
+                self._remember(key, outputs)
+                self._touch(key)
+                return outputs
+            except Exception as e:
+                print(f"[Warning] Ignoring unreadable stage cache entry {key}: {e}")
+        return None
+
+    def put(self, key, outputs):
+        self._remember(key, outputs)
+        if self.cache_dir:
+            tmp_path = self._path(key) + ".tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(outputs, f, protocol=4)
+                os.replace(tmp_path, self._path(key))
+            except Exception as e:
+                print(f"[Warning] Failed to persist stage cache entry {key}: {e}")
+            if self.max_bytes is not None:
+                self._evict()
+
+    def discard(self, key):
+        """Drop an entry from memory and from cache_dir."""
+        self._entries.pop(key, None)
+        if self.cache_dir:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+def validate_graph(stages, initial_names):
+    """
+    Check that every input has exactly one producer and that the graph is acyclic.
+
+    Returns:
+        dict: Mapping of value name to the name of the stage producing it.
+    """
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers or output in initial_names:
+                raise ValueError(f"Value '{output}' is produced more than once")
+            producers[output] = stage.name
+
+    for stage in stages:
+        for name in stage.inputs:
+            if name not in producers and name not in initial_names:
+                raise ValueError(f"Stage '{stage.name}' needs '{name}', which nothing produces")
+
+    # Kahn's algorithm: a leftover stage means a cycle
+    deps = {s.name: {producers[i] for i in s.inputs if i in producers} for s in stages}
+    done = set()
+    while len(done) < len(stages):
+        ready = [name for name, d in deps.items() if name not in done and d <= done]
+        if not ready:
+            raise ValueError("Stage graph contains a cycle")
+        done.update(ready)
+    return producers
+
+def critical_path(stages, producers, timings):
+    """
+    Find the longest chain of dependent stages by measured wall time.
+
+    Returns:
+        tuple: (list of stage names on the critical path, total seconds).
+    """
+    by_name = {s.name: s for s in stages}
+    finish = {}
+    parent = {}
+
+    def longest(name):
+        if name in finish:
+            return finish[name]
+        best, best_parent = 0.0, None
+        for value in by_name[name].inputs:
+            upstream = producers.get(value)
+            if upstream and upstream in timings:
+                candidate = longest(upstream)
+                if candidate > best:
+                    best, best_parent = candidate, upstream
+        finish[name] = best + timings[name]["duration"]
+        parent[name] = best_parent
+        return finish[name]
+
+    ran = [name for name in timings]
+    if not ran:
+        return [], 0.0
+    end = max(ran, key=longest)
+    path = []
+    node = end
+    while node:
+        path.append(node)
+        node = parent[node]
+    return list(reversed(path)), finish[end]
+
+def run_stage_graph(stages, initial_values, max_workers=4, cache=None, on_stage_done=None):
+    """
+    Run a stage graph, starting each stage as soon as all of its inputs exist.
+
+    Independent stages run concurrently on a thread pool. Cacheable stages
+    whose input fingerprint is already in the cache are skipped and their
+    stored outputs reused. The first failing stage stops further scheduling.
+    Each stage runs in a copy of the caller's context, so context variables
+    set by the caller (e.g. the load test's request id) are seen by stages.
+
+    Args:
+        stages (list): Stage objects.
+        initial_values (dict): Values available before any stage runs.
+        max_workers (int): Size of the thread pool.
+        cache (StageCache, optional): Cache used to skip unchanged stages.
+        on_stage_done (callable, optional): Called as on_stage_done(name, outputs, timing)
+            on the scheduling thread as each stage completes.
+
+    Returns:
+        dict: Run report with "values", "timings", "failed", "error",
+            "critical_path" and "critical_path_seconds".
+    """
+    producers = validate_graph(stages, set(initial_values))
+    values = dict(initial_values)
+    timings = {}
+    pending = {s.name: s for s in stages}
+    running = {}
+    failed, error = None, None
+    run_start = time.perf_counter()
+
+    def execute(stage, kwargs, key):
+        start = time.perf_counter() - run_start
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                end = time.perf_counter() - run_start
+                return cached, {"start": start, "end": end, "duration": end - start, "skipped": True}
+        outputs = stage.func(**kwargs)
+        if not isinstance(outputs, dict) or any(o not in outputs for o in stage.outputs):
+            raise StageError(f"Stage '{stage.name}' did not return {stage.outputs}")
+        outputs = {o: outputs[o] for o in stage.outputs}
+        if key is not None:
+            cache.put(key, outputs)
+        end = time.perf_counter() - run_start
+        return outputs, {"start": start, "end": end, "duration": end - start, "skipped": False}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            if failed is None:
+                for name, stage in list(pending.items()):
+                    if all(i in values for i in stage.inputs):
+                        kwargs = {i: values[i] for i in stage.inputs}
+                        key = None
+                        if cache is not None and stage.cacheable:
+                            digest = fingerprint(kwargs)
+                            key = f"{stage.name}-{digest}" if digest else None
+                        running[executor.submit(contextvars.copy_context().run, execute, stage, kwargs, key)] = stage
+                        del pending[name]
+            if not running:
+                break
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    outputs, timing = future.result()
+                    values.update(outputs)
+                    timings[stage.name] = timing
+                    if on_stage_done:
+                        on_stage_done(stage.name, outputs, timing)
+                except Exception as e:
+                    if failed is None:
+                        failed, error = stage.name, e
+
+    path, path_seconds = critical_path(stages, producers, timings)
+    return {
+        "values": values,
+        "timings": timings,
+        "failed": failed,
+        "error": error,
+        "critical_path": path,
+        "critical_path_seconds": path_seconds,
+        "wall_seconds": time.perf_counter() - run_start
+    }
+
+def print_run_report(report):
+    """Print per-stage timings and the critical path of a run."""
+    print("\n=== Stage Schedule Report ===")
+    for name, timing in sorted(report["timings"].items(), key=lambda kv: kv[1]["start"]):
+        status = "skipped (cached)" if timing["skipped"] else f"{timing['duration']:.2f}s"
+        print(f"{name}: {timing['start']:.2f}s -> {timing['end']:.2f}s [{status}]")
+    if report["failed"]:
+        print(f"Failed Stage: {report['failed']} ({report['error']})")
+    print(f"Critical Path: {' -> '.join(report['critical_path'])} ({report['critical_path_seconds']:.2f}s)")
+    print(f"Wall Time: {report['wall_seconds']:.2f}s")
+    print("=============================\n")
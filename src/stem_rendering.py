@@ -0,0 +1,132 @@
+# src/stem_rendering.py
+import os
+import json
+import time
+import wave
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pretty_midi
+from pydub import AudioSegment
+from src.melody_generation import split_tracks
+from src.thread_budget import make_fluidsynth
+from src.sample_renderer import write_wav_int16
+from src.audio_format import DEFAULT_AUDIO_FORMAT, to_canonical
+
+def stem_name(instrument, index):
+    """Name of a stem: its track name ("chords", an instrument from map_theme) or track<index>."""
+    return instrument.name or f"track{index}"
+
+def stem_key(instrument, soundfont_path, frame_rate):
+    """
+    Cache key of one stem: a hash of everything that changes its audio.
+
+    Only the track's program and notes (not its name or the other tracks)
+    are hashed, so changing one instrument changes only that stem's key.
+    """
+    payload = json.dumps([
+        os.path.abspath(soundfont_path), frame_rate, instrument.program, instrument.is_drum,
+        [(n.pitch, n.velocity, round(n.start, 6), round(n.end, 6)) for n in instrument.notes]
+    ])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _read_wav_int16(path):
+    """Read a 16-bit stereo WAV file as a (frames x 2) int16 array."""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2 or f.getnchannels() != 2:
+            raise ValueError(f"Stem {path} is not 16-bit stereo")
+        return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16).reshape(-1, 2)
+
+def render_stem(instrument, cache_dir, soundfont_path, frame_rate, fs):
+    """
+    Render one track on its own with FluidSynth, or reuse its cached WAV.
+
+    Returns:
+        tuple: (path of the stem WAV, whether it was cached).
+    """
+    stem_path = os.path.join(cache_dir, stem_key(instrument, soundfont_path, frame_rate) + ".wav")
+    if os.path.exists(stem_path):
+        return stem_path, True
+
+    pm = pretty_midi.PrettyMIDI()
+    track = pretty_midi.Instrument(program=instrument.program, is_drum=instrument.is_drum, name=instrument.name)
+    track.notes = list(instrument.notes)
+    pm.instruments.append(track)
+    # Unique temporary names, so concurrent renders of the same stem never share a file
+    tmp_base = f"{stem_path}.{os.getpid()}.{threading.get_ident()}"
+    try:
+        pm.write(f"{tmp_base}.mid")
+        fs.midi_to_audio(f"{tmp_base}.mid", f"{tmp_base}.wav")
+        if not os.path.exists(f"{tmp_base}.wav"):
+            raise RuntimeError("FluidSynth wrote no audio")
+        os.replace(f"{tmp_base}.wav", stem_path)
+    finally:
+        for path in (f"{tmp_base}.mid", f"{tmp_base}.wav"):
+            if os.path.exists(path):
+                os.remove(path)
+    return stem_path, False
+
+def render_stems(config, pm, output_wav_file, instruments=None, fs=None, audio_format=None):
+    """
+    Render every track of a melody as its own stem in parallel and mix them.
+
+    Used when music_synthesis.stem_rendering is enabled. With instruments
+    given, the melody is first split across them as save_melody does. Stems
+    are FluidSynth renders cached in stem_cache_dir by the hash of their
+    notes and program, so re-rendering an arrangement in which one
+    instrument changed only renders that stem. Stems are mixed with the gain
+    (dB) in stem_gains for their name ("chords" or an instrument name). If
+    any stem fails to render, or there is nothing to render, RuntimeError is
+    raised so the caller renders the full arrangement instead.
+
+    Args:
+        config (dict): music_synthesis configuration dictionary.
+        pm (PrettyMIDI): Melody (and chord) tracks.
+        output_wav_file (str): Path to save the mixed melody WAV.
+        instruments (list, optional): Instrument names to split the melody across.
+        fs (FluidSynth, optional): Shared synthesizer; one is created with the "stems" thread budget otherwise.
+        audio_format (dict, optional): Canonical audio format.
+
+    Returns:
+        AudioSegment: The mixed melody.
+    """
+    audio_format = audio_format or DEFAULT_AUDIO_FORMAT
+    soundfont_path = os.path.abspath(config["soundfont_path"])
+    frame_rate = audio_format["frame_rate"]
+    cache_dir = config.get("stem_cache_dir", "output/.stem_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    fs = fs or make_fluidsynth(soundfont_path, frame_rate, "stems")
+    gains = config.get("stem_gains", {})
+
+    tracks = [track for track in (split_tracks(pm, instruments) if instruments else pm.instruments) if track.notes]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=config.get("stem_workers") or os.cpu_count()) as executor:
+        futures = [executor.submit(render_stem, track, cache_dir, soundfont_path, frame_rate, fs) for track in tracks]
+
+    if not tracks:
+        raise RuntimeError("The melody has no notes to render as stems")
+    # A mix missing a stem would be silently wrong; the caller falls back to a full render
+    errors = [f"{stem_name(track, i)}: {future.exception()}"
+              for i, (track, future) in enumerate(zip(tracks, futures)) if future.exception()]
+    if errors:
+        raise RuntimeError(f"{len(errors)} of {len(tracks)} stems failed to render ({'; '.join(errors)})")
+
+    mixed = np.zeros((0, 2), dtype=np.float32)
+    cached = 0
+    for i, (track, future) in enumerate(zip(tracks, futures)):
+        name = stem_name(track, i)
+        stem_path, hit = future.result()
+        cached += hit
+        stem = _read_wav_int16(stem_path)
+        if len(stem) > len(mixed):
+            mixed = np.concatenate([mixed, np.zeros((len(stem) - len(mixed), 2), dtype=np.float32)])
+        mixed[:len(stem)] += stem * np.float32(10 ** (gains.get(name, 0) / 20.0))
+    audio = np.clip(mixed, -32768, 32767).astype(np.int16)
+
+    output_wav_file = os.path.abspath(output_wav_file)
+    write_wav_int16(output_wav_file, audio, frame_rate)
+    print(f"Melody mixed from stems: {output_wav_file} "
+          f"({cached} cached, {len(tracks) - cached} rendered, {time.perf_counter() - start:.2f}s)")
+    audio = AudioSegment(data=audio.tobytes(), frame_rate=frame_rate, channels=2, sample_width=2)
+    return to_canonical(audio, audio_format)
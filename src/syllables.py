@@ -0,0 +1,85 @@
+# src/syllables.py
+import re
+from functools import lru_cache
+import pronouncing
+
+# Words as the CMU dictionary spells them (letters and apostrophes)
+_WORD = re.compile(r"[a-z']+")
+_VOWEL_GROUPS = re.compile(r"[aeiouy]+")
+
+# Default normalizer settings, overridable in the recitation_generation config section
+DEFAULT_SYLLABLE_SETTINGS = {"syllable_target": 8, "syllable_tolerance": 2, "seconds_per_syllable": 0.22}
+
+# Pause after each recited line, and the shortest pause a long line is retimed to
+BASE_PAUSE_MS = 500
+MIN_PAUSE_MS = 250
+
+def get_syllable_settings(config):
+    """Return the syllable normalizer settings from the recitation_generation config section."""
+    return {key: (config or {}).get(key, default) for key, default in DEFAULT_SYLLABLE_SETTINGS.items()}
+
+@lru_cache(maxsize=None)
+def word_syllables(word):
+    """
+    Count the syllables of one lower-case word.
+
+    Uses the first CMU dictionary pronunciation; words missing from the
+    dictionary are estimated from their vowel groups.
+    """
+    word = word.strip("'")
+    if not word:
+        return 0
+    phones = pronouncing.phones_for_word(word)
+    if phones:
+        return pronouncing.syllable_count(phones[0])
+    count = len(_VOWEL_GROUPS.findall(word))
+    if count > 1 and word.endswith("e") and not word.endswith(("le", "ee")):
+        count -= 1  # silent final e
+    return max(count, 1)
+
+def line_syllables(line):
+    """Count the syllables of a line."""
+    return sum(word_syllables(word) for word in _WORD.findall(line.lower()))
+
+def syllable_report(lines, syllable_target=8, syllable_tolerance=2, seconds_per_syllable=0.22):
+    """
+    Count syllables per line and retime each line toward the target.
+
+    Lines keep their words. The pause after a short line is lengthened by the
+    missing syllables, and the pause after a long line is shortened (down to
+    MIN_PAUSE_MS), so every line takes about the time of syllable_target
+    syllables. Lines further than syllable_tolerance from the target are flagged.
+
+    Args:
+        lines (list): Poem lines.
+        syllable_target (int): Syllables per line to pace towards.
+        syllable_tolerance (int): Allowed difference before a line is flagged.
+        seconds_per_syllable (float): Speaking time of one syllable.
+
+    Returns:
+        list: One dict per line with "line", "syllables", "delta", "pause_ms" and "flagged".
+    """
+    report = []
+    for line in lines:
+        syllables = line_syllables(line)
+        delta = syllables - syllable_target
+        pause_ms = max(BASE_PAUSE_MS - delta * seconds_per_syllable * 1000, MIN_PAUSE_MS)
+        report.append({
+            "line": line,
+            "syllables": syllables,
+            "delta": delta,
+            "pause_ms": int(round(pause_ms)),
+            "flagged": bool(line.strip()) and abs(delta) > syllable_tolerance
+        })
+    return report
+
+def print_syllable_report(report, syllable_target=8):
+    """Print per-line syllable counts, retimed pauses and flagged lines."""
+    print("\n=== Syllable Report ===")
+    print(f"Target: {syllable_target} syllables per line")
+    for i, entry in enumerate(report, 1):
+        if not entry["line"].strip():
+            continue
+        flag = "  [flagged]" if entry["flagged"] else ""
+        print(f"Line {i}: {entry['syllables']} syllables ({entry['delta']:+d}), pause {entry['pause_ms']} ms{flag}")
+    print("=======================\n")
@@ -0,0 +1,112 @@
+# src/theme_classification.py
+import hashlib
+import json
+import numpy as np
+
+# Centroid matrices keyed by (embedding model name, theme_categories hash)
+_CENTROID_CACHE = {}
+
+def _categories_key(theme_categories):
+    """Return a stable hash of the theme_categories config block."""
+    payload = json.dumps(theme_categories, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _normalize_rows(matrix):
+    """L2-normalize each row of a matrix so dot products become cosine similarities."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def embed_texts(kw_model, texts):
+    """Embed a batch of texts with the sentence-embedding model KeyBERT already holds."""
+    embeddings = kw_model.model.embed(list(texts))
+    return np.asarray(embeddings, dtype=np.float32)
+
+def build_theme_centroids(kw_model, theme_categories, model_name="default"):
+    """
+    Build (or fetch from cache) one centroid embedding per theme category.
+
+    All category words are embedded in a single batch; each centroid is the
+    normalized mean of its category's word embeddings.
+
+    Args:
+        kw_model (KeyBERT): KeyBERT model whose embedding backend is reused.
+        theme_categories (dict): Mapping of theme name to a list of words.
+        model_name (str): Name of the embedding model, part of the cache key.
+
+    Returns:
+        tuple: (list of theme labels, centroid matrix of shape (k, dim)).
+    """
+    key = (model_name, _categories_key(theme_categories))
+    if key in _CENTROID_CACHE:
+        return _CENTROID_CACHE[key]
+
+    labels = [t for t, words in theme_categories.items() if words]
+    words = [w for t in labels for w in theme_categories[t]]
+    counts = np.array([len(theme_categories[t]) for t in labels])
+    if not labels:
+        raise ValueError("theme_categories has no words to build centroids from")
+
+    word_vectors = _normalize_rows(embed_texts(kw_model, words))
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sums = np.add.reduceat(word_vectors, offsets, axis=0)
+    centroids = _normalize_rows(sums / counts[:, None])
+
+    _CENTROID_CACHE[key] = (labels, centroids)
+    return labels, centroids
+
+def score_themes(embeddings, centroids, temperature=0.05):
+    """
+    Score a batch of embeddings against all theme centroids in one matrix multiply.
+
+    Args:
+        embeddings (np.ndarray): Poem embeddings of shape (n, dim).
+        centroids (np.ndarray): Normalized centroids of shape (k, dim).
+        temperature (float): Softmax temperature used for the confidence scores.
+
+    Returns:
+        tuple: (cosine similarity matrix (n, k), confidence matrix (n, k)).
+    """
+    similarities = _normalize_rows(embeddings) @ centroids.T
+    logits = similarities / max(temperature, 1e-6)
+    logits -= logits.max(axis=1, keepdims=True)
+    weights = np.exp(logits)
+    confidences = weights / weights.sum(axis=1, keepdims=True)
+    return similarities, confidences
+
+def classify_themes(kw_model, texts, theme_categories, model_name="default",
+                    min_similarity=0.2, temperature=0.05):
+    """
+    Classify a whole batch of poems (or keyword strings) into theme categories.
+
+    Args:
+        kw_model (KeyBERT): KeyBERT model whose embedding backend is reused.
+        texts (list): Poem texts or joined keyword strings, one per poem.
+        theme_categories (dict): Mapping of theme name to a list of words.
+        model_name (str): Name of the embedding model, part of the cache key.
+        min_similarity (float): Best-match similarity below which a poem is "Other".
+        temperature (float): Softmax temperature used for the confidence scores.
+
+    Returns:
+        tuple: (list of themes, list of {theme: confidence} dicts).
+    """
+    if not texts:
+        return [], []
+    labels, centroids = build_theme_centroids(kw_model, theme_categories, model_name)
+    similarities, confidences = score_themes(embed_texts(kw_model, texts), centroids, temperature)
+
+    best = similarities.argmax(axis=1)
+    best_similarity = similarities[np.arange(len(texts)), best]
+    themes = [
+        labels[idx] if sim >= min_similarity else "Other"
+        for idx, sim in zip(best.tolist(), best_similarity.tolist())
+    ]
+    scores = [
+        {label: round(float(conf), 4) for label, conf in zip(labels, row)}
+        for row in confidences
+    ]
+    return themes, scores
+
+def clear_centroid_cache():
+    """Drop all cached centroid matrices (e.g. after the embedding model is unloaded)."""
+    _CENTROID_CACHE.clear()
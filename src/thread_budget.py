@@ -0,0 +1,243 @@
+# src/thread_budget.py
+import os
+import json
+import subprocess
+import threading
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from midi2audio import FluidSynth
+
+# Thread counts per pool; None means this pipeline's share of the cores
+# (cpu_cores / pipelines_per_node). Overridable per stage under "stages".
+DEFAULT_THREAD_BUDGET = {
+    "cpu_cores": None,
+    "pipelines_per_node": 1,
+    "torch_intra_op": None,
+    "torch_inter_op": 1,
+    "tensorflow_intra_op": None,
+    "tensorflow_inter_op": 1,
+    "fluidsynth_cores": 1,
+    "stages": {}
+}
+
+_POOLS = ("torch_intra_op", "torch_inter_op", "tensorflow_intra_op", "tensorflow_inter_op", "fluidsynth_cores")
+
+# Environment read by the BLAS/OpenMP runtimes when they start
+_BLAS_ENV = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+_BUDGET = dict(DEFAULT_THREAD_BUDGET)
+_APPLIED = {}
+_FAILED = set()
+_APPLY_LOCK = threading.Lock()
+
+# Whether per-stage overrides resize the framework pools. Only framework worker
+# processes, which serve one stage at a time, turn them on: elsewhere emotion
+# and keywords run concurrently and would race on the process-wide torch pool.
+_STAGE_OVERRIDES = False
+
+def resolve_thread_budget(options, stage=None):
+    """
+    Resolve a thread_budget config section to thread counts for one stage.
+
+    Args:
+        options (dict): The pipeline.thread_budget section.
+        stage (str, optional): Stage name whose overrides apply (e.g. "emotion", "plan_b").
+
+    Returns:
+        dict: Positive thread count for every pool.
+    """
+    options = dict(DEFAULT_THREAD_BUDGET, **(options or {}))
+    cores = options["cpu_cores"] or os.cpu_count() or 1
+    share = max(1, cores // max(1, options["pipelines_per_node"]))
+    overrides = options["stages"].get(stage, {}) if stage else {}
+    return {pool: max(1, int(overrides.get(pool, options[pool]) or share)) for pool in _POOLS}
+
+def configure_thread_budget(config, framework="torch", stage_overrides=False):
+    """
+    Set the process-wide thread budget from pipeline.thread_budget.
+
+    Also sizes the BLAS/OpenMP pools through the environment, which they read
+    when first loaded, so call this before any framework is imported.
+
+    Args:
+        config (dict): Full configuration dictionary.
+        framework (str): Framework whose intra-op count sizes the BLAS pools.
+        stage_overrides (bool): Let apply_framework_threads resize the pools per stage
+            (only in processes that run one stage at a time).
+    """
+    global _STAGE_OVERRIDES
+    _BUDGET.clear()
+    _BUDGET.update(DEFAULT_THREAD_BUDGET, **config.get("pipeline", {}).get("thread_budget", {}))
+    _STAGE_OVERRIDES = stage_overrides
+    threads = resolve_thread_budget(_BUDGET)
+    for name in _BLAS_ENV:
+        os.environ[name] = str(threads[f"{framework}_intra_op"])
+    return threads
+
+def stage_threads(stage=None):
+    """Thread counts of the configured budget for a stage."""
+    return resolve_thread_budget(_BUDGET, stage)
+
+def apply_framework_threads(framework, stage=None):
+    """
+    Size the intra-op and inter-op pools of torch or TensorFlow for a stage.
+
+    Called before each model is loaded or used. The stage's overrides only
+    apply where configure_thread_budget enabled them (framework workers);
+    other processes keep the base budget. torch's intra-op pool can be
+    resized at any time; its inter-op pool keeps its first size. TensorFlow's
+    pools are fixed once it has started work, so a failed resize is reported
+    (once per size) and not recorded as applied.
+
+    Returns:
+        bool: Whether the pools now have the requested sizes.
+    """
+    threads = stage_threads(stage if _STAGE_OVERRIDES else None)
+    intra, inter = threads[f"{framework}_intra_op"], threads[f"{framework}_inter_op"]
+    with _APPLY_LOCK:
+        if _APPLIED.get(framework) == (intra, inter):
+            return True
+        try:
+            if framework == "torch":
+                import torch
+                torch.set_num_threads(intra)
+                if framework in _APPLIED:
+                    inter = _APPLIED[framework][1]
+                else:
+                    torch.set_num_interop_threads(inter)
+            else:
+                # TF1-style sessions (MusicVAE) size their pools from the environment
+                os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra)
+                os.environ["TF_NUM_INTEROP_THREADS"] = str(inter)
+                import tensorflow as tf
+                tf.config.threading.set_intra_op_parallelism_threads(intra)
+                tf.config.threading.set_inter_op_parallelism_threads(inter)
+        except ImportError:
+            return False
+        except RuntimeError as e:
+            if (framework, intra, inter) not in _FAILED:
+                _FAILED.add((framework, intra, inter))
+                print(f"[Warning] Could not size the {framework} thread pools to {intra} intra-op / "
+                      f"{inter} inter-op threads; they keep their current sizes: {e}")
+            return False
+        _APPLIED[framework] = (intra, inter)
+        return True
+
+class BudgetedFluidSynth(FluidSynth):
+    """midi2audio's FluidSynth with the synthesizer's core count set (-o synth.cpu-cores)."""
+
+    def __init__(self, sound_font, sample_rate=44100, cpu_cores=1):
+        super().__init__(sound_font, sample_rate=sample_rate)
+        self.cpu_cores = cpu_cores
+
+    def midi_to_audio(self, midi_file, audio_file):
+        """Render a MIDI file to audio; raises CalledProcessError if FluidSynth fails."""
+        subprocess.run(['fluidsynth', '-ni', '-o', f'synth.cpu-cores={self.cpu_cores}', self.sound_font,
+                        midi_file, '-F', audio_file, '-r', str(self.sample_rate)], check=True)
+
+def make_fluidsynth(soundfont_path, sample_rate=44100, stage=None):
+    """Create a FluidSynth renderer using the budgeted core count of a stage."""
+    return BudgetedFluidSynth(soundfont_path, sample_rate=sample_rate,
+                              cpu_cores=stage_threads(stage)["fluidsynth_cores"])
+
+def candidate_splits(cores, pipelines_per_node=1):
+    """
+    Thread splits to benchmark for a core count.
+
+    Each pipeline gets cores / pipelines_per_node; torch and TensorFlow
+    intra-op counts and FluidSynth cores are powers of two within that share.
+    """
+    share = max(1, cores // max(1, pipelines_per_node))
+    counts = [n for n in (1, 2, 4, 8, 16, 32, 64) if n <= share]
+    splits = []
+    for torch_threads, tf_threads, fs_cores in itertools.product(counts, counts, counts[:3]):
+        splits.append({
+            "cpu_cores": cores,
+            "pipelines_per_node": pipelines_per_node,
+            "torch_intra_op": torch_threads,
+            "torch_inter_op": 1,
+            "tensorflow_intra_op": tf_threads,
+            "tensorflow_inter_op": 1,
+            "fluidsynth_cores": fs_cores,
+            "stages": {}
+        })
+    return splits
+
+def _run_trial(config, poems, requests, concurrency):
+    """Load-test one split in this process with the split's thread budget."""
+    configure_thread_budget(config)
+    from src.load_test import run_load_test
+    return run_load_test(config, poems, requests=requests, concurrency=concurrency)
+
+def benchmark_thread_budget(config, poems, cores=None, pipelines_per_node=1, requests=8, splits=None,
+                            isolate=True):
+    """
+    Find the thread split with the best throughput for a core count.
+
+    Every split is load-tested (src/load_test.py) with pipelines_per_node
+    poems in flight. Framework workers are disabled for the trials (the load
+    test runs every stage in-process), so the split sizes the in-process
+    pools. Each trial runs in a fresh process: TensorFlow's pools and
+    torch's inter-op pool keep their first size, so sizing them again in one
+    process would not take effect.
+
+    Args:
+        isolate (bool): Run each trial in a fresh process (False runs them in
+            this one; only the torch intra-op pool and FluidSynth then change).
+
+    Returns:
+        dict: Results per split, sorted by throughput, and the best split.
+    """
+    cores = cores or os.cpu_count() or 1
+    results = []
+    for split in splits or candidate_splits(cores, pipelines_per_node):
+        trial_config = json.loads(json.dumps(config))
+        pipeline_config = trial_config.setdefault("pipeline", {})
+        pipeline_config["thread_budget"] = dict(pipeline_config.get("thread_budget", {}), **split)
+        pipeline_config.setdefault("framework_workers", {})["enabled"] = False
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                report = pool.submit(_run_trial, trial_config, poems, requests, pipelines_per_node).result()
+        else:
+            report = _run_trial(trial_config, poems, requests, pipelines_per_node)
+        results.append({
+            "split": split,
+            "throughput_per_second": report["throughput_per_second"],
+            "p95_latency_seconds": report["latency"].get("p95"),
+            "error_rate": report["error_rate"]
+        })
+        print(f"torch {split['torch_intra_op']}, tensorflow {split['tensorflow_intra_op']}, "
+              f"fluidsynth {split['fluidsynth_cores']}: {report['throughput_per_second']:.3f} poems/sec")
+    configure_thread_budget(config)
+
+    results.sort(key=lambda r: (r["error_rate"], -r["throughput_per_second"]))
+    best = results[0] if results else None
+    print("\n=== Thread Budget Benchmark ===")
+    print(f"Cores: {cores}, Pipelines per Node: {pipelines_per_node}, Splits Tried: {len(results)}")
+    if best:
+        print(f"Best Split: {json.dumps(best['split'])}")
+        print(f"Throughput: {best['throughput_per_second']:.3f} poems/sec, p95 Latency: {best['p95_latency_seconds']}s")
+    print("===============================\n")
+    return {"cores": cores, "pipelines_per_node": pipelines_per_node, "results": results, "best": best}
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark torch/TensorFlow/FluidSynth thread splits.")
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("--cores", type=int, help="Cores to split (default: all)")
+    parser.add_argument("--pipelines", type=int, default=1, help="Pipelines running at once on the node")
+    parser.add_argument("--requests", type=int, default=8, help="Poems per split")
+    parser.add_argument("--poems", type=int, default=4, help="Distinct corpus poems to cycle through")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    with open(config["nlp_analysis"]["input_file"], "r", encoding="utf-8") as f:
+        poems = json.load(f)[:args.poems]
+    result = benchmark_thread_budget(config, poems, cores=args.cores, pipelines_per_node=args.pipelines,
+                                     requests=args.requests)
+    os.makedirs("output", exist_ok=True)
+    with open(os.path.join("output", "thread_budget_benchmark.json"), "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
@@ -0,0 +1,270 @@
+# src/variant_sweep.py
+import os
+import json
+import time
+import random
+import argparse
+import itertools
+import contextlib
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from src.data_processing import process_uploaded_file
+from src.music_mapping import map_theme, get_mapping_tables
+from src.melody_generation import generate_plan_a, generate_plan_b, musicvae_model, save_melody
+from src import music_synthesis
+from src.music_synthesis import render_plan, sanitize_filename, artifact_path, configure_output_dir
+from src.pipeline import build_stage_graph, stage_settings
+from src.stage_scheduler import run_stage_graph, print_run_report
+from src.model_residency import configure_model_budget
+from src.thread_budget import configure_thread_budget, make_fluidsynth
+from src.audio_format import get_audio_format
+from src.poem_record import thaw
+from src.recitation_generation import adjust_settings
+
+# Stages rendered once per variant; everything else is shared by the sweep
+VARIANT_STAGES = {"plan_a", "plan_b", "synthesis_a", "synthesis_b"}
+
+# music_params keys a variant may override directly
+VARIANT_PARAMS = ("tempo", "base_note", "mode", "instruments")
+
+def expand_variants(sweep_config):
+    """
+    Build the list of variants from the variant_sweep config.
+
+    Explicit "variants" are used as given; a "grid" of lists is expanded into
+    its cartesian product. Variants without a name are numbered.
+
+    Args:
+        sweep_config (dict): variant_sweep configuration dictionary.
+
+    Returns:
+        list: Variant dictionaries.
+    """
+    variants = [dict(v) for v in sweep_config.get("variants", [])]
+    grid = sweep_config.get("grid", {})
+    if grid:
+        keys = sorted(grid)
+        for values in itertools.product(*(grid[k] for k in keys)):
+            variants.append(dict(zip(keys, values)))
+    for i, variant in enumerate(variants):
+        variant.setdefault("name", f"v{i + 1:02d}")
+        variant["name"] = sanitize_filename(str(variant["name"]))
+    return variants
+
+def apply_variant(music_params, variant, tables=None):
+    """Return a copy of music_params with the variant's overrides applied."""
+    params = thaw(music_params)
+    if "theme" in variant:
+        params["instruments"] = map_theme(variant["theme"], tables)
+    for key in VARIANT_PARAMS:
+        if key in variant:
+            params[key] = variant[key]
+    return params
+
+def compute_shared(config, poem, adjust_lyrics=False):
+    """
+    Run NLP, music mapping and recitation once for the whole sweep.
+
+    Returns:
+        dict: Run report of the shared stages.
+    """
+    # Variants mix against the in-memory recitation, so the sweep never uses block rendering
+    shared_config = dict(config, music_synthesis=dict(config.get("music_synthesis", {}), block_rendering=False))
+    stages = [s for s in build_stage_graph(shared_config) if s.name not in VARIANT_STAGES]
+    report = run_stage_graph(
+        stages,
+        {
+            "poem": poem,
+            "adjust_lyrics": adjust_lyrics,
+            "adjust_settings": adjust_settings(config["recitation_generation"]),
+            "audio_format": get_audio_format(config),
+            **stage_settings(config)
+        },
+        max_workers=config.get("pipeline", {}).get("max_workers", 4)
+    )
+    print_run_report(report)
+    return report
+
+def render_variant(config, shared, variant, plans, title, timestamp, fs, model, model_lock):
+    """
+    Generate and render one variant's melodies against the shared recitation.
+
+    Returns:
+        dict: Manifest entry for the variant.
+    """
+    start = time.perf_counter()
+    poem = dict(shared["mapped_poem"])
+    poem["music_params"] = apply_variant(
+        poem["music_params"], variant, get_mapping_tables(config.get("music_mapping", {}))
+    )
+    recitation_length = shared["recitation_length"]
+    rng = random.Random(variant.get("seed"))
+
+    synthesis_config = dict(config.get("music_synthesis", {}))
+    for key in ("recitation_volume", "melody_volume"):
+        if key in variant:
+            synthesis_config[key] = variant[key]
+
+    entry = {
+        "name": variant["name"],
+        "variant": variant,
+        "music_params": poem["music_params"],
+        "recitation_volume": synthesis_config.get("recitation_volume", 0),
+        "melody_volume": synthesis_config.get("melody_volume", -3),
+        "plans": {}
+    }
+    try:
+        for plan in plans:
+            if plan == "planb" and model is not None and "seed" in variant:
+                # MusicVAE samples with TensorFlow's own unseeded random ops, so a seed cannot be honoured
+                entry["plans"][plan] = {"skipped": "MusicVAE sampling cannot be seeded; "
+                                                   "build a phrase bank to seed Plan B"}
+                continue
+            if plan == "plana":
+                pm = generate_plan_a(poem["music_params"], recitation_length, rng=rng)
+            else:
+                # One TensorFlow session is shared by every variant
+                with model_lock:
+                    pm = generate_plan_b(config.get("melody_generation", {}), poem, recitation_length,
+                                         model=model, rng=rng)
+            midi_path = artifact_path(title, timestamp, variant["name"], plan, ext="mid")
+            instruments = poem["music_params"]["instruments"]
+            pm = save_melody(pm, instruments, midi_path)
+            audio, audio_path = render_plan(
+                synthesis_config, title, timestamp, f"{plan}_{variant['name']}",
+                shared["recitation_audio"], pm, fs=fs, audio_format=get_audio_format(config),
+                instruments=instruments
+            )
+            entry["plans"][plan] = {
+                "midi": os.path.abspath(midi_path),
+                "audio": audio_path,
+                "duration_seconds": len(audio) / 1000.0,
+                "rms_dbfs": round(audio.dBFS, 2),
+                "peak_dbfs": round(audio.max_dBFS, 2)
+            }
+    except Exception as e:
+        print(f"[Error] Variant {variant['name']} failed: {e}")
+        entry["error"] = str(e)
+    entry["render_seconds"] = round(time.perf_counter() - start, 3)
+    return entry
+
+def run_sweep(config, poem, variants=None, adjust_lyrics=False):
+    """
+    Render many arrangements of one poem, sharing analysis, recitation and models.
+
+    Args:
+        config (dict): Full configuration dictionary.
+        poem (dict): Poem dictionary with title, author and lines.
+        variants (list, optional): Variant dicts; defaults to the variant_sweep config.
+        adjust_lyrics (bool): Whether to adjust the lyrics before recitation.
+
+    Returns:
+        dict: Sweep manifest, also written to output/<title>_sweep_<timestamp>.json.
+    """
+    sweep_config = config.get("variant_sweep", {})
+    variants = expand_variants({"variants": variants}) if variants is not None else expand_variants(sweep_config)
+    plans = sweep_config.get("plans", ["plana", "planb"])
+    if not variants:
+        print("[Error] No variants configured")
+        return None
+
+    sweep_start = time.perf_counter()
+    report = compute_shared(config, poem, adjust_lyrics)
+    if report["failed"]:
+        print(f"[Error] Shared stage '{report['failed']}' failed: {report['error']}")
+        return None
+    shared = report["values"]
+    shared_seconds = time.perf_counter() - sweep_start
+
+    title = sanitize_filename(poem.get("title", "untitled"))
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(music_synthesis.OUTPUT_DIR, exist_ok=True)
+    audio_format = get_audio_format(config)
+    fs = make_fluidsynth(os.path.abspath(config["music_synthesis"]["soundfont_path"]), audio_format["frame_rate"])
+    melody_config = config.get("melody_generation", {})
+    bank_path = melody_config.get("phrase_bank_path")
+    use_bank = bank_path and os.path.exists(bank_path)
+    model_lock = threading.Lock()
+
+    # The model stays resident (not evictable) for the whole sweep
+    with contextlib.ExitStack() as stack:
+        model = None
+        if "planb" in plans and not use_bank:
+            model = stack.enter_context(musicvae_model(melody_config))
+            if any("seed" in v for v in variants):
+                print("[Warning] Plan B samples MusicVAE, which cannot be seeded; "
+                      "it is skipped for seeded variants (build a phrase bank to seed it)")
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=sweep_config.get("max_workers", 4)))
+        entries = list(executor.map(
+            lambda v: render_variant(config, shared, v, plans, title, timestamp, fs, model, model_lock),
+            variants
+        ))
+
+    skipped = [{"variant": entry["name"], "plan": plan, "reason": info["skipped"]}
+               for entry in entries for plan, info in entry["plans"].items() if "skipped" in info]
+    manifest = {
+        "title": poem.get("title", "untitled"),
+        "author": poem.get("author", "Unknown"),
+        "timestamp": timestamp,
+        "analysis": {k: shared["analyzed_poem"].get(k) for k in ("sentiment", "emotion", "keywords", "theme", "rhyme_pattern")},
+        "base_music_params": thaw(shared["mapped_poem"]["music_params"]),
+        "recitation_length": shared["recitation_length"],
+        "shared_seconds": round(shared_seconds, 3),
+        "total_seconds": round(time.perf_counter() - sweep_start, 3),
+        "renders_planned": len(variants) * len(plans),
+        "renders_skipped": len(skipped),
+        "skipped": skipped,
+        "variants": entries
+    }
+    manifest_path = os.path.abspath(artifact_path(title, timestamp, "sweep", ext="json"))
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    print("\n=== Variant Sweep Results ===")
+    print(f"Shared Analysis + Recitation: {manifest['shared_seconds']:.2f} seconds")
+    for entry in entries:
+        status = entry.get("error") or ", ".join(
+            f"{plan}: {info['rms_dbfs']} dBFS" if "rms_dbfs" in info else f"{plan}: skipped"
+            for plan, info in entry["plans"].items()
+        )
+        print(f"{entry['name']}: {entry['render_seconds']:.2f} seconds ({status})")
+    if skipped:
+        print(f"Skipped: {len(skipped)} of {manifest['renders_planned']} renders ({skipped[0]['reason']})")
+    print(f"Total: {manifest['total_seconds']:.2f} seconds")
+    print(f"Manifest: {manifest_path}")
+    print("=============================\n")
+    return manifest
+
+def find_poem(poetry_data, title):
+    """Return the first poem whose title matches case-insensitively, or None."""
+    title = title.strip().lower()
+    for poem in poetry_data:
+        if poem.get("title", "").strip().lower() == title:
+            return poem
+    return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render many arrangements of one poem.")
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("--poem-file", help="Poem file (.json or .txt) to render")
+    parser.add_argument("--title", help="Title of a poem in the corpus to render")
+    parser.add_argument("--adjust-lyrics", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    configure_model_budget(config.get("pipeline"))
+    configure_thread_budget(config)
+    configure_output_dir(config)
+    if args.poem_file:
+        poem = process_uploaded_file(args.poem_file)
+    elif args.title:
+        with open(config["nlp_analysis"]["input_file"], "r", encoding="utf-8") as f:
+            poem = find_poem(json.load(f), args.title)
+    else:
+        parser.error("one of --poem-file or --title is required")
+    if not poem:
+        print("[Error] Failed to obtain a poem")
+    else:
+        run_sweep(config, poem, adjust_lyrics=args.adjust_lyrics)
@@ -0,0 +1,77 @@
+import wave
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from src import audio_decoding, recitation_generation
+from src.audio_decoding import decode_clips, FFMPEG_BATCH_CLIPS
+from src.audio_format import DEFAULT_AUDIO_FORMAT
+
+FRAMES = 441  # 10 ms of every decoded clip
+
+@pytest.fixture
+def ffmpeg_only(monkeypatch):
+    """No in-process decoder; the batched ffmpeg decoder is stubbed and records its batches."""
+    batches = []
+
+    def decode_batch(clips, audio_format=None):
+        batches.append(len(clips))
+        return [np.full((FRAMES, 2), int(clip), dtype=np.int16) for clip in clips]
+
+    monkeypatch.setattr(audio_decoding, "in_process_backend", lambda: None)
+    monkeypatch.setattr(recitation_generation, "in_process_backend", lambda: None)
+    monkeypatch.setattr(audio_decoding, "decode_mp3_batch_ffmpeg", decode_batch)
+    monkeypatch.setattr(recitation_generation, "fetch_line_mp3", lambda line: line.split()[-1].encode())
+    return batches
+
+def test_block_rendering_decodes_lines_in_fixed_size_groups(ffmpeg_only, tmp_path):
+    lines = [f"line {i}" for i in range(2 * FFMPEG_BATCH_CLIPS + 3)]
+    lines.insert(5, "   ")  # blank lines are skipped
+    path = str(tmp_path / "recitation.wav")
+    length = recitation_generation.generate_recitation_to_file(lines, path, pauses=[0] * len(lines))
+    assert ffmpeg_only == [FFMPEG_BATCH_CLIPS, FFMPEG_BATCH_CLIPS, 3]
+    with wave.open(path, "rb") as f:
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16).reshape(-1, 2)
+    assert len(samples) == (2 * FFMPEG_BATCH_CLIPS + 3) * FRAMES
+    assert length == pytest.approx(len(samples) / DEFAULT_AUDIO_FORMAT["frame_rate"])
+    assert samples[0, 0] == 0 and samples[-1, 0] == 2 * FFMPEG_BATCH_CLIPS + 2
+
+def test_a_line_that_fails_to_synthesize_keeps_its_pause(ffmpeg_only, monkeypatch, tmp_path):
+    def fetch(line):
+        if line == "line 1":
+            raise OSError("no network")
+        return line.split()[-1].encode()
+
+    monkeypatch.setattr(recitation_generation, "fetch_line_mp3", fetch)
+    path = str(tmp_path / "recitation.wav")
+    length = recitation_generation.generate_recitation_to_file(["line 0", "line 1", "line 2"], path)
+    rate = DEFAULT_AUDIO_FORMAT["frame_rate"]
+    assert ffmpeg_only == [2]
+    assert length == pytest.approx((2 * FRAMES + 3 * rate // 2) / rate)
+
+def test_failed_in_process_decoding_falls_back_to_one_ffmpeg_batch(ffmpeg_only, monkeypatch):
+    def broken(data):
+        raise ValueError("corrupt frame")
+
+    monkeypatch.setattr(audio_decoding, "in_process_backend", lambda: "miniaudio")
+    monkeypatch.setattr(audio_decoding, "decode_mp3", broken)
+    segments, decoders = decode_clips([b"1", b"2", b"3"])
+    assert ffmpeg_only == [3] and decoders == "ffmpeg (batched)"
+    assert [s.get_array_of_samples()[0] for s in segments] == [1, 2, 3]
+
+def test_failed_batch_decodes_clips_one_by_one(monkeypatch):
+    def broken_batch(clips, audio_format=None):
+        raise OSError("ffmpeg crashed")
+
+    def from_file(file, format=None):
+        value = int(file.read())
+        if value == 2:
+            raise ValueError("unreadable clip")
+        return AudioSegment(data=np.full((FRAMES, 2), value, dtype=np.int16).tobytes(),
+                            frame_rate=DEFAULT_AUDIO_FORMAT["frame_rate"], channels=2, sample_width=2)
+
+    monkeypatch.setattr(audio_decoding, "in_process_backend", lambda: None)
+    monkeypatch.setattr(audio_decoding, "decode_mp3_batch_ffmpeg", broken_batch)
+    monkeypatch.setattr(AudioSegment, "from_file", staticmethod(from_file))
+    segments, decoders = decode_clips([b"1", b"2", b"3"])
+    assert decoders == "ffmpeg"
+    assert segments[1] is None and [segments[i].get_array_of_samples()[0] for i in (0, 2)] == [1, 3]
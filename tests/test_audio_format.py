@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from src.audio_format import to_canonical, get_audio_format, DEFAULT_AUDIO_FORMAT
+
+def segment(samples, frame_rate=44100, sample_width=2):
+    """AudioSegment from a (frames x channels) array of signed samples."""
+    samples = np.asarray(samples)
+    if sample_width == 3:
+        data = b"".join(int(v).to_bytes(3, "little", signed=True) for v in samples.ravel())
+    else:
+        data = samples.astype({1: np.int8, 2: np.int16, 4: np.int32}[sample_width]).tobytes()
+    return AudioSegment(data=data, frame_rate=frame_rate, channels=samples.shape[1], sample_width=sample_width)
+
+def samples_of(audio):
+    return np.array(audio.get_array_of_samples()).reshape(-1, audio.channels)
+
+def sine(frame_rate, seconds=0.5, frequency=440.0, amplitude=16000):
+    t = np.arange(int(frame_rate * seconds)) / frame_rate
+    return np.round(amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.int16)[:, None]
+
+def test_canonical_input_is_returned_unchanged():
+    audio = segment(np.zeros((10, 2)))
+    assert to_canonical(audio) is audio
+
+@pytest.mark.parametrize("source_rate", [22050, 48000, 16000])
+def test_rate_conversion_keeps_duration_and_level(source_rate):
+    audio = to_canonical(segment(np.repeat(sine(source_rate), 2, axis=1), frame_rate=source_rate))
+    assert (audio.frame_rate, audio.channels, audio.sample_width) == (44100, 2, 2)
+    assert audio.get_array_of_samples().typecode == "h"
+    frames = samples_of(audio)
+    assert len(frames) == int(np.ceil(source_rate * 0.5 * 44100 / source_rate))
+    # Away from the edges the 440 Hz tone keeps its amplitude
+    assert np.abs(frames[2000:-2000]).max() == pytest.approx(16000, rel=0.02)
+
+def test_mono_is_duplicated_to_stereo():
+    mono = sine(44100)
+    frames = samples_of(to_canonical(segment(mono)))
+    assert frames.shape == (len(mono), 2)
+    assert np.array_equal(frames[:, 0], mono[:, 0]) and np.array_equal(frames[:, 1], mono[:, 0])
+
+def test_stereo_is_averaged_to_mono():
+    stereo = np.array([[1000, 3000], [-2000, 0]])
+    audio = to_canonical(segment(stereo), dict(DEFAULT_AUDIO_FORMAT, channels=1))
+    assert samples_of(audio)[:, 0].tolist() == [2000, -1000]
+
+def test_8_bit_is_scaled_to_16_bit():
+    audio = to_canonical(segment([[64, -128], [0, 127]], sample_width=1))
+    assert audio.sample_width == 2
+    assert samples_of(audio).tolist() == [[16384, -32768], [0, 32512]]
+
+def test_24_bit_is_scaled_to_16_bit():
+    audio = to_canonical(segment([[0x400000, -0x800000], [0x7FFFFF, 0x100]], sample_width=3))
+    assert audio.sample_width == 2
+    assert samples_of(audio).tolist() == [[16384, -32768], [32767, 1]]
+
+def test_16_bit_to_32_bit_and_back_is_lossless():
+    original = np.repeat(sine(44100), 2, axis=1)
+    wide = to_canonical(segment(original), dict(DEFAULT_AUDIO_FORMAT, sample_width=4))
+    assert np.array_equal(samples_of(to_canonical(wide)), original)
+
+def test_unsupported_sample_width_is_rejected():
+    with pytest.raises(ValueError):
+        get_audio_format({"audio_format": {"sample_width": 3}})
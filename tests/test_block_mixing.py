@@ -0,0 +1,75 @@
+import wave
+import numpy as np
+import pretty_midi
+import pytest
+from src import music_synthesis
+from src.music_synthesis import mix_wav_files, render_plan_blocked
+
+FRAME_RATE = 1000
+
+def write_wav(path, samples, channels=2, sample_width=2, frame_rate=FRAME_RATE):
+    with wave.open(str(path), "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(sample_width)
+        out.setframerate(frame_rate)
+        out.writeframes(np.asarray(samples, dtype={1: np.uint8, 2: np.int16}[sample_width]).tobytes())
+    return str(path)
+
+def read_wav(path):
+    with wave.open(str(path), "rb") as f:
+        return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16).reshape(-1, f.getnchannels())
+
+def constant(frames, value):
+    return np.full((frames, 2), value, dtype=np.int16)
+
+@pytest.mark.parametrize("recitation_frames, melody_frames", [(25, 40), (40, 25), (30, 30)])
+def test_inputs_of_different_lengths_are_padded_with_silence(tmp_path, recitation_frames, melody_frames):
+    recitation = write_wav(tmp_path / "rec.wav", constant(recitation_frames, 1000))
+    melody = write_wav(tmp_path / "mel.wav", constant(melody_frames, 100))
+    # 10-frame windows, so the shorter input ends inside a window
+    seconds = mix_wav_files(recitation, melody, str(tmp_path / "out.wav"), 0, 0, block_seconds=0.01)
+    mixed = read_wav(tmp_path / "out.wav")
+    frames = max(recitation_frames, melody_frames)
+    assert seconds == pytest.approx(frames / FRAME_RATE) and mixed.shape == (frames, 2)
+    expected = np.zeros((frames, 2))
+    expected[:recitation_frames] += 1000
+    expected[:melody_frames] += 100
+    assert np.array_equal(mixed, expected)
+
+def test_gains_are_applied_and_the_sum_is_clipped(tmp_path):
+    recitation = write_wav(tmp_path / "rec.wav", np.vstack([constant(5, 30000), constant(5, -30000)]))
+    melody = write_wav(tmp_path / "mel.wav", np.vstack([constant(5, 20000), constant(5, -20000)]))
+    mix_wav_files(recitation, melody, str(tmp_path / "out.wav"), 0, 0)
+    mixed = read_wav(tmp_path / "out.wav")
+    assert np.all(mixed[:5] == 32767) and np.all(mixed[5:] == -32768)
+
+    mix_wav_files(recitation, melody, str(tmp_path / "quiet.wav"), -6.0206, -20)
+    assert np.all(np.abs(read_wav(tmp_path / "quiet.wav")[:5] - (15000 + 2000)) <= 1)
+
+@pytest.mark.parametrize("channels, sample_width", [(1, 2), (2, 1)])
+def test_non_16_bit_stereo_input_is_rejected(tmp_path, channels, sample_width):
+    frames = np.zeros(10 * channels)
+    recitation = write_wav(tmp_path / "rec.wav", frames, channels, sample_width)
+    melody = write_wav(tmp_path / "mel.wav", frames, channels, sample_width)
+    with pytest.raises(ValueError, match="16-bit stereo"):
+        mix_wav_files(recitation, melody, str(tmp_path / "out.wav"), 0, 0)
+
+def test_mismatched_formats_are_rejected(tmp_path):
+    recitation = write_wav(tmp_path / "rec.wav", np.zeros(10), channels=1)
+    melody = write_wav(tmp_path / "mel.wav", constant(10, 0))
+    with pytest.raises(ValueError, match="does not match"):
+        mix_wav_files(recitation, melody, str(tmp_path / "out.wav"), 0, 0)
+
+class StubSynth:
+    def midi_to_audio(self, midi_file, wav_file):
+        write_wav(wav_file, constant(50, 200))
+
+def test_render_plan_blocked_mixes_the_rendered_melody(tmp_path, monkeypatch):
+    monkeypatch.setattr(music_synthesis, "OUTPUT_DIR", str(tmp_path))
+    recitation = write_wav(tmp_path / "rec.wav", constant(80, 1000))
+    pm = pretty_midi.PrettyMIDI()
+    config = {"soundfont_path": "soundfont.sf2", "recitation_volume": 0, "melody_volume": 0, "block_seconds": 0.03}
+    final = render_plan_blocked(config, "poem", "tag", "plana", recitation, pm, fs=StubSynth(),
+                                audio_format={"frame_rate": FRAME_RATE, "channels": 2, "sample_width": 2})
+    mixed = read_wav(final)
+    assert mixed.shape == (80, 2) and np.all(mixed[:50] == 1200) and np.all(mixed[50:] == 1000)
@@ -0,0 +1,34 @@
+import json
+from src.bulk_ingest import ingest, parse_file_for_ingest
+
+GOOD = {"title": "Ode", "author": "Anon", "lines": ["first line", "second line"]}
+
+def write_json(path, data):
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return str(path)
+
+def test_malformed_records_are_rejected_one_by_one(tmp_path):
+    path = write_json(tmp_path / "poems.json", [
+        GOOD,
+        {"title": None, "author": "Anon", "lines": ["a line"]},
+        {"title": "Untitled", "author": 7, "lines": ["a line"]},
+        {"title": "Blank", "author": "Anon", "lines": ["", "   "]},
+        "not a poem"
+    ])
+    _, poems, reasons = parse_file_for_ingest(path)
+    assert [p["title"] for p in poems] == ["Ode"]
+    assert sorted(reasons) == ["Invalid JSON format"] * 3 + ["No valid lines found"]
+
+def test_ingest_writes_the_good_poems_of_a_file_with_bad_records(tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    write_json(inbox / "poems.json", [GOOD, {"title": None, "author": None, "lines": ["x"]}])
+    write_json(inbox / "single.json", dict(GOOD, title="Second"))
+    (inbox / "poem.txt").write_text("Third\nAnon\nfirst line\n", encoding="utf-8")
+    corpus_path = str(tmp_path / "corpus.json")
+    stats = ingest([str(inbox)], corpus_path, workers=1)
+    assert stats["poems_added"] == 3 and stats["rejects"] == {"Invalid JSON format": 1}
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        assert sorted(p["title"] for p in json.load(f)) == ["Ode", "Second", "Third"]
+    # Re-ingesting the same files adds nothing
+    assert ingest([str(inbox)], corpus_path, workers=1)["duplicates"] == 3
@@ -0,0 +1,42 @@
+import os
+from src.stage_scheduler import StageCache
+from src.corpus_run import _PoemCache, PRUNED_STAGES
+
+def test_completed_poem_drops_its_recitation_entry(tmp_path):
+    cache = StageCache(str(tmp_path))
+    cache.put("recitation-old", {"recitation_audio": b"other poem"})
+    poem_cache = _PoemCache(cache)
+    poem_cache.put("sentiment-abc", {"sentiment": "Positive"})
+    poem_cache.put("recitation-abc", {"recitation_audio": b"audio"})
+    poem_cache.prune(PRUNED_STAGES)
+    assert sorted(os.listdir(tmp_path)) == ["recitation-old.pkl", "sentiment-abc.pkl"]
+    assert cache.get("recitation-abc") is None
+
+def test_refresh_stage_misses_but_is_stored(tmp_path):
+    cache = StageCache(str(tmp_path))
+    cache.put("mapping-abc", {"mapped_poem": 1})
+    poem_cache = _PoemCache(cache, "mapping")
+    assert poem_cache.get("mapping-abc") is None
+    poem_cache.put("mapping-abc", {"mapped_poem": 2})
+    assert cache.get("mapping-abc") == {"mapped_poem": 2}
+
+def test_duplicate_poems_are_run_once(tmp_path, monkeypatch):
+    from src import corpus_run
+    from src.poem_record import PoemRecord
+    runs = []
+
+    def run_pipeline(config, poem, adjust_lyrics, cache=None, on_stage_done=None, run_tag=None):
+        runs.append((poem["title"], run_tag))
+        return {"failed": None, "error": None, "poem": PoemRecord.from_dict(poem)}
+
+    monkeypatch.setattr(corpus_run, "run_pipeline", run_pipeline)
+    raven = {"title": "The Raven", "author": "Poe", "lines": ["once upon a midnight dreary"]}
+    poems = [raven, {"title": "Ozymandias", "author": "Shelley", "lines": ["look on my works"]}, dict(raven)]
+    summary = corpus_run.run_corpus({"pipeline": {}}, poems, str(tmp_path / "run"))
+    assert [title for title, _ in runs] == ["The Raven", "Ozymandias"]
+    assert (summary["completed"], summary["duplicates"], summary["skipped"]) == (2, 1, 0)
+    assert len(summary["poems"]) == 2
+
+    # On resume the first copy is complete and the repeat is still only a duplicate
+    summary = corpus_run.run_corpus({"pipeline": {}}, poems, str(tmp_path / "run"))
+    assert len(runs) == 2 and (summary["skipped"], summary["duplicates"]) == (2, 1)
@@ -0,0 +1,54 @@
+import time
+import pytest
+from src import framework_workers
+from src.audio_format import silence
+from src.framework_workers import FrameworkWorker, share_audio, receive_audio, _release_unsent_blocks
+
+FORMAT = {"frame_rate": 8000, "channels": 1, "sample_width": 2}
+
+def _tone(config, ms):
+    return {"pm": "melody", "melody_audio": share_audio(silence(ms, FORMAT) + 3)}
+
+def _pending(config):
+    return len(framework_workers._UNSENT_BLOCKS)
+
+def _hang(config):
+    time.sleep(60)
+
+def _test_worker_main(kind, config, conn):
+    """The real worker loop, serving the test handlers."""
+    framework_workers.HANDLERS[kind] = {"tone": _tone, "pending": _pending, "hang": _hang}
+    framework_workers._worker_main(kind, config, conn)
+
+@pytest.fixture
+def worker(monkeypatch, tmp_path):
+    monkeypatch.setattr(framework_workers, "_worker_main", _test_worker_main)
+    config = {"pipeline": {"output_dir": str(tmp_path), "framework_workers": {"timeout_seconds": 20}}}
+    worker = FrameworkWorker("tensorflow", config)
+    yield worker
+    worker.stop()
+
+def test_shared_block_lives_until_released():
+    audio = silence(250, FORMAT)
+    descriptor = share_audio(audio)
+    assert receive_audio(descriptor).raw_data == audio.raw_data
+    assert receive_audio(descriptor).raw_data == audio.raw_data
+    _release_unsent_blocks()
+    with pytest.raises(FileNotFoundError):
+        receive_audio(descriptor)
+
+def test_worker_audio_is_copied_before_the_block_is_freed(worker):
+    result = worker.call("tone", ms=120)
+    assert result["pm"] == "melody"
+    assert len(result["melody_audio"]) == 120 and result["melody_audio"].frame_rate == 8000
+    assert worker.call("pending") == 0
+
+def test_unresponsive_worker_is_restarted(worker):
+    assert worker.call("pending") == 0
+    first_pid = worker._process.pid
+    worker.timeout = 1
+    with pytest.raises(RuntimeError, match="no reply"):
+        worker.call("hang")
+    worker.timeout = 20
+    assert worker.call("pending") == 0
+    assert worker._process.pid != first_pid
@@ -0,0 +1,153 @@
+import copy
+import json
+import os
+from contextlib import contextmanager
+import numpy as np
+import pytest
+from src import nlp_analysis
+from src.incremental_analysis import reanalyze_corpus, ANALYSIS_GROUPS
+from src.theme_classification import clear_centroid_cache
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "config.json")
+
+VOCABULARY = ["sea", "river", "tree", "heart", "kiss", "grave", "night", "war"]
+
+CORPUS = [
+    {"title": "Tide", "author": "A", "lines": ["the sea and the river", "run to the sea"]},
+    {"title": "Vow", "author": "B", "lines": ["my heart", "a kiss at night"]},
+    {"title": "Yew", "author": "C", "lines": ["a grave", "beneath the tree"]},
+    {"title": "Drum", "author": "D", "lines": ["the war", "is near"]}
+]
+
+class StubEmbedder:
+    """Embeds a text as the sum of one-hot vectors of its known words."""
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), len(VOCABULARY)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                if word in VOCABULARY:
+                    vectors[row, VOCABULARY.index(word)] += 1.0
+        return vectors
+
+class StubKeyBERT:
+    def __init__(self):
+        self.model = StubEmbedder()
+        self.calls = 0
+
+    def extract_keywords(self, text, top_n):
+        self.calls += 1
+        return [(word, 1.0) for word in text.split() if word in VOCABULARY][:top_n]
+
+@pytest.fixture
+def models(monkeypatch):
+    """Stub emotion classifier (label chosen by model name) and keyword model; records their calls."""
+    calls = {"emotion": [], "keywords": StubKeyBERT()}
+
+    def classify_emotion(text, model_name, device):
+        calls["emotion"].append(text)
+        return "Sadness" if model_name == "other-emotion-model" else "Joy"
+
+    @contextmanager
+    def keyword_model(model_name):
+        yield calls["keywords"]
+
+    monkeypatch.setattr(nlp_analysis, "classify_emotion", classify_emotion)
+    monkeypatch.setattr(nlp_analysis, "keyword_model", keyword_model)
+    clear_centroid_cache()
+    yield calls
+    clear_centroid_cache()
+
+@pytest.fixture
+def config():
+    with open(CONFIG_PATH, "r") as f:
+        config = json.load(f)
+    config["nlp_analysis"]["theme_categories"] = {"Nature": ["sea", "river", "tree"], "Love": ["heart", "kiss"],
+                                                  "Death": ["grave"]}
+    config["nlp_analysis"]["theme_min_similarity"] = 0.3
+    return config
+
+def run(config, tmp_path, corpus, **kwargs):
+    return reanalyze_corpus(config, corpus=copy.deepcopy(corpus), nlp_file=str(tmp_path / "nlp.json"),
+                            music_file=str(tmp_path / "music.json"), **kwargs)
+
+def read(tmp_path, name):
+    with open(tmp_path / name, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def test_first_run_analyses_every_poem(config, models, tmp_path):
+    stats = run(config, tmp_path, CORPUS)
+    assert (stats["new"], stats["edited"], stats["removed"], stats["unchanged"]) == (4, 0, 0, 0)
+    assert stats["recomputed"] == {group: 4 for group in ANALYSIS_GROUPS}
+    assert stats["remapped"] == 4 and stats["work_skipped"] == 0.0
+    nlp, music = read(tmp_path, "nlp.json"), read(tmp_path, "music.json")
+    assert [p["title"] for p in nlp] == [p["title"] for p in music] == ["Tide", "Vow", "Yew", "Drum"]
+    assert [p["theme"] for p in nlp] == ["Nature", "Love", "Death", "Other"]
+    assert all("music_params" not in p for p in nlp) and all(p["music_params"] for p in music)
+    assert set(music[0]["analysis_versions"]) == set(ANALYSIS_GROUPS) | {"mapping"}
+
+def test_unchanged_corpus_skips_all_work(config, models, tmp_path):
+    run(config, tmp_path, CORPUS)
+    models["emotion"].clear()
+    os.utime(tmp_path / "nlp.json", (1, 1))
+    os.utime(tmp_path / "music.json", (1, 1))
+    stats = run(config, tmp_path, CORPUS)
+    assert stats["unchanged"] == 4 and stats["new"] == stats["edited"] == stats["removed"] == 0
+    assert stats["recomputed"] == {group: 0 for group in ANALYSIS_GROUPS}
+    assert stats["remapped"] == 0 and stats["work_skipped"] == 1.0
+    assert models["emotion"] == []
+    # Nothing changed, so neither file is rewritten
+    assert os.path.getmtime(tmp_path / "nlp.json") == os.path.getmtime(tmp_path / "music.json") == 1
+
+def test_new_edited_and_removed_poems(config, models, tmp_path):
+    run(config, tmp_path, CORPUS)
+    models["emotion"].clear()
+    corpus = copy.deepcopy(CORPUS)
+    corpus[1]["lines"] = ["my heart", "a kiss by the sea"]  # edited: same title and author
+    del corpus[2]  # removed
+    corpus.append({"title": "Moor", "author": "E", "lines": ["night on the moor"]})  # new
+    stats = run(config, tmp_path, corpus)
+    assert (stats["new"], stats["edited"], stats["removed"], stats["unchanged"]) == (1, 1, 1, 2)
+    assert stats["recomputed"] == {group: 2 for group in ANALYSIS_GROUPS}
+    assert stats["remapped"] == 2
+    assert stats["work_skipped"] == pytest.approx(1 - 12 / 24, abs=1e-4)
+    assert models["emotion"] == ["my heart a kiss by the sea", "night on the moor"]
+    for name in ("nlp.json", "music.json"):
+        records = read(tmp_path, name)
+        assert [p["title"] for p in records] == ["Tide", "Vow", "Drum", "Moor"]
+        assert records[1]["lines"] == ["my heart", "a kiss by the sea"]
+
+def test_new_emotion_model_reruns_only_emotion(config, models, tmp_path):
+    run(config, tmp_path, CORPUS)
+    models["emotion"].clear()
+    keyword_calls = models["keywords"].calls
+    config["nlp_analysis"]["emotion_model"] = "other-emotion-model"
+    stats = run(config, tmp_path, CORPUS)
+    assert stats["recomputed"] == {"sentiment": 0, "emotion": 4, "keywords": 0, "theme": 0, "rhyme": 0}
+    assert stats["remapped"] == 4 and stats["unchanged"] == 4
+    assert len(models["emotion"]) == 4 and models["keywords"].calls == keyword_calls
+    assert [p["emotion"] for p in read(tmp_path, "nlp.json")] == ["Sadness"] * 4
+    assert [p["music_params"]["melody_shape"] for p in read(tmp_path, "music.json")] == ["descending"] * 4
+
+def test_new_theme_categories_rerun_only_themes(config, models, tmp_path):
+    run(config, tmp_path, CORPUS)
+    models["emotion"].clear()
+    keyword_calls = models["keywords"].calls
+    config["nlp_analysis"]["theme_categories"]["War"] = ["war"]
+    stats = run(config, tmp_path, CORPUS)
+    assert stats["recomputed"] == {"sentiment": 0, "emotion": 0, "keywords": 0, "theme": 4, "rhyme": 0}
+    assert models["emotion"] == [] and models["keywords"].calls == keyword_calls
+    assert [p["theme"] for p in read(tmp_path, "nlp.json")] == ["Nature", "Love", "Death", "War"]
+
+def test_theme_from_keywords_follows_the_keyword_version(config, models, tmp_path):
+    config["nlp_analysis"]["theme_source"] = "keywords"
+    run(config, tmp_path, CORPUS)
+    config["nlp_analysis"]["keyword_top_n"] = 2
+    stats = run(config, tmp_path, CORPUS)
+    assert stats["recomputed"]["keywords"] == stats["recomputed"]["theme"] == 4
+    assert stats["recomputed"]["emotion"] == 0
+
+def test_dry_run_reports_without_writing(config, models, tmp_path):
+    stats = run(config, tmp_path, CORPUS, dry_run=True)
+    assert stats["new"] == 4 and stats["recomputed"]["emotion"] == 4 and stats["dry_run"]
+    assert models["emotion"] == []
+    assert not (tmp_path / "nlp.json").exists() and not (tmp_path / "music.json").exists()
@@ -0,0 +1,23 @@
+from src import model_residency
+from src.model_residency import ModelResidencyManager
+from src.melody_generation import musicvae_estimate_bytes, DEFAULT_MUSICVAE_BYTES
+
+def test_estimate_counts_when_memory_cannot_be_measured(monkeypatch):
+    monkeypatch.setattr(model_residency, "process_rss_bytes", lambda: None)
+    manager = ModelResidencyManager(budget_bytes=100)
+    with manager.acquire("musicvae", lambda: object(), estimate_bytes=80):
+        pass
+    assert manager.resident_bytes() == 80
+    with manager.acquire("other", lambda: object(), estimate_bytes=50):
+        pass
+    # MusicVAE counted toward the budget, so it was evicted to make room
+    assert manager._residents["musicvae"].model is None
+    assert manager.resident_bytes() == 50
+
+def test_musicvae_estimate_sources(tmp_path):
+    checkpoint = tmp_path / "cat-mel_2bar_big.ckpt"
+    (tmp_path / "cat-mel_2bar_big.ckpt.data-00000-of-00001").write_bytes(b"\0" * 1000)
+    (tmp_path / "cat-mel_2bar_big.ckpt.index").write_bytes(b"\0" * 24)
+    assert musicvae_estimate_bytes({"musicvae_checkpoint_path": str(checkpoint)}) == 2048
+    assert musicvae_estimate_bytes({"musicvae_checkpoint_path": str(checkpoint), "musicvae_memory_mb": 2}) == 2 * 2**20
+    assert musicvae_estimate_bytes({"musicvae_checkpoint_path": str(tmp_path / "missing.ckpt")}) == DEFAULT_MUSICVAE_BYTES
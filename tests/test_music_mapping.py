@@ -0,0 +1,9 @@
+from src.music_mapping import map_sentiment, DEFAULT_TABLES
+
+def test_mapped_chord_progression_is_not_shared_with_the_table():
+    mapped = map_sentiment("Positive")
+    mapped["chord_progression"].append([0, 0, 0])
+    mapped["chord_progression"][0][0] = 0
+    assert map_sentiment("Positive") == DEFAULT_TABLES["sentiment"]["positive"]
+    assert DEFAULT_TABLES["sentiment"]["positive"]["chord_progression"][0] == [60, 64, 67]
+    assert len(DEFAULT_TABLES["sentiment"]["positive"]["chord_progression"]) == 4
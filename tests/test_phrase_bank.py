@@ -0,0 +1,34 @@
+import os
+from types import SimpleNamespace
+import pytest
+from src import melody_generation
+from src.phrase_bank import build_phrase_bank, load_phrase_bank, MAX_EMPTY_BATCHES
+
+class FakeModel:
+    def __init__(self, notes):
+        self.notes = notes
+        self.batches = 0
+
+    def sample(self, n, length, temperature):
+        self.batches += 1
+        return [SimpleNamespace(notes=list(self.notes), tempos=[]) for _ in range(n)]
+
+def use_model(monkeypatch, model):
+    monkeypatch.setattr(melody_generation, "load_musicvae_model", lambda config, batch_size: model)
+
+def test_only_empty_samples_raise(monkeypatch, tmp_path):
+    model = FakeModel([])
+    use_model(monkeypatch, model)
+    with pytest.raises(RuntimeError):
+        build_phrase_bank({}, 4, str(tmp_path / "bank.npz"), batch_size=2)
+    assert model.batches == MAX_EMPTY_BATCHES
+
+def test_rebuilt_bank_is_reloaded(monkeypatch, tmp_path):
+    path = str(tmp_path / "bank.npz")
+    note = SimpleNamespace(pitch=60, start_time=0.0, end_time=0.5, velocity=80)
+    use_model(monkeypatch, FakeModel([note]))
+    build_phrase_bank({}, 2, path, batch_size=2)
+    assert len(load_phrase_bank(path)["contour"]) == 2
+    build_phrase_bank({}, 3, path, batch_size=2)
+    os.utime(path, (1, 1))  # The rebuild may land within the filesystem's timestamp resolution
+    assert len(load_phrase_bank(path)["contour"]) == 3
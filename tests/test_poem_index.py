@@ -0,0 +1,65 @@
+import json
+import os
+import numpy as np
+import pytest
+from src.theme_classification import _normalize_rows
+from src.poem_index import (exact_top_k, build_ivf, build_poem_index, PoemIndex,
+                            EMBEDDINGS_FILE, META_FILE, IVF_FILE)
+
+def random_rows(n, dim=16, seed=0):
+    return _normalize_rows(np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32))
+
+def brute_force(matrix, queries, k, exclude=None):
+    scores = queries @ matrix.T
+    for q, row in enumerate(exclude or []):
+        scores[q, row] = -np.inf
+    return np.argsort(-scores, axis=1, kind="stable")[:, :k]
+
+def test_exact_top_k_matches_brute_force_across_blocks():
+    matrix, queries = random_rows(500), random_rows(7, seed=1)
+    rows, scores = exact_top_k(matrix, queries, 10, block_rows=64)
+    assert np.array_equal(rows, brute_force(matrix, queries, 10))
+    assert np.allclose(scores, np.take_along_axis(queries @ matrix.T, rows, axis=1))
+    assert np.all(np.diff(scores, axis=1) <= 0)
+
+def test_exact_top_k_excludes_rows_and_caps_k():
+    matrix = random_rows(20)
+    rows, _ = exact_top_k(matrix, matrix[[3, 7]], 5, exclude=[3, 7], block_rows=6)
+    assert np.array_equal(rows, brute_force(matrix, matrix[[3, 7]], 5, exclude=[3, 7]))
+    assert exact_top_k(matrix, matrix[:1], 50)[0].shape == (1, 20)
+
+def write_index(index_dir, matrix, n_lists):
+    np.save(os.path.join(index_dir, EMBEDDINGS_FILE), matrix)
+    with open(os.path.join(index_dir, META_FILE), "w") as f:
+        json.dump({"model_name": "test", "poem_ids": [f"p{i}" for i in range(len(matrix))]}, f)
+    centroids, order, offsets = build_ivf(matrix, n_lists)
+    np.savez(os.path.join(index_dir, IVF_FILE), centroids=centroids, order=order, offsets=offsets)
+    return PoemIndex(index_dir)
+
+def test_ivf_lists_partition_the_rows():
+    _, order, offsets = build_ivf(random_rows(300), 8)
+    assert sorted(order.tolist()) == list(range(300))
+    assert offsets[0] == 0 and offsets[-1] == 300
+
+def test_ivf_probing_every_list_equals_exact_search(tmp_path):
+    matrix = random_rows(400)
+    index = write_index(str(tmp_path), matrix, 8)
+    queries = random_rows(5, seed=2)
+    exact = index.search_vectors(queries, k=10)
+    approximate = index.search_vectors(queries, k=10, n_probe=8)
+    for exact_hits, ivf_hits in zip(exact, approximate):
+        assert [poem_id for poem_id, _ in ivf_hits] == [poem_id for poem_id, _ in exact_hits]
+        assert np.allclose([s for _, s in ivf_hits], [s for _, s in exact_hits])
+
+def test_ivf_with_few_probes_returns_true_similarities(tmp_path):
+    matrix = random_rows(400)
+    index = write_index(str(tmp_path), matrix, 8)
+    hits = index.similar_to("p5", k=10, n_probe=2)
+    assert "p5" not in [poem_id for poem_id, _ in hits]
+    for poem_id, score in hits:
+        assert score == pytest.approx(float(matrix[int(poem_id[1:])] @ matrix[5]), abs=1e-5)
+
+def test_build_poem_index_rejects_an_empty_corpus(tmp_path):
+    with pytest.raises(ValueError):
+        build_poem_index([], str(tmp_path), "test")
+    assert not os.path.exists(os.path.join(str(tmp_path), EMBEDDINGS_FILE))
@@ -0,0 +1,54 @@
+import pickle
+from types import MappingProxyType
+import pytest
+from src.poem_record import PoemRecord, load_records, write_records
+
+POEM = {
+    "title": "Ode",
+    "author": "Anon",
+    "lines": ["first line", "second line"],
+    "linecount": "2",
+    "sentiment": "Positive",
+    "keywords": ["sea", "light"],
+    "theme": "Nature",
+    "theme_confidence": {"Nature": 0.7, "Love": 0.3},
+    "music_params": {"tempo": 96, "instruments": ["piano", "strings"], "scale": {"root": "C"}},
+    "custom_field": [1, 2]
+}
+
+def test_round_trip_keeps_the_json_shape():
+    record = PoemRecord.from_dict(POEM)
+    assert record.to_dict() == POEM
+    assert record["theme_confidence"] == POEM["theme_confidence"]
+    assert record.get("missing", "default") == "default"
+    assert "custom_field" in record and "emotion" not in record
+    with pytest.raises(KeyError):
+        record["emotion"]
+
+def test_pickle_round_trip():
+    record = PoemRecord.from_dict(POEM)
+    clone = pickle.loads(pickle.dumps(record))
+    assert isinstance(clone, PoemRecord)
+    assert clone.to_dict() == POEM
+
+def test_equal_music_params_are_shared_and_read_only():
+    first, second = PoemRecord.from_dict(POEM), PoemRecord.from_dict(dict(POEM, title="Other"))
+    assert first["music_params"] is second["music_params"]
+    assert isinstance(first["music_params"], MappingProxyType)
+    with pytest.raises(TypeError):
+        first["music_params"]["tempo"] = 120
+
+def test_copy_is_independent():
+    record = PoemRecord.from_dict(POEM)
+    clone = record.copy()
+    clone["sentiment"] = "Negative"
+    clone["custom_field"] = None
+    assert record["sentiment"] == "Positive" and record["custom_field"] == [1, 2]
+
+def test_write_and_load_records(tmp_path):
+    path = str(tmp_path / "poems.json")
+    write_records(path, [PoemRecord.from_dict(POEM), dict(POEM, title="Second")])
+    records = load_records(path)
+    assert [type(r) for r in records] == [PoemRecord, PoemRecord]
+    assert [r.to_dict() for r in records] == [POEM, dict(POEM, title="Second")]
+    assert load_records(str(tmp_path / "missing.json")) == []
@@ -0,0 +1,98 @@
+import os
+import numpy as np
+import pretty_midi
+import pytest
+from src.sample_renderer import (SampleCache, quantize_duration, sample_placements, render_from_samples,
+                                 write_wav_int16, MIN_SAMPLE_SECONDS, RELEASE_SECONDS)
+
+FRAME_RATE = 100
+
+class StubSynth:
+    """Renders every file as a constant 100 from start to end; counts the passes."""
+    def __init__(self):
+        self.passes = 0
+
+    def midi_to_audio(self, midi_file, wav_file):
+        self.passes += 1
+        frames = int(round(pretty_midi.PrettyMIDI(midi_file).get_end_time() * FRAME_RATE))
+        write_wav_int16(wav_file, np.full((frames, 2), 100, dtype=np.int16), FRAME_RATE)
+
+def melody(notes, program=0, drum=False):
+    pm = pretty_midi.PrettyMIDI()
+    instrument = pretty_midi.Instrument(program=program, is_drum=drum)
+    instrument.notes = [pretty_midi.Note(velocity=velocity, pitch=pitch, start=start, end=end)
+                        for pitch, velocity, start, end in notes]
+    pm.instruments.append(instrument)
+    return pm
+
+def key(pitch, duration=0.125, velocity=80):
+    return (0, (pitch,), velocity, duration)
+
+@pytest.mark.parametrize("duration, expected", [
+    (0.0, 0.125), (0.05, 0.125), (0.125, 0.125), (0.126, 0.25), (0.25, 0.25), (0.3, 0.5), (1.0, 1.0), (1.5, 2.0)
+])
+def test_quantize_duration_rounds_up_to_a_power_of_two_multiple(duration, expected):
+    assert quantize_duration(duration) == pytest.approx(expected)
+    assert quantize_duration(duration) >= duration and quantize_duration(duration) >= MIN_SAMPLE_SECONDS
+
+def test_notes_sharing_start_end_and_velocity_form_a_chord():
+    pm = melody([(64, 80, 0.0, 0.5), (60, 80, 0.0, 0.5), (67, 90, 0.0, 0.5), (60, 80, 1.0, 1.4)])
+    placements = sample_placements(pm)
+    assert placements == {
+        (0, (60, 64), 80, 0.5): [(0.0, 0.5)],
+        (0, (67,), 90, 0.5): [(0.0, 0.5)],
+        (0, (60,), 80, 0.5): [(1.0, pytest.approx(0.4))]
+    }
+
+def test_uncacheable_midi_has_no_placements():
+    assert sample_placements(melody([(36, 80, 0.0, 0.5)], drum=True)) is None
+    bent = melody([(60, 80, 0.0, 0.5)])
+    bent.instruments[0].pitch_bends.append(pretty_midi.PitchBend(100, 0.1))
+    assert sample_placements(bent) is None
+    many = melody([(60 + i, 80, i * 0.5, i * 0.5 + 0.5) for i in range(5)])
+    assert sample_placements(many, max_keys=4) is None and len(sample_placements(many, max_keys=5)) == 5
+
+def test_samples_are_mixed_at_their_start_times():
+    fs = StubSynth()
+    cache = SampleCache("soundfont.sf2", frame_rate=FRAME_RATE, fs=fs)
+    audio = render_from_samples(melody([(60, 80, 0.0, 0.25), (60, 80, 0.5, 0.75)]), cache)
+    sample_frames = int((0.25 + RELEASE_SECONDS) * FRAME_RATE)
+    # Both notes fill their sample, so each keeps its full release tail
+    assert audio.dtype == np.int16 and audio.shape == (50 + sample_frames, 2)
+    assert np.all(audio[:50] == 100) and np.all(audio[50:sample_frames] == 200) and np.all(audio[sample_frames:] == 100)
+    assert fs.passes == 1 and (cache.hits, cache.misses) == (0, 1)
+
+def test_a_note_shorter_than_its_sample_fades_out():
+    cache = SampleCache("soundfont.sf2", frame_rate=FRAME_RATE, fs=StubSynth())
+    audio = render_from_samples(melody([(60, 80, 0.0, 0.2)]), cache)
+    assert np.all(audio[:20] == 100)
+    tail = audio[20:, 0]
+    assert 0 < len(tail) <= 20 and np.all(np.diff(tail) <= 0) and tail[-1] < 100
+
+def test_missing_samples_render_in_one_pass_and_are_reused(tmp_path):
+    fs = StubSynth()
+    cache = SampleCache("soundfont.sf2", frame_rate=FRAME_RATE, cache_dir=str(tmp_path), fs=fs)
+    samples = cache.get_many([key(60), key(62, duration=0.5)])
+    assert fs.passes == 1 and len(os.listdir(tmp_path)) == 2
+    assert len(samples[key(60)]) == int(round((0.125 + RELEASE_SECONDS) * FRAME_RATE))
+    assert len(samples[key(62, duration=0.5)]) == int(round((0.5 + RELEASE_SECONDS) * FRAME_RATE))
+    reloaded = SampleCache("soundfont.sf2", frame_rate=FRAME_RATE, cache_dir=str(tmp_path), fs=fs)
+    assert np.array_equal(reloaded.get_many([key(60)])[key(60)], samples[key(60)])
+    assert fs.passes == 1 and reloaded.hits == 1
+
+def test_disk_cache_evicts_least_recently_used_samples(tmp_path):
+    fs = StubSynth()
+    cache = SampleCache("soundfont.sf2", frame_rate=FRAME_RATE, cache_dir=str(tmp_path), fs=fs)
+    cache.get_many([key(60)])
+    cache.get_many([key(62)])
+    size = os.path.getsize(cache._disk_path(key(60)))
+    os.utime(cache._disk_path(key(60)), (1, 1))
+    os.utime(cache._disk_path(key(62)), (2, 2))
+
+    bounded = SampleCache("soundfont.sf2", frame_rate=FRAME_RATE, cache_dir=str(tmp_path), fs=fs,
+                          max_disk_bytes=2 * size)
+    bounded.get_many([key(60)])  # read back from disk: now the most recently used
+    bounded.get_many([key(64)])
+    assert os.path.exists(cache._disk_path(key(60))) and os.path.exists(cache._disk_path(key(64)))
+    assert not os.path.exists(cache._disk_path(key(62)))
+    assert len(os.listdir(tmp_path)) == 2
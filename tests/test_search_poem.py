@@ -0,0 +1,55 @@
+import builtins
+import pytest
+import main
+
+POEMS = [
+    {"title": "The Raven", "author": "Edgar Allan Poe", "lines": ["once upon a midnight dreary"]},
+    {"title": "Annabel Lee", "author": "Edgar Allan Poe", "lines": ["in a kingdom by the sea"]},
+    {"title": "Ozymandias", "author": "Percy Bysshe Shelley", "lines": ["look on my works"]}
+]
+
+NLP_CONFIG = {"poem_index_min_similarity": 0.3}
+
+@pytest.fixture
+def search(monkeypatch):
+    """Run search_poem with scripted input; the index returns the hits in state["hits"]."""
+    state = {"hits": [], "queries": []}
+
+    def similar_poems(config, poetry_data, query=None, poem=None, k=5):
+        state["queries"].append(query)
+        return [(i, poetry_data[i], score) for i, score in state["hits"]]
+
+    def run(*answers):
+        replies = iter(answers)
+        monkeypatch.setattr(builtins, "input", lambda prompt="": next(replies))
+        return main.search_poem(POEMS, NLP_CONFIG)
+
+    monkeypatch.setattr(main, "similar_poems", similar_poems)
+    state["run"] = run
+    return state
+
+def test_a_unique_match_is_returned_without_asking_the_index(search):
+    search["hits"] = [(1, 0.9), (2, 0.8)]
+    assert search["run"]("raven") is POEMS[0]
+    assert search["queries"] == []
+
+def test_several_matches_are_offered(search, capsys):
+    assert search["run"]("poe", "2") is POEMS[1]
+    assert "Multiple matches found" in capsys.readouterr().out
+    assert search["queries"] == []
+
+def test_neighbours_are_listed_only_without_matches(search, capsys):
+    search["hits"] = [(2, 0.62), (0, 0.31), (1, 0.12)]
+    assert search["run"]("ruined statue", "1") is POEMS[2]
+    out = capsys.readouterr().out
+    assert "similar in meaning" in out and "similarity 0.62" in out
+    assert "Ozymandias" in out and "The Raven" in out and "Annabel Lee" not in out
+
+def test_a_single_neighbour_is_still_confirmed(search):
+    search["hits"] = [(2, 0.5)]
+    assert search["run"]("statue", "x") is None
+
+def test_no_match_when_every_neighbour_is_below_the_threshold(search, capsys):
+    search["hits"] = [(0, 0.29), (1, 0.1)]
+    assert search["run"]("spaceship") is None
+    assert "No poems found matching 'spaceship'" in capsys.readouterr().out
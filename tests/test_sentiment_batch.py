@@ -0,0 +1,68 @@
+import random
+import numpy as np
+import pytest
+from scipy import sparse
+from textblob import TextBlob
+from textblob.en import sentiment as pattern_sentiment
+from src.sentiment_batch import (polarity_batch, analyze_sentiment_batch, label_polarity, build_term_matrix,
+                                 load_polarity_lexicon)
+from src.nlp_analysis import analyze_sentiment
+
+# Negation windows, intensifiers, contractions, "!" and "(!)"
+CASES = ["very happy!", "not very good", "isn't great", "not a good day", "really not good", "not very very good",
+         "I can't. Really not good (!)", "Never, never a happy day!!!", "very very bad!!!", "", "the of and"]
+
+POEM_WORDS = ["the", "a", "of", "and", "in", "my", "heart", "sea", "night", "light", "love", "is", "not", "very",
+              "never", "no", "so", "bright", "dark", "sad", "happy", "I", "you", "was", "will", "!", ",", ".", ";",
+              "really", "truly", "isn't", "can't"]
+
+def poem_texts(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(POEM_WORDS) for _ in range(rng.randint(0, 120))) for _ in range(count)]
+
+def random_texts(count, seed=0):
+    rng = random.Random(seed)
+    vocabulary = sorted(pattern_sentiment.keys())
+    return [" ".join(rng.choice(vocabulary if rng.random() < 0.4 else POEM_WORDS) for _ in range(rng.randint(0, 60)))
+            for _ in range(count)]
+
+def textblob_polarity(texts):
+    return np.array([TextBlob(text).sentiment.polarity for text in texts])
+
+@pytest.mark.parametrize("text", CASES)
+def test_matches_textblob(text):
+    assert polarity_batch([text])[0] == pytest.approx(TextBlob(text).sentiment.polarity, abs=1e-12)
+
+def test_batch_scores_each_text_on_its_own():
+    texts = ["not", "good", "very", "happy!", "really", "not bad"] + poem_texts(50)
+    assert np.array_equal(polarity_batch(texts), np.concatenate([polarity_batch([text]) for text in texts]))
+
+def test_term_matrix_has_one_row_per_text():
+    lexicon = load_polarity_lexicon()
+    matrix, counts = build_term_matrix(["good", "not good", "very good", "nothing"], lexicon)
+    assert sparse.isspmatrix_csr(matrix) and matrix.shape == (4, len(lexicon["weights"]))
+    assert counts.tolist() == [1, 1, 1, 0]
+    good = lexicon["vocab"]["good"]
+    assert matrix[0, good] == 1.0 and matrix[1, good + len(lexicon["vocab"])] == 1.0
+    assert matrix[2, good] == pytest.approx(lexicon["intensity"][lexicon["vocab"]["very"]])
+
+def test_agrees_with_textblob_on_poem_text():
+    texts = poem_texts(1000)
+    batch, reference = polarity_batch(texts), textblob_polarity(texts)
+    assert np.mean(np.isclose(batch, reference, atol=1e-9)) > 0.95
+    assert np.mean(label_polarity(batch, 0.1) == label_polarity(reference, 0.1)) > 0.99
+
+def test_emoticons_are_not_scored():
+    assert polarity_batch(["happy :)"])[0] == polarity_batch(["happy"])[0]
+
+def test_polarity_stays_in_range():
+    polarity = polarity_batch(["very happy! " * 5, "very very bad!!!", "best best best!"] + random_texts(200, seed=1))
+    assert np.all(polarity >= -1.0) and np.all(polarity <= 1.0)
+
+def test_single_poem_and_corpus_paths_agree():
+    texts = poem_texts(200, seed=2)
+    agreement = np.mean(np.array(analyze_sentiment_batch(texts, 0.1)) == [analyze_sentiment(t, 0.1) for t in texts])
+    assert agreement > 0.99
+
+def test_empty_batch():
+    assert polarity_batch([]).shape == (0,)
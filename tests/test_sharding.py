@@ -0,0 +1,64 @@
+import json
+import os
+from collections import Counter
+from src.data_processing import poem_content_hash
+from src.poem_record import write_records
+from src.sharding import shard_of, shard_dir, select_shard, merge_shards
+
+def make_corpus(n):
+    return [{"title": f"Poem {i}", "author": "Anon", "lines": [f"line {i}", "the end"]} for i in range(n)]
+
+def test_shard_of_is_stable_and_balanced():
+    ids = [poem_content_hash(p) for p in make_corpus(400)]
+    shards = [shard_of(poem_id, 4) for poem_id in ids]
+    assert shards == [shard_of(poem_id, 4) for poem_id in ids]
+    counts = Counter(shards)
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > 60
+
+def test_select_shard_partitions_the_corpus():
+    corpus = make_corpus(50)
+    indices = sorted(i for shard in range(3) for i in select_shard(corpus, shard, 3)[1])
+    assert indices == list(range(50))
+
+def write_shard(run_root, shard, num_shards, corpus):
+    directory = shard_dir(run_root, shard, num_shards)
+    os.makedirs(directory)
+    poems, indices = select_shard(corpus, shard, num_shards)
+    renders, nlp, music_params = {}, [], []
+    # Written in reverse so the merge has to restore corpus order
+    for poem, index in reversed(list(zip(poems, indices))):
+        poem_id = poem_content_hash(poem)
+        renders[poem_id] = {"title": poem["title"], "index": index, "status": "done",
+                            "failed_stage": None, "artifacts": {}}
+        nlp.append(dict(poem, poem_id=poem_id))
+        music_params.append({"poem_id": poem_id, "title": poem["title"], "music_params": {"tempo": index}})
+    write_records(os.path.join(directory, "nlp.json"), nlp)
+    for name, value in (("renders.json", renders), ("music_params.json", music_params)):
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            json.dump(value, f)
+
+def test_merge_shards_restores_corpus_order_and_reports_missing(tmp_path):
+    corpus = make_corpus(30)
+    run_root = str(tmp_path)
+    for shard in (0, 2):
+        write_shard(run_root, shard, 3, corpus)
+
+    stats = merge_shards(run_root, 3, corpus=corpus)
+    expected = [i for i, p in enumerate(corpus) if shard_of(poem_content_hash(p), 3) != 1]
+    assert stats["missing_shards"] == [1]
+    assert stats["poems"] == len(expected)
+    assert stats["unrendered"] == [] and stats["duplicates"] == []
+
+    with open(os.path.join(run_root, "merged", "renders.json"), encoding="utf-8") as f:
+        assert [entry["index"] for entry in json.load(f).values()] == expected
+    with open(os.path.join(run_root, "merged", "nlp.json"), encoding="utf-8") as f:
+        assert [poem["title"] for poem in json.load(f)] == [corpus[i]["title"] for i in expected]
+    with open(os.path.join(run_root, "merged", "music_params.json"), encoding="utf-8") as f:
+        assert [entry["music_params"]["tempo"] for entry in json.load(f)] == expected
+
+def test_merge_shards_reports_unrendered_poems(tmp_path):
+    corpus = make_corpus(20)
+    write_shard(str(tmp_path), 0, 1, corpus[:15])
+    stats = merge_shards(str(tmp_path), 1, corpus=corpus)
+    assert stats["unrendered"] == [poem_content_hash(p) for p in corpus[15:]]
@@ -0,0 +1,72 @@
+import json
+import os
+from src.stage_scheduler import Stage, StageCache, run_stage_graph
+from src.pipeline import build_stage_graph, stage_settings
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "config.json")
+
+def load_config():
+    with open(CONFIG_PATH, "r") as f:
+        return json.load(f)
+
+def counting_graph(calls):
+    def double(x, factor):
+        calls.append(x)
+        return {"y": x * factor}
+    return [Stage("double", double, ["x", "factor"], ["y"])]
+
+def test_unchanged_inputs_are_skipped(tmp_path):
+    calls = []
+    cache = StageCache(str(tmp_path))
+    first = run_stage_graph(counting_graph(calls), {"x": 3, "factor": 2}, cache=cache)
+    second = run_stage_graph(counting_graph(calls), {"x": 3, "factor": 2}, cache=cache)
+    assert calls == [3]
+    assert second["values"]["y"] == first["values"]["y"] == 6
+    assert second["timings"]["double"]["skipped"]
+
+def test_changed_input_invalidates_the_entry(tmp_path):
+    calls = []
+    cache = StageCache(str(tmp_path))
+    run_stage_graph(counting_graph(calls), {"x": 3, "factor": 2}, cache=cache)
+    report = run_stage_graph(counting_graph(calls), {"x": 3, "factor": 5}, cache=cache)
+    assert calls == [3, 3]
+    assert report["values"]["y"] == 15
+    assert not report["timings"]["double"]["skipped"]
+
+def test_entries_persist_and_memory_is_bounded(tmp_path):
+    cache = StageCache(str(tmp_path), max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, {"value": key})
+    assert list(cache._entries) == ["b", "c"]
+    assert cache.get("a") == {"value": "a"}
+    assert len(cache._entries) == 2
+    assert StageCache(str(tmp_path)).get("c") == {"value": "c"}
+
+def test_sentiment_stage_reruns_when_its_settings_change(tmp_path):
+    config = load_config()
+    sentiment = next(s for s in build_stage_graph(config) if s.name == "sentiment")
+    assert "sentiment_settings" in sentiment.inputs
+    poem = {"title": "t", "author": "a", "lines": ["a rather nice day"]}
+    cache = StageCache(str(tmp_path))
+
+    def run(threshold):
+        config["nlp_analysis"]["sentiment_threshold"] = threshold
+        values = {"poem": poem, "sentiment_settings": stage_settings(config)["sentiment_settings"]}
+        return run_stage_graph([sentiment], values, cache=cache)
+
+    assert run(0.1)["values"]["sentiment"] == "Positive"
+    assert run(0.1)["timings"]["sentiment"]["skipped"]
+    report = run(0.9)
+    assert not report["timings"]["sentiment"]["skipped"]
+    assert report["values"]["sentiment"] == "Neutral"
+
+def test_disk_cache_evicts_least_recently_used_entries(tmp_path):
+    cache = StageCache(str(tmp_path), max_bytes=2500)
+    cache.put("a", {"value": b"a" * 1000})
+    cache.put("b", {"value": b"b" * 1000})
+    os.utime(tmp_path / "a.pkl", (1, 1))
+    os.utime(tmp_path / "b.pkl", (2, 2))
+    cache.get("a")  # a is now the most recently used
+    cache.put("c", {"value": b"c" * 1000})
+    assert sorted(os.listdir(tmp_path)) == ["a.pkl", "c.pkl"]
+    assert StageCache(str(tmp_path)).get("b") is None
@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pretty_midi
+import pytest
+from src.sample_renderer import write_wav_int16
+from src.stem_rendering import stem_key, render_stems, _read_wav_int16
+
+FRAME_RATE = 44100
+
+class StubSynth:
+    """Writes 100 frames of a constant 1000 per note; records the program of every render."""
+    def __init__(self, fail_programs=()):
+        self.rendered = []
+        self.fail_programs = set(fail_programs)
+
+    def midi_to_audio(self, midi_file, wav_file):
+        track = pretty_midi.PrettyMIDI(midi_file).instruments[0]
+        self.rendered.append(track.program)
+        if track.program in self.fail_programs:
+            raise OSError("synthesis failed")
+        write_wav_int16(wav_file, np.full((100 * len(track.notes), 2), 1000, dtype=np.int16), FRAME_RATE)
+
+def track(program, pitches, name=""):
+    instrument = pretty_midi.Instrument(program=program, name=name)
+    instrument.notes = [pretty_midi.Note(velocity=80, pitch=p, start=i * 0.5, end=i * 0.5 + 0.5)
+                        for i, p in enumerate(pitches)]
+    return instrument
+
+def melody(melody_pitches, chord_pitches=(48,)):
+    pm = pretty_midi.PrettyMIDI()
+    pm.instruments = [track(0, melody_pitches), track(0, chord_pitches, name="chords")]
+    return pm
+
+def make_config(tmp_path, gains=None):
+    return {"soundfont_path": "soundfont.sf2", "stem_cache_dir": str(tmp_path / "stems"),
+            "stem_workers": 2, "stem_gains": gains or {}}
+
+def test_stem_key_ignores_the_name_and_other_tracks():
+    piano = track(0, [60, 62])
+    assert stem_key(piano, "a.sf2", FRAME_RATE) == stem_key(track(0, [60, 62], name="piano"), "a.sf2", FRAME_RATE)
+    assert stem_key(piano, "a.sf2", FRAME_RATE) != stem_key(track(40, [60, 62]), "a.sf2", FRAME_RATE)
+    assert stem_key(piano, "a.sf2", FRAME_RATE) != stem_key(track(0, [60, 64]), "a.sf2", FRAME_RATE)
+    assert stem_key(piano, "a.sf2", FRAME_RATE) != stem_key(piano, "a.sf2", 22050)
+    assert stem_key(piano, "a.sf2", FRAME_RATE) != stem_key(piano, "b.sf2", FRAME_RATE)
+
+def test_changing_one_instrument_renders_only_its_stem(tmp_path):
+    config, fs = make_config(tmp_path), StubSynth()
+    pitches = [60, 62, 64, 65]
+    render_stems(config, melody(pitches), str(tmp_path / "a.wav"), instruments=["Violin", "Flute"], fs=fs)
+    assert sorted(fs.rendered) == sorted([40, 73, 0])
+    fs.rendered.clear()
+    render_stems(config, melody(pitches), str(tmp_path / "b.wav"), instruments=["Violin", "Cello"], fs=fs)
+    assert fs.rendered == [42]
+    fs.rendered.clear()
+    render_stems(config, melody(pitches), str(tmp_path / "c.wav"), instruments=["Violin", "Cello"], fs=fs)
+    assert fs.rendered == []
+
+def test_stems_are_mixed_with_their_gains(tmp_path):
+    config = make_config(tmp_path, gains={"chords": -20, "Violin": 0})
+    audio = render_stems(config, melody([60, 62]), str(tmp_path / "mix.wav"), instruments=["Violin"],
+                         fs=StubSynth())
+    mixed = _read_wav_int16(str(tmp_path / "mix.wav"))
+    assert mixed.shape == (200, 2)
+    assert np.all(mixed[:100] == 1100) and np.all(mixed[100:] == 1000)
+    assert audio.channels == 2 and audio.sample_width == 2 and len(audio.get_array_of_samples()) == 400
+
+def test_a_failed_stem_raises_so_the_caller_falls_back(tmp_path):
+    config = make_config(tmp_path)
+    with pytest.raises(RuntimeError, match="1 of 2 stems failed"):
+        render_stems(config, melody([60, 62]), str(tmp_path / "mix.wav"), instruments=["Cello"],
+                     fs=StubSynth(fail_programs={42}))
+    assert not os.path.exists(tmp_path / "mix.wav")
+    # The stem that did render is cached; nothing is left half-written
+    assert all(name.endswith(".wav") and "." not in name[:-4] for name in os.listdir(tmp_path / "stems"))
+
+def test_a_melody_without_notes_raises(tmp_path):
+    pm = pretty_midi.PrettyMIDI()
+    pm.instruments = [pretty_midi.Instrument(program=0)]
+    with pytest.raises(RuntimeError):
+        render_stems(make_config(tmp_path), pm, str(tmp_path / "mix.wav"), fs=StubSynth())
@@ -0,0 +1,28 @@
+import pytest
+from src.syllables import (word_syllables, line_syllables, syllable_report, get_syllable_settings,
+                           BASE_PAUSE_MS, MIN_PAUSE_MS)
+
+@pytest.mark.parametrize("word, count", [("poetry", 3), ("music", 2), ("the", 1), ("beautiful", 3), ("don't", 1)])
+def test_dictionary_words(word, count):
+    assert word_syllables(word) == count
+
+@pytest.mark.parametrize("word, count", [("blorptastic", 3), ("zzkrate", 1), ("'", 0)])
+def test_words_outside_the_dictionary_are_estimated(word, count):
+    assert word_syllables(word) == count
+
+def test_line_syllables_ignores_case_and_punctuation():
+    assert line_syllables("The Music, of Poetry!") == line_syllables("the music of poetry") == 7
+
+def test_pauses_pace_lines_toward_the_target():
+    report = syllable_report(["one two three four five six eight nine", "short line", "", "a " * 40],
+                             syllable_target=8, syllable_tolerance=2, seconds_per_syllable=0.2)
+    on_target, short, blank, long = report
+    assert on_target["delta"] == 0 and on_target["pause_ms"] == BASE_PAUSE_MS and not on_target["flagged"]
+    assert short["delta"] == -6 and short["pause_ms"] == BASE_PAUSE_MS + 1200 and short["flagged"]
+    assert not blank["flagged"]
+    assert long["syllables"] == 40 and long["pause_ms"] == MIN_PAUSE_MS and long["flagged"]
+
+def test_settings_fall_back_to_defaults():
+    settings = get_syllable_settings({"syllable_target": 10})
+    assert settings["syllable_target"] == 10
+    assert settings["syllable_tolerance"] == 2 and settings["seconds_per_syllable"] == 0.22
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from src.theme_classification import (build_theme_centroids, score_themes, classify_themes,
+                                      clear_centroid_cache, _CENTROID_CACHE)
+from src.nlp_analysis import classify_corpus_themes
+
+VOCABULARY = ["sea", "river", "tree", "heart", "kiss", "grave", "night"]
+
+THEMES = {
+    "Nature": ["sea", "river", "tree"],
+    "Love": ["heart", "kiss"],
+    "Death": ["grave"],
+    "Empty": []
+}
+
+class StubEmbedder:
+    """Embeds a text as the sum of one-hot vectors of its known words."""
+    def __init__(self):
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        vectors = np.zeros((len(texts), len(VOCABULARY)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                if word in VOCABULARY:
+                    vectors[row, VOCABULARY.index(word)] += 1.0
+        return vectors
+
+class StubKeyBERT:
+    def __init__(self):
+        self.model = StubEmbedder()
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_centroid_cache()
+    yield
+    clear_centroid_cache()
+
+def test_centroids_are_normalized_category_means():
+    labels, centroids = build_theme_centroids(StubKeyBERT(), THEMES)
+    assert labels == ["Nature", "Love", "Death"]
+    assert np.allclose(np.linalg.norm(centroids, axis=1), 1.0)
+    nature = np.zeros(len(VOCABULARY))
+    nature[:3] = 1 / np.sqrt(3)
+    assert np.allclose(centroids[0], nature)
+    assert np.allclose(centroids[2], np.eye(len(VOCABULARY))[VOCABULARY.index("grave")])
+
+def test_centroids_are_built_once_per_model_and_categories():
+    kw_model = StubKeyBERT()
+    _, first = build_theme_centroids(kw_model, THEMES)
+    assert build_theme_centroids(kw_model, THEMES)[1] is first
+    assert len(kw_model.model.calls) == 1
+    build_theme_centroids(kw_model, {**THEMES, "Death": ["grave", "night"]})
+    build_theme_centroids(kw_model, THEMES, model_name="other")
+    assert len(kw_model.model.calls) == 3 and len(_CENTROID_CACHE) == 3
+
+def test_categories_without_words_are_rejected():
+    with pytest.raises(ValueError):
+        build_theme_centroids(StubKeyBERT(), {"Empty": []})
+
+def test_confidences_are_a_softmax_over_similarities():
+    centroids = np.eye(3, dtype=np.float32)
+    embeddings = np.array([[1.0, 0.0, 0.0], [1.0, 1.0, 0.0]], dtype=np.float32)
+    similarities, confidences = score_themes(embeddings, centroids, temperature=0.5)
+    assert np.allclose(similarities[1], [np.sqrt(0.5), np.sqrt(0.5), 0.0])
+    assert np.allclose(confidences.sum(axis=1), 1.0)
+    expected = np.exp(similarities[0] / 0.5) / np.exp(similarities[0] / 0.5).sum()
+    assert np.allclose(confidences[0], expected)
+    assert confidences[1, 0] == pytest.approx(confidences[1, 1])
+    _, sharper = score_themes(embeddings, centroids, temperature=0.05)
+    assert sharper[0, 0] > confidences[0, 0]
+
+def test_classify_themes_picks_the_nearest_centroid_or_other():
+    themes, scores = classify_themes(StubKeyBERT(), ["the sea and the river", "a kiss", "night", "grave grave"],
+                                     THEMES, min_similarity=0.5)
+    assert themes == ["Nature", "Love", "Other", "Death"]
+    assert set(scores[0]) == {"Nature", "Love", "Death"}
+    assert max(scores[1], key=scores[1].get) == "Love"
+    assert classify_themes(StubKeyBERT(), [], THEMES) == ([], [])
+
+def test_classify_corpus_themes_embeds_the_corpus_in_one_batch():
+    kw_model = StubKeyBERT()
+    config = {"theme_categories": THEMES, "theme_source": "keywords", "theme_min_similarity": 0.5}
+    poems = [
+        {"lines": ["a grave at night"], "keywords": ["sea", "tree"]},
+        {"lines": ["my heart"], "keywords": []},
+        {"lines": ["nothing known here"]}
+    ]
+    classify_corpus_themes(config, poems, kw_model=kw_model)
+    assert [p["theme"] for p in poems] == ["Nature", "Love", "Other"]
+    assert all(sum(p["theme_confidence"].values()) == pytest.approx(1.0, abs=1e-3) for p in poems)
+    # One batch for the category words, one for every poem
+    assert len(kw_model.model.calls) == 2 and len(kw_model.model.calls[1]) == 3
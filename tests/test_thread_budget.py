@@ -0,0 +1,72 @@
+import json
+import os
+import stat
+import subprocess
+from contextlib import nullcontext
+import pytest
+from src import nlp_analysis, melody_generation, music_synthesis
+from src.thread_budget import (BudgetedFluidSynth, benchmark_thread_budget, candidate_splits,
+                               resolve_thread_budget, stage_threads)
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "config.json")
+
+POEMS = [
+    {"title": "Ode", "author": "Anon", "lines": ["the happy sea is bright", "a lovely light"]},
+    {"title": "Dirge", "author": "Anon", "lines": ["a sad and bitter night"]}
+]
+
+def load_config():
+    with open(CONFIG_PATH, "r") as f:
+        return json.load(f)
+
+@pytest.fixture
+def stub_models(monkeypatch):
+    """Replace the models, melody generation and FluidSynth rendering; gTTS and OpenAI are the load test's."""
+    rendered = []
+
+    def render_plan(config, title, timestamp, plan, recitation_audio, pm, **kwargs):
+        rendered.append((title, plan))
+        return recitation_audio, f"{title}_{timestamp}_{plan}.wav"
+
+    monkeypatch.setattr(nlp_analysis, "classify_emotion", lambda text, model, device: "Joy")
+    monkeypatch.setattr(nlp_analysis, "keyword_model", lambda name: nullcontext(None))
+    monkeypatch.setattr(nlp_analysis, "extract_keywords_and_theme",
+                        lambda text, kw_model, top_n, categories, options: (["sea"], "Nature", {"Nature": 1.0}))
+    monkeypatch.setattr(melody_generation, "generate_plan_a", lambda params, length: "pm_a")
+    monkeypatch.setattr(melody_generation, "generate_plan_b", lambda config, poem, length: "pm_b")
+    monkeypatch.setattr(music_synthesis, "render_plan", render_plan)
+    return rendered
+
+def test_resolve_thread_budget_shares_cores_and_applies_stage_overrides():
+    options = {"cpu_cores": 8, "pipelines_per_node": 2, "tensorflow_intra_op": 2,
+               "stages": {"plan_b": {"tensorflow_intra_op": 4}}}
+    threads = resolve_thread_budget(options)
+    assert threads["torch_intra_op"] == 4 and threads["tensorflow_intra_op"] == 2
+    assert threads["fluidsynth_cores"] == 1 and threads["torch_inter_op"] == 1
+    assert resolve_thread_budget(options, "plan_b")["tensorflow_intra_op"] == 4
+
+def test_candidate_splits_stay_within_each_pipelines_share():
+    splits = candidate_splits(8, pipelines_per_node=2)
+    assert len(splits) == 3 * 3 * 3
+    assert all(max(s["torch_intra_op"], s["tensorflow_intra_op"], s["fluidsynth_cores"]) <= 4 for s in splits)
+
+def test_benchmark_runs_a_split_end_to_end(stub_models):
+    config = load_config()
+    config["pipeline"]["framework_workers"]["enabled"] = True
+    split = candidate_splits(4)[-1]
+    result = benchmark_thread_budget(config, POEMS, cores=4, requests=2, splits=[split], isolate=False)
+    assert result["best"]["split"] == split
+    assert result["best"]["error_rate"] == 0.0
+    assert result["best"]["throughput_per_second"] > 0
+    # Both plans of both poems were rendered in this process, and the budget is restored afterwards
+    assert sorted(stub_models) == [("Dirge", "plana"), ("Dirge", "planb"), ("Ode", "plana"), ("Ode", "planb")]
+    assert stage_threads()["torch_intra_op"] == config["pipeline"]["thread_budget"]["torch_intra_op"]
+
+def test_failed_fluidsynth_render_raises(tmp_path, monkeypatch):
+    fake = tmp_path / "fluidsynth"
+    fake.write_text("#!/bin/sh\nexit 3\n")
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    fs = BudgetedFluidSynth("font.sf2", cpu_cores=2)
+    with pytest.raises(subprocess.CalledProcessError):
+        fs.midi_to_audio("in.mid", str(tmp_path / "out.wav"))